@@ -0,0 +1,190 @@
+"""
+Leveled, structured logging that writes through a background queue
+Callers only enqueue records; formatting and I/O (stdout, rotating file,
+launcher activity log) happen on a listener thread.
+"""
+import os
+import sys
+import atexit
+import queue
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_STDOUT = os.getenv("LOG_STDOUT", "true").lower() == "true"
+LOG_FILE = os.getenv("LOG_FILE", os.path.join("logs", "price_scanner.log"))  # Empty disables the file sink
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", 5 * 1024 * 1024))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", 5))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))  # Share of per-request debug lines kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+ROOT_LOGGER = "price_scanner"
+
+class KeyValueFormatter(logging.Formatter):
+    """`time LEVEL name: message key=value ...` (or just `message key=value ...`)"""
+
+    def __init__(self, full=True):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s" if full
+                         else "%(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Enqueues the raw record; drops it rather than block when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Skip QueueHandler's eager formatting; only exceptions must be rendered here,
+        # while the traceback still exists
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class ActivityLogHandler(logging.Handler):
+    """Forwards records to the launcher's ActivityLogger"""
+
+    LEVELS = {"DEBUG": "DEBUG", "INFO": "INFO", "WARNING": "WARNING", "ERROR": "ERROR", "CRITICAL": "ERROR"}
+
+    def __init__(self, activity_logger, level=logging.INFO):
+        super().__init__(level)
+        self.activity_logger = activity_logger
+        self.setFormatter(KeyValueFormatter(full=False))  # ActivityLogger adds its own timestamp
+
+    def emit(self, record):
+        try:
+            level = getattr(record, "activity_level", None) or self.LEVELS.get(record.levelname, "INFO")
+            self.activity_logger.add_activity(self.format(record), level)
+        except Exception:
+            self.handleError(record)
+
+class StructuredLogger:
+    """Thin wrapper: log.info("message", key=value, ...)"""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def _log(self, level, msg, fields, exc_info=False, extra=None):
+        if self._logger.isEnabledFor(level):
+            record_extra = {"fields": fields}
+            if extra:
+                record_extra.update(extra)
+            self._logger.log(level, msg, extra=record_extra, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def success(self, msg, **fields):
+        """INFO record shown as SUCCESS in the launcher's activity log"""
+        self._log(logging.INFO, msg, fields, extra={"activity_level": "SUCCESS"})
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+    def sample(self, msg, **fields):
+        """Per-request DEBUG line, kept for LOG_SAMPLE_RATE of calls"""
+        if self._logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+            self._log(logging.DEBUG, msg, fields)
+
+    def is_enabled(self, level=logging.DEBUG):
+        return self._logger.isEnabledFor(level)
+
+_listener = None
+_queue_handler = None
+_activity_handlers = []
+_setup_lock = threading.Lock()
+
+def configure_logging():
+    """Install the queue handler and start the listener thread (idempotent)"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        handlers = []
+        if LOG_STDOUT:
+            stdout_handler = logging.StreamHandler(sys.stdout)
+            stdout_handler.setFormatter(KeyValueFormatter())
+            handlers.append(stdout_handler)
+        if LOG_FILE:
+            try:
+                log_dir = os.path.dirname(LOG_FILE)
+                if log_dir:
+                    os.makedirs(log_dir, exist_ok=True)
+                file_handler = RotatingFileHandler(
+                    LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+                )
+                file_handler.setFormatter(KeyValueFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                print(f"⚠️ Log file disabled: {e}")
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = _NonBlockingQueueHandler(log_queue)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+def add_activity_sink(activity_logger, level=logging.INFO):
+    """Mirror log records into the launcher's ActivityLogger"""
+    configure_logging()
+    handler = ActivityLogHandler(activity_logger, level)
+    with _setup_lock:
+        _activity_handlers.append(handler)
+        _listener.handlers = _listener.handlers + (handler,)
+    return handler
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def get_logger(name):
+    configure_logging()
+    return StructuredLogger(name)
+
+def get_logging_stats():
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sample_rate": LOG_SAMPLE_RATE,
+    }
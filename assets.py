@@ -0,0 +1,124 @@
+"""
+Static asset serving and manifest-driven URLs
+build_assets.py writes hashed, minified, precompressed copies to static/dist
+plus a manifest; templates call asset() to reference them, and the /static
+mount serves the .br/.gz variants with immutable cache headers.
+"""
+import os
+import json
+import stat
+import time
+import mimetypes
+import threading
+import anyio
+from fastapi.staticfiles import StaticFiles
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+STATIC_DIR = "static"
+DIST_DIR = "dist"  # Under STATIC_DIR; everything in it has a content hash in its name
+MANIFEST_PATH = os.path.join(STATIC_DIR, DIST_DIR, "manifest.json")
+ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", 365 * 24 * 3600))  # Seconds, for hashed files
+
+# Third-party files vendored into static/vendor by `build_assets.py --vendor`.
+# Until they have been vendored, asset() points at the public CDN instead.
+VENDOR_LIBS = {
+    "vendor/html5-qrcode.min.js": "https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js",
+    "vendor/JsBarcode.all.min.js": "https://cdn.jsdelivr.net/npm/jsbarcode@3.11.5/dist/JsBarcode.all.min.js",
+    "vendor/qrcode.min.js": "https://cdn.jsdelivr.net/npm/qrcode@1.5.3/build/qrcode.min.js",
+    "vendor/font-awesome/all.min.css": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css",
+    "vendor/cairo/cairo.css": "https://fonts.googleapis.com/css2?family=Cairo:wght@300;400;600;700&display=swap",
+}
+
+# Precompressed variants, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+MANIFEST_CHECK_INTERVAL = 2.0  # Seconds between mtime checks, so a rebuild is picked up while running
+
+_manifest = None
+_manifest_mtime = None
+_manifest_checked_at = 0.0
+_manifest_lock = threading.Lock()
+
+def _mtime():
+    try:
+        return os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def load_manifest():
+    """logical path -> hashed path (relative to static/); empty when assets aren't built"""
+    global _manifest, _manifest_mtime, _manifest_checked_at
+    with _manifest_lock:
+        _manifest_mtime = _mtime()
+        _manifest_checked_at = time.monotonic()
+        try:
+            with open(MANIFEST_PATH, encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+        return _manifest
+
+def current_manifest():
+    """The manifest, reloaded when build_assets.py has rewritten it"""
+    global _manifest_checked_at
+    if _manifest is None:
+        return load_manifest()
+    if time.monotonic() - _manifest_checked_at >= MANIFEST_CHECK_INTERVAL:
+        _manifest_checked_at = time.monotonic()
+        if _mtime() != _manifest_mtime:
+            return load_manifest()
+    return _manifest
+
+def manifest_stamp():
+    """Changes whenever the manifest does; part of the cache key of anything rendered with asset()"""
+    current_manifest()
+    return _manifest_mtime
+
+def asset(path):
+    """URL for a static file: hashed build output when available, else the source file or its CDN"""
+    hashed = current_manifest().get(path)
+    if hashed:
+        return f"/static/{hashed}"
+    if path in VENDOR_LIBS and not os.path.exists(os.path.join(STATIC_DIR, path)):
+        return VENDOR_LIBS[path]
+    return f"/static/{path}"
+
+def _accepted_encodings(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"accept-encoding":
+            return {part.split(";")[0].strip() for part in value.decode("latin-1").split(",")}
+    return set()
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles that prefers precompressed variants and sets cache headers by path"""
+
+    async def get_response(self, path, scope):
+        response = None
+        if path.startswith(DIST_DIR + "/"):
+            accepted = _accepted_encodings(scope)
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    response = self.file_response(full_path, stat_result, scope)
+                    if response.status_code == 200:
+                        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                        if media_type.startswith("text/") or media_type.endswith("javascript"):
+                            media_type += "; charset=utf-8"
+                        response.headers["content-type"] = media_type
+                        response.headers["content-encoding"] = encoding
+                    break
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        if path.startswith(DIST_DIR + "/"):
+            response.headers["cache-control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+            response.headers["vary"] = "Accept-Encoding"
+        else:
+            # Unhashed files must be revalidated (ETag/Last-Modified make that cheap)
+            response.headers["cache-control"] = "no-cache"
+        return response
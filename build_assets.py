@@ -0,0 +1,225 @@
+"""
+Build production static assets
+Minifies and content-hashes everything under static/ into static/dist,
+writes gzip (and brotli, when the module is installed) variants next to
+each file, and a manifest.json that templates resolve through asset().
+
+Usage:
+    python build_assets.py            # Build static/dist from static/
+    python build_assets.py --vendor   # Download CDN libraries into static/vendor first
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import posixpath
+import urllib.request
+from urllib.parse import urljoin, urlparse
+from assets import STATIC_DIR, DIST_DIR, MANIFEST_PATH, VENDOR_LIBS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+COMPRESSIBLE = {".js", ".css", ".svg", ".json", ".ttf", ".otf", ".eot", ".html", ".txt"}
+MIN_COMPRESS_SIZE = 512  # Bytes; smaller files aren't worth a variant
+HASH_LENGTH = 10
+# Google Fonts picks the font format from the user agent; ask for woff2
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+# ==================== VENDORING ====================
+
+def download(url):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+def vendor_libraries():
+    """Fetch VENDOR_LIBS into static/, including fonts referenced by vendored CSS"""
+    for path, url in VENDOR_LIBS.items():
+        target = os.path.join(STATIC_DIR, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        data = download(url)
+
+        if path.endswith(".css"):
+            files_dir = os.path.join(os.path.dirname(target), "files")
+            os.makedirs(files_dir, exist_ok=True)
+            css = data.decode("utf-8")
+
+            def localise(match):
+                ref = match.group(2)
+                if ref.startswith("data:"):
+                    return match.group(0)
+                ref_url = urljoin(url, ref)
+                name = posixpath.basename(urlparse(ref_url).path)
+                local = os.path.join(files_dir, name)
+                if not os.path.exists(local):
+                    with open(local, "wb") as f:
+                        f.write(download(ref_url))
+                return f"url(files/{name})"
+
+            data = CSS_URL.sub(localise, css).encode("utf-8")
+
+        with open(target, "wb") as f:
+            f.write(data)
+        print(f"  vendored {path} ({len(data):,} bytes)")
+
+# ==================== MINIFY / HASH / COMPRESS ====================
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # Conservative fallback: comments and insignificant whitespace only
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+def minify_js(text):
+    # Without rjsmin the source is kept as is; a regex minifier can break template literals
+    return rjsmin.jsmin(text) if rjsmin is not None else text
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+def hashed_name(rel_path, data):
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+def rewrite_css_urls(css, rel_path, manifest):
+    """Point relative url() references at the hashed copies"""
+    base = posixpath.dirname(rel_path)
+    hashed_dir = posixpath.dirname(posixpath.join(DIST_DIR, rel_path))
+
+    def replace(match):
+        ref = match.group(2)
+        if ref.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+        clean = ref.split("?")[0].split("#")[0]
+        target = manifest.get(posixpath.normpath(posixpath.join(base, clean)))
+        if not target:
+            return match.group(0)
+        return f"url({posixpath.relpath(target, hashed_dir)})"
+
+    return CSS_URL.sub(replace, css)
+
+def write_variants(path, data, ext):
+    """Write path plus .gz/.br siblings; returns their sizes"""
+    with open(path, "wb") as f:
+        f.write(data)
+    sizes = {"gz": None, "br": None}
+    if ext not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+        return sizes
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        with open(path + ".gz", "wb") as f:
+            f.write(gz)
+        sizes["gz"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            with open(path + ".br", "wb") as f:
+                f.write(br)
+            sizes["br"] = len(br)
+    return sizes
+
+def source_files():
+    """Paths under static/ (posix, relative), CSS and JS last so their references resolve"""
+    files = []
+    for root, dirs, names in os.walk(STATIC_DIR):
+        rel_root = os.path.relpath(root, STATIC_DIR).replace(os.sep, "/")
+        if rel_root == DIST_DIR or rel_root.startswith(DIST_DIR + "/"):
+            dirs[:] = []
+            continue
+        for name in names:
+            files.append(posixpath.normpath(posixpath.join(rel_root, name)))
+    order = {".css": 1, ".js": 2}
+    return sorted(files, key=lambda rel: (order.get(posixpath.splitext(rel)[1], 0), rel))
+
+def missing_optional_modules():
+    """Build dependencies from requirements.txt that aren't installed, with what is lost without them"""
+    missing = []
+    if rjsmin is None:
+        missing.append(("rjsmin", "JavaScript is copied unminified"))
+    if rcssmin is None:
+        missing.append(("rcssmin", "CSS gets only basic whitespace minification"))
+    if brotli is None:
+        missing.append(("brotli", "no .br variants are written"))
+    return missing
+
+def build():
+    missing = missing_optional_modules()
+    for module, effect in missing:
+        print(f"WARNING: {module} is not installed: {effect} (pip install -r requirements.txt)", file=sys.stderr)
+
+    dist_root = os.path.join(STATIC_DIR, DIST_DIR)
+    shutil.rmtree(dist_root, ignore_errors=True)
+    manifest = {}
+    totals = {"source": 0, "output": 0, "gz": 0, "br": 0}
+
+    print(f"{'asset':<45} {'source':>10} {'min':>10} {'gzip':>10} {'brotli':>10}")
+    for rel in source_files():
+        with open(os.path.join(STATIC_DIR, rel), "rb") as f:
+            source = f.read()
+        ext = posixpath.splitext(rel)[1].lower()
+        data = source
+        if ext == ".css":
+            css = source.decode("utf-8")
+            if ".min." not in rel:
+                css = minify_css(css)
+            data = rewrite_css_urls(css, rel, manifest).encode("utf-8")
+        elif ext == ".js" and ".min." not in rel:
+            data = minify_js(source.decode("utf-8")).encode("utf-8")
+
+        hashed = posixpath.join(DIST_DIR, hashed_name(rel, data))
+        target = os.path.join(STATIC_DIR, *hashed.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        sizes = write_variants(target, data, ext)
+        manifest[rel] = hashed
+
+        totals["source"] += len(source)
+        totals["output"] += len(data)
+        totals["gz"] += sizes["gz"] or len(data)
+        totals["br"] += sizes["br"] or sizes["gz"] or len(data)
+        print(f"{rel:<45} {len(source):>10,} {len(data):>10,} {sizes['gz'] or '-':>10} {sizes['br'] or '-':>10}")
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"\n{len(manifest)} assets: {totals['source']:,} bytes -> {totals['output']:,} minified, "
+          f"{totals['gz']:,} gzip, {totals['br']:,} brotli")
+    if missing:
+        print(f"WARNING: built without {', '.join(module for module, _ in missing)}; see above", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed, precompressed static assets")
+    parser.add_argument("--vendor", action="store_true", help="Download CDN libraries into static/vendor first")
+    args = parser.parse_args()
+
+    if args.vendor:
+        print("Vendoring third-party libraries...")
+        try:
+            vendor_libraries()
+        except Exception as e:
+            print(f"Vendoring failed: {e}")
+            sys.exit(1)
+    build()
+
+if __name__ == "__main__":
+    main()
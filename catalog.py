@@ -0,0 +1,541 @@
+"""
+In-memory barcode catalog with incremental refresh
+Loads products and their latest stock once, then follows the stock table's id
+watermark (and the product rowversion, when configured) to stay current.
+Every change is stamped with the catalog version so handhelds can sync deltas.
+A snapshot file (catalog_snapshot.py) lets a restart serve lookups at once and
+catch up from its watermarks instead of reloading everything cold.
+"""
+import os
+import sys
+import time
+import uuid
+import threading
+from dotenv import load_dotenv
+import database
+from app_logging import get_logger
+from catalog_snapshot import (
+    open_snapshot, write_snapshot, CATALOG_SNAPSHOT_PATH, CATALOG_SNAPSHOT_INTERVAL
+)
+from database import (
+    db_connection, format_product,
+    PRODUCT_TABLE, BARCODE_COLUMN, NAME_COLUMN, PRICE_COLUMN, PRODUCT_ID_COLUMN,
+    STOCK_TABLE, STOCK_PRODUCT_ID_COLUMN, STOCK_QUANTITY_COLUMN, STOCK_ID_COLUMN
+)
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("catalog")
+
+# Catalog configuration
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "false").lower() == "true"
+CATALOG_PRICE_REFRESH = float(os.getenv("CATALOG_PRICE_REFRESH", 60))  # Seconds between product refreshes
+CATALOG_STOCK_REFRESH = float(os.getenv("CATALOG_STOCK_REFRESH", 5))  # Seconds between stock refreshes
+CATALOG_PRICE_MAX_AGE = float(os.getenv("CATALOG_PRICE_MAX_AGE", 300))  # Older price data falls back to SQL
+CATALOG_STOCK_MAX_AGE = float(os.getenv("CATALOG_STOCK_MAX_AGE", 30))  # Older stock data falls back to SQL
+CATALOG_FETCH_SIZE = int(os.getenv("CATALOG_FETCH_SIZE", 5000))
+
+# Optional rowversion/timestamp column on the product table. When set, price
+# refreshes only read changed rows; otherwise the product table is re-read.
+PRODUCT_ROWVERSION_COLUMN = os.getenv("PRODUCT_ROWVERSION_COLUMN", "")
+
+class ProductCatalog:
+    """Hash index of products by barcode plus latest stock by product id"""
+
+    def __init__(self, price_max_age=CATALOG_PRICE_MAX_AGE, stock_max_age=CATALOG_STOCK_MAX_AGE,
+                 rowversion_column=PRODUCT_ROWVERSION_COLUMN):
+        self.price_max_age = price_max_age
+        self.stock_max_age = stock_max_age
+        self.rowversion_column = rowversion_column
+
+        # barcode -> (product_id, name, price, barcode); product_id -> raw stock quantity
+        self._by_barcode = {}
+        self._stock = {}
+        self._lock = threading.Lock()  # Serialises refreshes, lookups never take it
+
+        self.loaded = False
+        self.stock_watermark = None
+        self.product_watermark = None
+        self.version = 0  # Bumped whenever a refresh changes something
+        self.base_version = 0  # Version of the last full load; older deltas need a full export
+        self.epoch = None  # New id per full load; versions from another epoch (e.g. before a restart) mean nothing here
+        self._changed_at = {}  # barcode -> version it last changed in
+        self._removed_at = {}  # barcode -> version it disappeared in
+        self._barcodes_by_id = {}  # product_id -> barcodes, to map stock rows to barcodes
+        self._price_refreshed_at = None
+        self._stock_refreshed_at = None
+        self._last_refresh_ms = {"products": None, "stock": None}
+        self._last_error = None
+        self._memory_bytes = 0
+
+        # Memory-mapped snapshot answering lookups until the first load; see attach_snapshot()
+        self._snapshot = None
+        self.restored_from_snapshot = False
+        self._snapshot_version = None  # Catalog version last written to disk
+        self._snapshot_saved_at = None
+        self._snapshot_save_ms = None
+
+        # Lookup counters
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.snapshot_hits = 0
+
+    # ---------- Lookups ----------
+
+    def get(self, barcode):
+        """Product payload for a barcode, or None when unknown or too stale to trust"""
+        if not self.is_fresh():
+            snapshot = self._snapshot
+            if snapshot is not None:
+                # Warm start: last run's data until the catalog has been rebuilt (None once it is closing)
+                product = snapshot.get(barcode)
+                if product is not None:
+                    self.snapshot_hits += 1
+                    return product
+            self.stale += 1
+            return None
+        entry = self._by_barcode.get(barcode)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        product_id, name, price, product_barcode = entry
+        return format_product(name, price, product_barcode, self._stock.get(product_id), barcode)
+
+    def is_fresh(self):
+        # A restored snapshot isn't fresh until the first refreshes have reconciled it with the database
+        if not self.loaded or self._price_refreshed_at is None or self._stock_refreshed_at is None:
+            return False
+        now = time.monotonic()
+        return (now - self._price_refreshed_at <= self.price_max_age
+                and now - self._stock_refreshed_at <= self.stock_max_age)
+
+    # ---------- Refresh ----------
+
+    def load(self):
+        """Full load of products and latest stock"""
+        with self._lock:
+            with db_connection() as conn:
+                self._load_products(conn)
+                self._load_stock(conn)
+            self.loaded = True
+            self.version += 1
+            self.base_version = self.version
+            self.epoch = uuid.uuid4().hex[:16]
+            self._changed_at = dict.fromkeys(self._by_barcode, self.version)
+            self._removed_at = {}
+            database.invalidate_not_found()
+            self._memory_bytes = self._estimate_memory()
+            self._last_error = None
+
+    def attach_snapshot(self, snapshot):
+        """Serve lookups from a memory-mapped snapshot until load_snapshot() or load() runs"""
+        self._snapshot = snapshot
+
+    def has_snapshot(self):
+        return self._snapshot is not None
+
+    def load_snapshot(self):
+        """Rebuild the index from the attached snapshot; refreshes then reconcile it with the database"""
+        with self._lock:
+            snapshot = self._snapshot
+            try:
+                by_barcode = {}
+                stock = {}
+                for key, product_id, name, price, raw_barcode, raw_stock in snapshot.rows():
+                    by_barcode[key] = (product_id, name, price, raw_barcode)
+                    if raw_stock is not None:
+                        stock[product_id] = raw_stock
+            except Exception:
+                self._snapshot = None
+                snapshot.close()
+                raise
+
+            self._by_barcode = by_barcode
+            self._barcodes_by_id = self._index_ids(by_barcode)
+            self._stock = stock
+            self.stock_watermark = snapshot.stock_watermark
+            self.product_watermark = snapshot.product_watermark
+            # Possibly days old: lookups go to the database until the refreshes catch up
+            self._price_refreshed_at = None
+            self._stock_refreshed_at = None
+            self.loaded = True
+            self.restored_from_snapshot = True
+            self.version += 1
+            self.base_version = self.version
+            self.epoch = uuid.uuid4().hex[:16]
+            self._changed_at = dict.fromkeys(by_barcode, self.version)
+            self._removed_at = {}
+            self._snapshot_version = self.version
+            # Unmap only after the index is live; the file is rewritten later, which Windows refuses while mapped
+            self._snapshot = None
+            snapshot.close()
+            database.invalidate_not_found()
+            self._memory_bytes = self._estimate_memory()
+            self._last_error = None
+
+    def save_snapshot(self, path=CATALOG_SNAPSHOT_PATH):
+        """Write the current catalog to disk if it changed since the last write"""
+        with self._lock:
+            if not path or not self.loaded or self._snapshot_version == self.version:
+                return False
+            started = time.monotonic()
+            rows = (
+                (key, product_id, name, price, raw_barcode, self._stock.get(product_id))
+                for key, (product_id, name, price, raw_barcode) in self._by_barcode.items()
+            )
+            count, size = write_snapshot(path, rows, self.stock_watermark, self.product_watermark)
+            self._snapshot_version = self.version
+            self._snapshot_saved_at = time.monotonic()
+            self._snapshot_save_ms = round((self._snapshot_saved_at - started) * 1000, 1)
+        log.info("Catalog snapshot written", path=path, products=count, mb=round(size / (1024 * 1024), 1),
+                 ms=self._snapshot_save_ms)
+        return True
+
+    def refresh_products(self):
+        """Pick up price/name changes (incremental when a rowversion column is configured)"""
+        with self._lock:
+            with db_connection() as conn:
+                if self.rowversion_column and self.product_watermark is not None:
+                    changed = self._apply_product_changes(conn)
+                else:
+                    changed = self._load_products(conn)
+            if changed:
+                self._bump(*changed)
+                self._memory_bytes = self._estimate_memory()
+                # New or re-barcoded products may answer codes cached as unknown
+                database.invalidate_not_found()
+            return changed
+
+    def refresh_stock(self):
+        """Apply stock rows appended since the last watermark"""
+        with self._lock:
+            started = time.monotonic()
+            query = f"""
+            SELECT {STOCK_ID_COLUMN}, {STOCK_PRODUCT_ID_COLUMN}, {STOCK_QUANTITY_COLUMN}
+            FROM {STOCK_TABLE}
+            WHERE {STOCK_ID_COLUMN} > ?
+            ORDER BY {STOCK_ID_COLUMN}
+            """
+            changed = 0
+            changed_barcodes = set()
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (self.stock_watermark or 0,))
+                while True:
+                    rows = cursor.fetchmany(CATALOG_FETCH_SIZE)
+                    if not rows:
+                        break
+                    for stock_id, product_id, qty in rows:
+                        if self._stock.get(product_id) != qty:
+                            changed_barcodes.update(self._barcodes_by_id.get(product_id, ()))
+                        self._stock[product_id] = qty
+                    self.stock_watermark = rows[-1][0]
+                    changed += len(rows)
+                cursor.close()
+            self._stock_refreshed_at = time.monotonic()
+            self._last_refresh_ms["stock"] = round((self._stock_refreshed_at - started) * 1000, 1)
+            if changed_barcodes:
+                self._bump(changed_barcodes, ())
+            return changed
+
+    def _load_products(self, conn):
+        started = time.monotonic()
+        rv_select = f", {self.rowversion_column}" if self.rowversion_column else ""
+        query = f"""
+        SELECT {PRODUCT_ID_COLUMN}, {NAME_COLUMN}, {PRICE_COLUMN}, {BARCODE_COLUMN}{rv_select}
+        FROM {PRODUCT_TABLE}
+        WHERE {BARCODE_COLUMN} IS NOT NULL
+        """
+        by_barcode = {}
+        watermark = None
+        cursor = conn.cursor()
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(CATALOG_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                by_barcode[str(row[3]).strip()] = (row[0], row[1], row[2], row[3])
+                if rv_select and (watermark is None or row[4] > watermark):
+                    watermark = row[4]
+        cursor.close()
+
+        old = self._by_barcode
+        changed = {key for key, entry in by_barcode.items() if old.get(key) != entry}
+        removed = {key for key in old if key not in by_barcode}
+        self._by_barcode = by_barcode  # Swap in one step so readers never see a half-built index
+        self._barcodes_by_id = self._index_ids(by_barcode)
+        self.product_watermark = watermark
+        self._price_refreshed_at = time.monotonic()
+        self._last_refresh_ms["products"] = round((self._price_refreshed_at - started) * 1000, 1)
+        return (changed, removed) if changed or removed else None
+
+    def _apply_product_changes(self, conn):
+        started = time.monotonic()
+        query = f"""
+        SELECT {PRODUCT_ID_COLUMN}, {NAME_COLUMN}, {PRICE_COLUMN}, {BARCODE_COLUMN}, {self.rowversion_column}
+        FROM {PRODUCT_TABLE}
+        WHERE {self.rowversion_column} > ?
+        ORDER BY {self.rowversion_column}
+        """
+        cursor = conn.cursor()
+        cursor.execute(query, (self.product_watermark,))
+        rows = cursor.fetchall()
+        cursor.close()
+
+        changed = set()
+        stale_keys = set()
+        if rows:
+            changed_ids = {row[0] for row in rows}
+            # A product whose barcode changed must drop its old index entry
+            stale_keys = {key for key, entry in self._by_barcode.items() if entry[0] in changed_ids}
+            for key in stale_keys:
+                self._by_barcode.pop(key, None)
+            for row in rows:
+                if row[3] is not None:
+                    key = str(row[3]).strip()
+                    self._by_barcode[key] = (row[0], row[1], row[2], row[3])
+                    changed.add(key)
+            for product_id in changed_ids:
+                self._barcodes_by_id.pop(product_id, None)
+            for key in changed:
+                self._barcodes_by_id.setdefault(self._by_barcode[key][0], []).append(key)
+            self.product_watermark = rows[-1][4]
+        self._price_refreshed_at = time.monotonic()
+        self._last_refresh_ms["products"] = round((self._price_refreshed_at - started) * 1000, 1)
+        return (changed, stale_keys - changed) if rows else None
+
+    @staticmethod
+    def _index_ids(by_barcode):
+        barcodes_by_id = {}
+        for key, entry in by_barcode.items():
+            barcodes_by_id.setdefault(entry[0], []).append(key)
+        return barcodes_by_id
+
+    def _bump(self, changed, removed):
+        """Start a new version and stamp the barcodes it touched"""
+        self.version += 1
+        for key in changed:
+            self._changed_at[key] = self.version
+            self._removed_at.pop(key, None)
+        for key in removed:
+            self._changed_at.pop(key, None)
+            self._removed_at[key] = self.version
+
+    # ---------- Offline export ----------
+
+    def export(self, since=None, epoch=None):
+        """
+        Catalog rows for handhelds: everything, or only what changed after version `since` of `epoch`
+        Returns {"epoch", "version", "full", "products": [[barcode, name, price, stock_qty], ...], "removed": [...]}
+        """
+        with self._lock:
+            full = (since is None or epoch != self.epoch
+                    or since < self.base_version or since > self.version)
+            if full:
+                keys = list(self._by_barcode)
+                removed = []
+            else:
+                keys = [key for key, version in self._changed_at.items() if version > since]
+                removed = [key for key, version in self._removed_at.items() if version > since]
+
+            products = []
+            for key in keys:
+                product_id, name, price, product_barcode = self._by_barcode[key]
+                product = format_product(name, price, product_barcode, self._stock.get(product_id), key)
+                products.append([key, product["product_name"], product["price"], product["stock_qty"]])
+            return {"epoch": self.epoch, "version": self.version, "full": full, "products": products,
+                    "removed": removed}
+
+    def _load_stock(self, conn):
+        started = time.monotonic()
+        cursor = conn.cursor()
+        # Fix the watermark first so rows appended during the load are picked up incrementally
+        cursor.execute(f"SELECT MAX({STOCK_ID_COLUMN}) FROM {STOCK_TABLE}")
+        watermark = cursor.fetchone()[0] or 0
+        query = f"""
+        SELECT s.{STOCK_PRODUCT_ID_COLUMN}, s.{STOCK_QUANTITY_COLUMN}
+        FROM {STOCK_TABLE} s
+        JOIN (
+            SELECT {STOCK_PRODUCT_ID_COLUMN} AS product_id, MAX({STOCK_ID_COLUMN}) AS max_id
+            FROM {STOCK_TABLE}
+            WHERE {STOCK_ID_COLUMN} <= ?
+            GROUP BY {STOCK_PRODUCT_ID_COLUMN}
+        ) latest ON s.{STOCK_ID_COLUMN} = latest.max_id
+        """
+        stock = {}
+        cursor.execute(query, (watermark,))
+        while True:
+            rows = cursor.fetchmany(CATALOG_FETCH_SIZE)
+            if not rows:
+                break
+            for product_id, qty in rows:
+                stock[product_id] = qty
+        cursor.close()
+
+        self._stock = stock
+        self.stock_watermark = watermark
+        self._stock_refreshed_at = time.monotonic()
+        self._last_refresh_ms["stock"] = round((self._stock_refreshed_at - started) * 1000, 1)
+
+    # ---------- Stats ----------
+
+    def _estimate_memory(self, sample_size=1000):
+        """Approximate bytes held by the index (containers plus sampled entries)"""
+        def sampled(mapping, entry_size):
+            if not mapping:
+                return sys.getsizeof(mapping)
+            sample = [item for _, item in zip(range(sample_size), mapping.items())]
+            per_entry = sum(entry_size(k, v) for k, v in sample) / len(sample)
+            return sys.getsizeof(mapping) + int(per_entry * len(mapping))
+
+        def product_size(key, entry):
+            return sys.getsizeof(key) + sys.getsizeof(entry) + sum(sys.getsizeof(v) for v in entry)
+
+        def stock_size(key, qty):
+            return sys.getsizeof(key) + sys.getsizeof(qty)
+
+        return sampled(self._by_barcode, product_size) + sampled(self._stock, stock_size)
+
+    def record_error(self, error):
+        self._last_error = str(error)
+
+    def stats(self):
+        """Row counts, refresh lag, memory footprint and hit counters"""
+        now = time.monotonic()
+
+        def lag(refreshed_at):
+            return round(now - refreshed_at, 1) if refreshed_at is not None else None
+
+        return {
+            "loaded": self.loaded,
+            "fresh": self.is_fresh(),
+            "rows": len(self._by_barcode),
+            "stock_rows": len(self._stock),
+            "version": self.version,
+            "epoch": self.epoch,
+            "stock_watermark": self.stock_watermark,
+            "price_lag_s": lag(self._price_refreshed_at),
+            "stock_lag_s": lag(self._stock_refreshed_at),
+            "price_max_age_s": self.price_max_age,
+            "stock_max_age_s": self.stock_max_age,
+            "last_refresh_ms": dict(self._last_refresh_ms),
+            "memory_mb": round(self._memory_bytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "snapshot": {
+                "serving": self._snapshot is not None,
+                "restored": self.restored_from_snapshot,
+                "hits": self.snapshot_hits,
+                "saved_age_s": lag(self._snapshot_saved_at),
+                "last_save_ms": self._snapshot_save_ms,
+            },
+            "last_error": self._last_error,
+        }
+
+class CatalogRefresher:
+    """Background thread that loads the catalog and keeps it fresh"""
+
+    def __init__(self, catalog, price_interval=CATALOG_PRICE_REFRESH, stock_interval=CATALOG_STOCK_REFRESH,
+                 snapshot_interval=CATALOG_SNAPSHOT_INTERVAL):
+        self.catalog = catalog
+        self.price_interval = price_interval
+        self.stock_interval = stock_interval
+        self.snapshot_interval = snapshot_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        next_price = next_stock = next_snapshot = 0.0
+        reconciling = False
+        stock_rows = None
+        while not self._stop.is_set():
+            try:
+                if not self.catalog.loaded and self.catalog.has_snapshot():
+                    started = time.monotonic()
+                    self.catalog.load_snapshot()
+                    log.success("Catalog restored from snapshot", products=self.catalog.stats()["rows"],
+                                seconds=round(time.monotonic() - started, 1))
+                    # Catch up with the database straight away
+                    next_price = next_stock = 0.0
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+                    reconciling = True
+                elif not self.catalog.loaded:
+                    started = time.monotonic()
+                    self.catalog.load()
+                    stats = self.catalog.stats()
+                    log.success("Catalog loaded", products=stats["rows"],
+                                seconds=round(time.monotonic() - started, 1), memory_mb=stats["memory_mb"])
+                    next_price = time.monotonic() + self.price_interval
+                    next_stock = time.monotonic() + self.stock_interval
+                    next_snapshot = 0.0
+                now = time.monotonic()
+                if now >= next_stock:
+                    stock_rows = self.catalog.refresh_stock()
+                    next_stock = now + self.stock_interval
+                if now >= next_price:
+                    changed = self.catalog.refresh_products()
+                    next_price = now + self.price_interval
+                    if reconciling:
+                        reconciling = False
+                        changed, removed = changed or ((), ())
+                        log.info("Catalog snapshot reconciled with database", stock_rows=stock_rows,
+                                 products_changed=len(changed), products_removed=len(removed))
+                if now >= next_snapshot:
+                    self.catalog.save_snapshot()
+                    next_snapshot = now + self.snapshot_interval
+            except Exception as e:
+                self.catalog.record_error(e)
+                log.error("Catalog refresh failed", error=str(e))
+            wait = max(0.1, min(next_stock, next_price) - time.monotonic()) if self.catalog.loaded else self.stock_interval
+            self._stop.wait(wait)
+
+_catalog = None
+_refresher = None
+
+def start_catalog():
+    """Create the catalog, register it with database.py and start refreshing"""
+    global _catalog, _refresher
+    if _catalog is None:
+        _catalog = ProductCatalog()
+        snapshot = open_snapshot()
+        if snapshot is not None:
+            _catalog.attach_snapshot(snapshot)
+        _refresher = CatalogRefresher(_catalog)
+        database.set_catalog(_catalog)
+        _refresher.start()
+    return _catalog
+
+def stop_catalog():
+    global _catalog, _refresher
+    if _refresher is not None:
+        _refresher.stop()
+    if _catalog is not None:
+        try:
+            _catalog.save_snapshot()
+        except Exception as e:
+            log.warning("Could not write catalog snapshot", error=str(e))
+    database.set_catalog(None)
+    _catalog = None
+    _refresher = None
+
+def get_catalog():
+    return _catalog
+
+def get_catalog_stats():
+    """Catalog stats, or None when catalog mode is off"""
+    return _catalog.stats() if _catalog is not None else None
@@ -0,0 +1,278 @@
+"""
+On-disk catalog snapshot for warm starts
+One file: a fixed prefix (magic, format version, CRC-32), JSON metadata, a
+sorted array of 64-bit barcode hashes with a parallel array of record
+offsets, then the packed records. At startup the file is memory-mapped and
+answers lookups by binary search while the catalog is rebuilt from it and
+reconciled with the database in the background.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import array
+import struct
+import bisect
+import hashlib
+import threading
+from decimal import Decimal
+from dotenv import load_dotenv
+from app_logging import get_logger
+from database import (
+    format_product,
+    PRODUCT_TABLE, BARCODE_COLUMN, NAME_COLUMN, PRICE_COLUMN, PRODUCT_ID_COLUMN,
+    STOCK_TABLE, STOCK_PRODUCT_ID_COLUMN, STOCK_QUANTITY_COLUMN, STOCK_ID_COLUMN
+)
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("catalog_snapshot")
+
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.join("data", "catalog.snapshot"))  # Empty = off
+CATALOG_SNAPSHOT_INTERVAL = float(os.getenv("CATALOG_SNAPSHOT_INTERVAL", 900))  # Seconds between rewrites
+CATALOG_SNAPSHOT_MAX_AGE = float(os.getenv("CATALOG_SNAPSHOT_MAX_AGE", 3 * 24 * 3600))  # Older files are ignored; 0 = no limit
+
+MAGIC = b"PSCATSNP"
+FORMAT_VERSION = 2
+PREFIX = struct.Struct("<8sHHII")  # magic, format version, reserved, metadata length, CRC-32 of everything after
+RECORD = struct.Struct("<qHHHHH")  # product id, then key/barcode/name/price/stock byte lengths
+ALIGN = 8
+
+class SnapshotError(Exception):
+    """Snapshot missing, corrupt, too old, or written for another format or schema"""
+
+def schema_fingerprint():
+    """Changes whenever the configured tables/columns do, so a file from another setup is rejected"""
+    columns = (PRODUCT_TABLE, BARCODE_COLUMN, NAME_COLUMN, PRICE_COLUMN, PRODUCT_ID_COLUMN,
+               STOCK_TABLE, STOCK_PRODUCT_ID_COLUMN, STOCK_QUANTITY_COLUMN, STOCK_ID_COLUMN)
+    return hashlib.sha1("|".join(columns).encode("utf-8")).hexdigest()[:16]
+
+def barcode_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _encode_watermark(value):
+    # A SQL Server rowversion arrives as bytes
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": bytes(value).hex()}
+    return value
+
+def _decode_watermark(value):
+    if isinstance(value, dict):
+        return bytes.fromhex(value["bytes"])
+    return value
+
+# Prices and quantities are stored as tagged text so they come back as the exact value and
+# type the database returned (Decimal money stays Decimal); empty means NULL
+_NUMBER_TYPES = {"d": Decimal, "f": float, "i": int}
+
+def _encode_number(value):
+    if value is None:
+        return b""
+    if isinstance(value, Decimal):
+        return b"d" + str(value).encode("ascii")
+    if isinstance(value, int):
+        return b"i" + str(value).encode("ascii")
+    return b"f" + repr(float(value)).encode("ascii")
+
+def _decode_number(data):
+    if not data:
+        return None
+    text = bytes(data).decode("ascii")
+    return _NUMBER_TYPES[text[0]](text[1:])
+
+def write_snapshot(path, rows, stock_watermark, product_watermark):
+    """
+    Write rows of (key, product_id, name, price, raw_barcode, raw_stock) atomically
+    Returns (row count, bytes written).
+    """
+    records = bytearray()
+    index = []
+    for key, product_id, name, price, raw_barcode, raw_stock in rows:
+        key_bytes = key.encode("utf-8")
+        barcode_bytes = str(raw_barcode).encode("utf-8")
+        name_bytes = (name or "").encode("utf-8")
+        price_bytes = _encode_number(price)
+        stock_bytes = _encode_number(raw_stock)
+        index.append((barcode_hash(key), len(records)))
+        records += RECORD.pack(int(product_id), len(key_bytes), len(barcode_bytes), len(name_bytes),
+                               len(price_bytes), len(stock_bytes))
+        records += key_bytes + barcode_bytes + name_bytes + price_bytes + stock_bytes
+    index.sort()
+    hashes = array.array("Q", (h for h, _ in index)).tobytes()
+    offsets = array.array("Q", (offset for _, offset in index)).tobytes()
+
+    # Offsets in the metadata are relative to the start of the data section (after the metadata)
+    meta = {
+        "schema": schema_fingerprint(),
+        "byteorder": sys.byteorder,
+        "created_at": time.time(),
+        "count": len(index),
+        "stock_watermark": _encode_watermark(stock_watermark),
+        "product_watermark": _encode_watermark(product_watermark),
+        "hashes_at": 0,
+        "offsets_at": len(hashes),
+        "records_at": len(hashes) + len(offsets),
+    }
+    meta_bytes = json.dumps(meta).encode("utf-8")
+    meta_bytes += b" " * (-(PREFIX.size + len(meta_bytes)) % ALIGN)
+    body = [meta_bytes, hashes, offsets, bytes(records)]
+    checksum = 0
+    for part in body:
+        checksum = zlib.crc32(part, checksum)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, 0, len(meta_bytes), checksum))
+        for part in body:
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(index), os.path.getsize(path)
+
+class CatalogSnapshot:
+    """Read-only, memory-mapped view of a snapshot file"""
+
+    def __init__(self, path, max_age=CATALOG_SNAPSHOT_MAX_AGE):
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._views = []
+        self._state_lock = threading.Lock()
+        self._readers = 0  # get() calls in flight; close() waits for them to finish
+        self._closing = False
+        try:
+            self._open(max_age)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, max_age):
+        try:
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Cannot open snapshot: {e}")
+        if len(self._mmap) < PREFIX.size:
+            raise SnapshotError("Snapshot truncated")
+
+        magic, version, _, meta_length, checksum = PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise SnapshotError("Not a catalog snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Snapshot format {version}, expected {FORMAT_VERSION}")
+        view = memoryview(self._mmap)
+        self._views.append(view)
+        if zlib.crc32(view[PREFIX.size:]) != checksum:
+            raise SnapshotError("Snapshot checksum mismatch")
+
+        meta = json.loads(bytes(view[PREFIX.size:PREFIX.size + meta_length]))
+        if meta["schema"] != schema_fingerprint() or meta["byteorder"] != sys.byteorder:
+            raise SnapshotError("Snapshot written for a different schema configuration")
+        self.created_at = meta["created_at"]
+        if max_age and time.time() - self.created_at > max_age:
+            raise SnapshotError(f"Snapshot older than {max_age:.0f}s")
+
+        self.count = meta["count"]
+        self.stock_watermark = _decode_watermark(meta["stock_watermark"])
+        self.product_watermark = _decode_watermark(meta["product_watermark"])
+        data = PREFIX.size + meta_length
+        index_size = self.count * 8
+        self._hashes = view[data + meta["hashes_at"]:data + meta["hashes_at"] + index_size].cast("Q")
+        self._offsets = view[data + meta["offsets_at"]:data + meta["offsets_at"] + index_size].cast("Q")
+        self._views += [self._hashes, self._offsets]
+        self._records_at = data + meta["records_at"]
+
+    def _record(self, offset):
+        """((key, product_id, name, price, raw_barcode, raw_stock), next offset) for a record offset"""
+        position = self._records_at + offset
+        product_id, key_length, barcode_length, name_length, price_length, stock_length = \
+            RECORD.unpack_from(self._mmap, position)
+        position += RECORD.size
+        key = self._mmap[position:position + key_length].decode("utf-8")
+        position += key_length
+        raw_barcode = self._mmap[position:position + barcode_length].decode("utf-8")
+        position += barcode_length
+        name = self._mmap[position:position + name_length].decode("utf-8")
+        position += name_length
+        price = _decode_number(self._mmap[position:position + price_length])
+        position += price_length
+        raw_stock = _decode_number(self._mmap[position:position + stock_length])
+        row = (key, product_id, name, price, raw_barcode, raw_stock)
+        return row, offset + RECORD.size + key_length + barcode_length + name_length + price_length + stock_length
+
+    def get(self, barcode):
+        """Product payload for a barcode, or None if the snapshot doesn't have it (or is closing)"""
+        with self._state_lock:
+            if self._closing:
+                return None
+            self._readers += 1
+        try:
+            target = barcode_hash(barcode)
+            index = bisect.bisect_left(self._hashes, target)
+            while index < self.count and self._hashes[index] == target:
+                (key, _, name, price, raw_barcode, raw_stock), _ = self._record(self._offsets[index])
+                if key == barcode:
+                    return format_product(name, price, raw_barcode, raw_stock, barcode)
+                index += 1
+            return None
+        finally:
+            with self._state_lock:
+                self._readers -= 1
+                release = self._closing and self._readers == 0
+            if release:
+                self._release()
+
+    def rows(self):
+        """Every record, read sequentially"""
+        offset = 0
+        for _ in range(self.count):
+            row, offset = self._record(offset)
+            yield row
+
+    def close(self):
+        """Unmap the file; deferred until in-flight get() calls have finished"""
+        with self._state_lock:
+            self._closing = True
+            release = self._readers == 0
+        if release:
+            self._release()
+
+    def _release(self):
+        with self._state_lock:
+            views, self._views = self._views, []
+            mapped, self._mmap = self._mmap, None
+            file, self._file = self._file, None
+        # Exported buffers must be released before the map can close
+        for view in reversed(views):
+            view.release()
+        if mapped is not None:
+            mapped.close()
+        if file is not None:
+            file.close()
+
+def open_snapshot(path=CATALOG_SNAPSHOT_PATH):
+    """CatalogSnapshot for path, or None when disabled, missing or unusable"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        started = time.monotonic()
+        snapshot = CatalogSnapshot(path)
+        log.info("Catalog snapshot opened", path=path, products=snapshot.count,
+                 age_h=round((time.time() - snapshot.created_at) / 3600, 1),
+                 ms=round((time.monotonic() - started) * 1000, 1))
+        return snapshot
+    except (SnapshotError, struct.error, ValueError, OSError) as e:
+        # Truncated or corrupt: it's only a cache, so drop it and start cold (rewritten after the load)
+        log.warning("Ignoring catalog snapshot", path=path, reason=f"{type(e).__name__}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
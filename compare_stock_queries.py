@@ -0,0 +1,100 @@
+"""
+Compare latest-stock query strategies against the configured database
+
+Usage:
+    python compare_stock_queries.py                     # 20 sampled barcodes, 5 rounds each
+    python compare_stock_queries.py --sample 50 --rounds 10
+    python compare_stock_queries.py --barcodes 6281000001 6281000002
+    python compare_stock_queries.py --strategies outer_apply row_number
+
+Set STOCK_QUERY_STRATEGY in .env to the winner.
+"""
+import sys
+import time
+import argparse
+import statistics
+from database import (
+    get_db_connection, get_backend, sample_barcodes, build_product_query, format_product,
+    STOCK_QUERY_STRATEGIES, STOCK_QUERY_STRATEGY, BARCODE_COLUMN
+)
+
+def run_strategy(conn, strategy, barcodes, rounds):
+    """Time one strategy over every barcode; returns timings (ms), rows found and results"""
+    query = build_product_query(f"p.{BARCODE_COLUMN} = ?", strategy)
+    cursor = conn.cursor()
+
+    # Warm-up pass so plan compilation doesn't count against the strategy
+    cursor.execute(query, (barcodes[0],))
+    cursor.fetchall()
+
+    timings = []
+    results = {}
+    for _ in range(rounds):
+        for barcode in barcodes:
+            started = time.perf_counter()
+            cursor.execute(query, (barcode,))
+            row = cursor.fetchone()
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+            results[barcode] = format_product(row[0], row[1], row[2], row[4], barcode) if row else None
+    cursor.close()
+    return timings, results
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latest-stock query strategies")
+    parser.add_argument("--barcodes", nargs="+", help="Barcodes to look up (default: random sample)")
+    parser.add_argument("--sample", type=int, default=20, help="Number of random barcodes to sample")
+    parser.add_argument("--rounds", type=int, default=5, help="Lookups per barcode per strategy")
+    parser.add_argument("--strategies", nargs="+", choices=sorted(STOCK_QUERY_STRATEGIES),
+                        default=[s for s in STOCK_QUERY_STRATEGIES if s not in get_backend().unsupported_strategies],
+                        help="Strategies to compare (default: all the configured backend supports)")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        barcodes = args.barcodes or sample_barcodes(conn, args.sample)
+        if not barcodes:
+            print("No barcodes to test")
+            return 1
+
+        print(f"Comparing {len(args.strategies)} strategies over {len(barcodes)} barcodes x {args.rounds} rounds")
+        print(f"Current STOCK_QUERY_STRATEGY: {STOCK_QUERY_STRATEGY}\n")
+        print(f"{'strategy':<16}{'found':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)")
+
+        reference = None
+        summary = []
+        for strategy in args.strategies:
+            try:
+                timings, results = run_strategy(conn, strategy, barcodes, args.rounds)
+            except Exception as e:
+                print(f"{strategy:<16}  failed: {str(e).splitlines()[0]}")
+                continue
+
+            found = sum(1 for product in results.values() if product is not None)
+            mean = statistics.mean(timings)
+            print(f"{strategy:<16}{found:>7}{mean:>10.2f}{percentile(timings, 50):>10.2f}"
+                  f"{percentile(timings, 95):>10.2f}{max(timings):>10.2f}")
+            summary.append((mean, strategy))
+
+            # Every strategy must return the same products as the first one that ran
+            if reference is None:
+                reference = (strategy, results)
+            else:
+                mismatched = [b for b in barcodes if results[b] != reference[1][b]]
+                if mismatched:
+                    print(f"   ⚠️ {len(mismatched)} results differ from {reference[0]} "
+                          f"(e.g. {mismatched[0]})")
+
+        if summary:
+            print(f"\nFastest: {min(summary)[1]}")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,51 @@
 """
 Database connection using pyodbc with User Authentication - Separate Stock Table Implementation
+A SQLite backend with the same schema stands in for SQL Server in tests and benchmarks.
 """
 import os
-import pyodbc
+import re
+import time
+import sqlite3
+import threading
+import hmac
 import hashlib
+import secrets
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
+from caches import TTLCache
+from app_logging import get_logger
+from metrics import DB_CONNECT_SECONDS, track_query
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None  # Only the sqlserver backend needs it
 
 # Load environment variables
 load_dotenv()
 
+log = get_logger("database")
+
 # Database configuration
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlserver").lower()  # sqlserver (pyodbc) or sqlite (local stand-in)
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", os.path.join("data", "price_scanner.sqlite"))
 DB_SERVER = os.getenv("DB_SERVER")
 DB_NAME = os.getenv("DB_NAME")
 DB_USE_WINDOWS_AUTH = os.getenv("DB_USE_WINDOWS_AUTH", "true").lower() == "true"
 DB_USERNAME = os.getenv("DB_USERNAME")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_DRIVER = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
+DB_LOGIN_TIMEOUT = int(os.getenv("DB_LOGIN_TIMEOUT", 10))
+
+# Connection pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 15))  # Seconds to wait for a free connection
+DB_POOL_MAX_AGE = float(os.getenv("DB_POOL_MAX_AGE", 1800))  # Seconds before a connection is recycled
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 5))  # Only ping connections idle longer than this
 
 # Product table and column names
 PRODUCT_TABLE = os.getenv("PRODUCT_TABLE", "dbo.items")
@@ -23,11 +53,28 @@ BARCODE_COLUMN = os.getenv("BARCODE_COLUMN", "PARCODE1")
 NAME_COLUMN = os.getenv("NAME_COLUMN", "item_name")
 PRICE_COLUMN = os.getenv("PRICE_COLUMN", "price")
 PRODUCT_ID_COLUMN = os.getenv("PRODUCT_ID_COLUMN", "id")
+CURRENCY = os.getenv("CURRENCY", "USD")  # Shown with prices and on invoice totals
 
 # Stock table and column names (NEW)
 STOCK_TABLE = os.getenv("STOCK_TABLE", "dbo.quntity")
 STOCK_PRODUCT_ID_COLUMN = os.getenv("STOCK_PRODUCT_ID_COLUMN", "item_id")
 STOCK_QUANTITY_COLUMN = os.getenv("STOCK_QUANTITY_COLUMN", "qunt")
+STOCK_ID_COLUMN = os.getenv("STOCK_ID_COLUMN", "id")  # Increasing key; the highest one is the latest stock row
+
+# Negative-result cache for unknown/misread barcodes
+NOT_FOUND_CACHE_SIZE = int(os.getenv("NOT_FOUND_CACHE_SIZE", 10000))
+NOT_FOUND_CACHE_TTL = float(os.getenv("NOT_FOUND_CACHE_TTL", 60))  # Seconds
+
+# User row cache for logins
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 500))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # Seconds
+# How long a successful login keeps working while the database is unreachable (0 disables)
+LOGIN_GRACE_WINDOW = float(os.getenv("LOGIN_GRACE_WINDOW", 900))  # Seconds
+
+# How "latest stock per product" is resolved (see STOCK_QUERY_STRATEGIES)
+STOCK_QUERY_STRATEGY = os.getenv("STOCK_QUERY_STRATEGY", "correlated_max")
+# Precomputed table holding one current row per product (for the "precomputed" strategy)
+LATEST_STOCK_TABLE = os.getenv("LATEST_STOCK_TABLE", "dbo.latest_quntity")
 
 # User table and column names
 USER_TABLE = os.getenv("USER_TABLE", "dbo.employee")
@@ -42,25 +89,350 @@ def get_connection_string():
     else:
         return f"DRIVER={{{DB_DRIVER}}};SERVER={DB_SERVER};DATABASE={DB_NAME};UID={DB_USERNAME};PWD={DB_PASSWORD};"
 
+# ==================== BACKENDS ====================
+
+class SqlServerBackend:
+    """SQL Server through pyodbc (production)"""
+
+    name = "sqlserver"
+    unsupported_strategies = ()
+
+    @property
+    def errors(self):
+        return (pyodbc.Error,) if pyodbc is not None else ()
+
+    def connect(self):
+        if pyodbc is None:
+            raise ImportError("pyodbc is not installed")
+        log.info("Opening database connection", server=DB_SERVER, database=DB_NAME)
+        # Autocommit: every query here is a read, so there is no transaction to hold open
+        return pyodbc.connect(get_connection_string(), timeout=DB_LOGIN_TIMEOUT, autocommit=True)
+
+    def random_barcodes_query(self, count):
+        return (f"SELECT TOP {int(count)} {BARCODE_COLUMN} FROM {PRODUCT_TABLE} "
+                f"WHERE {BARCODE_COLUMN} IS NOT NULL ORDER BY NEWID()")
+
+class SqliteBackend:
+    """SQLite file with the same tables; for tests, benchmarks and demos without SQL Server"""
+
+    name = "sqlite"
+    errors = (sqlite3.Error,)
+    # No OUTER APPLY in SQLite; the other strategies are portable
+    unsupported_strategies = ("outer_apply",)
+
+    def __init__(self, path=SQLITE_DB_PATH):
+        self.path = path
+
+    def schemas(self):
+        """Schema prefixes used by the configured tables (e.g. "dbo" from "dbo.items")"""
+        names = (PRODUCT_TABLE, STOCK_TABLE, LATEST_STOCK_TABLE, USER_TABLE)
+        return sorted({name.split(".")[0] for name in names if "." in name})
+
+    def connect(self, create=False):
+        """Connection where "dbo.items" etc. resolve: the file is attached under each schema name"""
+        if not create and not os.path.exists(self.path):
+            raise FileNotFoundError(f"SQLite database not found: {self.path}")
+        log.info("Opening database connection", backend=self.name, path=self.path)
+        schemas = self.schemas()
+        if not schemas:
+            return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        for schema in schemas:
+            if not re.fullmatch(r"\w+", schema):
+                raise ValueError(f"Unsupported schema name for SQLite: {schema}")
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (self.path,))
+        return conn
+
+    def random_barcodes_query(self, count):
+        return (f"SELECT {BARCODE_COLUMN} FROM {PRODUCT_TABLE} "
+                f"WHERE {BARCODE_COLUMN} IS NOT NULL ORDER BY RANDOM() LIMIT {int(count)}")
+
+DB_BACKENDS = {
+    "sqlserver": SqlServerBackend,
+    "sqlite": SqliteBackend,
+}
+
+if DB_BACKEND not in DB_BACKENDS:
+    log.warning("Unknown DB_BACKEND, using sqlserver", backend=DB_BACKEND)
+    DB_BACKEND = "sqlserver"
+
+_backend = DB_BACKENDS[DB_BACKEND]()
+
+def get_backend():
+    """The configured database backend"""
+    return _backend
+
+def sample_barcodes(conn, count):
+    """Random existing barcodes, for benchmarks and load tests"""
+    cursor = conn.cursor()
+    cursor.execute(_backend.random_barcodes_query(count))
+    barcodes = [str(row[0]).strip() for row in cursor.fetchall()]
+    cursor.close()
+    return barcodes
+
 def get_db_connection():
-    """Get database connection"""
+    """Open a new (unpooled) database connection"""
     try:
-        connection_string = get_connection_string()
-        print(f"Attempting connection with: {connection_string.replace(DB_PASSWORD or '', '***')}")
-        conn = pyodbc.connect(connection_string, timeout=10)
-        return conn
+        with DB_CONNECT_SECONDS.labels().time():
+            return _backend.connect()
     except Exception as e:
         raise Exception(f"Database connection failed: {str(e)}")
 
+# ==================== CONNECTION POOL ====================
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+class _PooledConnection:
+    """A raw connection plus the bookkeeping the pool needs"""
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+class ConnectionPool:
+    """Thread-safe pool of database connections with pre-ping and max-age recycling"""
+
+    def __init__(self, connect=get_db_connection, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_age=DB_POOL_MAX_AGE, pre_ping=DB_POOL_PRE_PING,
+                 ping_after=DB_POOL_PING_AFTER):
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+
+        self._idle = deque()
+        self._size = 0  # Open connections, idle or in use
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        # Stats
+        self._created = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def warm(self):
+        """Open connections until the pool holds min_size"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = _PooledConnection(self._connect())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._created += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self):
+        """Borrow a healthy connection, opening or waiting for one as needed"""
+        deadline = None
+        waited = 0.0
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise Exception("Connection pool is closed")
+                    if self._idle:
+                        entry = self._idle.pop()  # LIFO keeps the hottest connections busy
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                        self._waits += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._record_wait(waited)
+                        raise PoolTimeout(
+                            f"No database connection free after {self.timeout:.0f}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    start = time.monotonic()
+                    self._cond.wait(remaining)
+                    waited += time.monotonic() - start
+
+            if entry is None:
+                try:
+                    entry = _PooledConnection(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif not self._is_usable(entry):
+                self._discard(entry)
+                continue
+
+            with self._cond:
+                self._acquired += 1
+                self._record_wait(waited)
+            return entry
+
+    def release(self, entry, broken=False):
+        """Return a borrowed connection, closing it if broken or expired"""
+        if broken or self._closed or self._is_expired(entry):
+            self._discard(entry)
+            return
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always gives it back"""
+        entry = self.acquire()
+        broken = False
+        try:
+            yield entry.conn
+        except _backend.errors:
+            # Driver-level failure: the connection may be dead, don't hand it out again
+            broken = True
+            raise
+        finally:
+            self.release(entry, broken=broken)
+
+    def close(self):
+        """Close idle connections and refuse new borrows"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry.conn)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "in_use": self._size - idle,
+                "idle": idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self._created,
+                "recycled": self._recycled,
+                "ping_failures": self._ping_failures,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._total_wait * 1000, 1),
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+            }
+
+    def _record_wait(self, waited):
+        # Caller holds the lock
+        if waited:
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def _is_expired(self, entry):
+        return self.max_age > 0 and time.monotonic() - entry.created_at > self.max_age
+
+    def _is_usable(self, entry):
+        if self._is_expired(entry):
+            return False
+        if not self.pre_ping or time.monotonic() - entry.last_used < self.ping_after:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            with self._cond:
+                self._ping_failures += 1
+            return False
+
+    def _discard(self, entry):
+        self._close_quietly(entry.conn)
+        with self._cond:
+            self._size -= 1
+            self._recycled += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Optional in-memory catalog (see catalog.py)
+_catalog = None
+
+# Barcodes the database recently said don't exist
+_not_found = TTLCache(NOT_FOUND_CACHE_SIZE, NOT_FOUND_CACHE_TTL)
+
+# username -> (username, password, full_name) rows, and recent logins for DB outages
+_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+_recent_logins = TTLCache(USER_CACHE_SIZE, LOGIN_GRACE_WINDOW)
+_LOGIN_TOKEN_KEY = secrets.token_bytes(32)  # Per-process; remembered logins never leave memory
+
+def get_pool():
+    """Return the shared connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def db_connection():
+    """Borrow a pooled connection: `with db_connection() as conn: ...`"""
+    return get_pool().connection()
+
+def get_pool_stats():
+    """Connection pool counters (in use, idle, waits, wait time)"""
+    return get_pool().stats()
+
+def close_pool():
+    """Close the shared pool (used on shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 def test_connection():
     """Test database connection"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 AS test")
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            with track_query("test_connection"):
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 AS test")
+                result = cursor.fetchone()
+                cursor.close()
         
         if result and result[0] == 1:
             return True, "Connection successful"
@@ -73,184 +445,352 @@ def hash_password(password: str) -> str:
     """Simple password hashing using SHA-256"""
     return hashlib.sha256(password.encode('utf-8')).hexdigest()
 
+def _password_matches(stored_password, password):
+    """Constant-time check against a SHA-256 hex digest or a plain text password"""
+    if stored_password is None:
+        return False
+    stored = str(stored_password).encode('utf-8')
+    # Evaluate both forms every time so timing doesn't reveal which one is stored
+    hashed_ok = hmac.compare_digest(stored, hash_password(password).encode('utf-8'))
+    # Fallback to plain text comparison (less secure, for development)
+    plain_ok = hmac.compare_digest(stored, password.encode('utf-8'))
+    return hashed_ok or plain_ok
+
+def _login_token(password):
+    """Keyed digest of a password, kept in memory for the DB-outage login window"""
+    return hmac.new(_LOGIN_TOKEN_KEY, password.encode('utf-8'), hashlib.sha256).digest()
+
+def _fetch_user_row(username):
+    """(username, password, full_name) from USER_TABLE, cached on success"""
+    # Build query using configured column names
+    query = f"""
+    SELECT 
+        {USER_USERNAME_COLUMN} as username,
+        {USER_PASSWORD_COLUMN} as password,
+        {USER_FULLNAME_COLUMN} as full_name
+    FROM {USER_TABLE}
+    WHERE {USER_USERNAME_COLUMN} = ?
+    """
+    
+    with db_connection() as conn:
+        with track_query("verify_user_credentials"):
+            cursor = conn.cursor()
+            cursor.execute(query, (username,))
+            result = cursor.fetchone()
+            cursor.close()
+    
+    if result is None:
+        # Gone from the database: it mustn't be accepted during an outage either
+        _users.invalidate(username)
+        _recent_logins.invalidate(username)
+        return None
+    row = (result[0], result[1], result[2])
+    _users.set(username, row)
+    return row
+
+def invalidate_user(username=None):
+    """Drop cached user rows and remembered logins (all of them, or one user)"""
+    if username is None:
+        _users.clear()
+        _recent_logins.clear()
+    else:
+        _users.invalidate(username)
+        _recent_logins.invalidate(username)
+
+def get_user_cache_stats():
+    return {"users": _users.stats(), "recent_logins": _recent_logins.stats()}
+
 def verify_user_credentials(username: str, password: str):
-    """Verify user credentials against database"""
+    """Verify user credentials against database (user rows cached for USER_CACHE_TTL)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build query using configured column names
-        query = f"""
-        SELECT 
-            {USER_USERNAME_COLUMN} as username,
-            {USER_PASSWORD_COLUMN} as password,
-            {USER_FULLNAME_COLUMN} as full_name
-        FROM {USER_TABLE}
-        WHERE {USER_USERNAME_COLUMN} = ?
-        """
-        
-        cursor.execute(query, (username,))
-        result = cursor.fetchone()
+        result = _users.get(username)
+        fresh = result is None or not _password_matches(result[1], password)
+        if fresh:
+            # Not cached, or the password may have changed since the row was cached
+            result = _fetch_user_row(username)
         
-        cursor.close()
-        conn.close()
-        
-        if result:
-            stored_password = result[1]
+        if result and _password_matches(result[1], password):
             full_name = result[2] if result[2] else username
-            
-            # Check if password matches (support both plain text and hashed)
-            password_matches = False
-            
-            # Try hashed password first
-            hashed_input = hash_password(password)
-            if stored_password == hashed_input:
-                password_matches = True
-            # Fallback to plain text comparison (less secure, for development)
-            elif stored_password == password:
-                password_matches = True
-            
-            if password_matches:
-                return {
-                    "success": True,
-                    "username": result[0],
-                    "full_name": full_name
-                }
+            if LOGIN_GRACE_WINDOW > 0:
+                _recent_logins.set(username, (_login_token(password), result[0], full_name))
+            return {
+                "success": True,
+                "username": result[0],
+                "full_name": full_name
+            }
         
+        if result and fresh:
+            # The database itself rejects this password, so the outage grace must not accept it
+            _recent_logins.invalidate(username)
         return {"success": False, "error": "Invalid username or password"}
         
     except Exception as e:
-        print(f"Database authentication failed: {str(e)}")
+        # Database blip: accept users who logged in recently with this same password
+        recent = _recent_logins.get(username)
+        if recent and hmac.compare_digest(recent[0], _login_token(password)):
+            log.warning("Database unavailable, accepted recent login", user=username, error=str(e))
+            return {
+                "success": True,
+                "username": recent[1],
+                "full_name": recent[2]
+            }
+        log.error("Database authentication failed", user=username, error=str(e))
         return {"success": False, "error": "Authentication system unavailable"}
 
 def get_user_by_username(username: str):
     """Get user information by username"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = f"""
-        SELECT 
-            {USER_USERNAME_COLUMN} as username,
-            {USER_FULLNAME_COLUMN} as full_name
-        FROM {USER_TABLE}
-        WHERE {USER_USERNAME_COLUMN} = ?
-        """
-        
-        cursor.execute(query, (username,))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        result = _users.get(username) or _fetch_user_row(username)
         
         if result:
             return {
                 "username": result[0],
-                "full_name": result[1] if result[1] else result[0]
+                "full_name": result[2] if result[2] else result[0]
             }
         
         return None
         
     except Exception as e:
-        print(f"Error fetching user: {str(e)}")
+        log.error("Error fetching user", user=username, error=str(e))
         return None
 
-def get_product_by_barcode(barcode: str):
-    """Get product by barcode with stock from separate table"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Query with LEFT JOIN to get latest stock record
-        # Fixed: Handle N/A logic in Python, not SQL to avoid data type conversion errors
-        query = f"""
-        SELECT 
-            p.{NAME_COLUMN} as product_name,
-            p.{PRICE_COLUMN} as price,
-            p.{BARCODE_COLUMN} as barcode,
-            p.{PRODUCT_ID_COLUMN} as product_id,
-            latest_stock.{STOCK_QUANTITY_COLUMN} as stock_qty
+def format_product(name, price, product_barcode, raw_stock_qty, barcode):
+    """Build the API product payload from raw column values"""
+    # If no stock record exists (None/NULL from LEFT JOIN), show N/A
+    if raw_stock_qty is None:
+        stock_qty = 'N/A'
+    else:
+        try:
+            # Convert to float, then to int if it's a whole number
+            stock_float = float(raw_stock_qty)
+            if stock_float == int(stock_float):
+                stock_qty = int(stock_float)
+            else:
+                stock_qty = round(stock_float, 3)  # Round to 3 decimal places
+        except (ValueError, TypeError):
+            stock_qty = 'N/A'
+    
+    return {
+        "product_name": name if name else "Unknown Product",
+        "price": float(price) if price else 0.0,
+        "stock_qty": stock_qty,
+        "barcode": product_barcode if product_barcode else barcode,
+        "currency": CURRENCY
+    }
+
+# ==================== LATEST-STOCK QUERY STRATEGIES ====================
+# Each strategy returns the FROM/JOIN clause exposing `latest_stock` alongside products `p`.
+# Handle N/A logic in Python, not SQL, to avoid data type conversion errors.
+
+def _latest_stock_correlated_max():
+    """Derived table filtered by a correlated MAX(id) subquery (original query)"""
+    return f"""
         FROM {PRODUCT_TABLE} p
         LEFT JOIN (
             SELECT 
                 s1.{STOCK_PRODUCT_ID_COLUMN},
                 s1.{STOCK_QUANTITY_COLUMN}
             FROM {STOCK_TABLE} s1
-            WHERE s1.id = (
-                SELECT MAX(s2.id) 
+            WHERE s1.{STOCK_ID_COLUMN} = (
+                SELECT MAX(s2.{STOCK_ID_COLUMN}) 
                 FROM {STOCK_TABLE} s2 
                 WHERE s2.{STOCK_PRODUCT_ID_COLUMN} = s1.{STOCK_PRODUCT_ID_COLUMN}
             )
+        ) latest_stock ON p.{PRODUCT_ID_COLUMN} = latest_stock.{STOCK_PRODUCT_ID_COLUMN}"""
+
+def _latest_stock_outer_apply():
+    """TOP 1 ... ORDER BY id DESC per product via OUTER APPLY (one index seek each)"""
+    return f"""
+        FROM {PRODUCT_TABLE} p
+        OUTER APPLY (
+            SELECT TOP 1 s.{STOCK_QUANTITY_COLUMN}
+            FROM {STOCK_TABLE} s
+            WHERE s.{STOCK_PRODUCT_ID_COLUMN} = p.{PRODUCT_ID_COLUMN}
+            ORDER BY s.{STOCK_ID_COLUMN} DESC
+        ) latest_stock"""
+
+def _latest_stock_row_number():
+    """ROW_NUMBER() window partitioned by product, newest row first"""
+    return f"""
+        FROM {PRODUCT_TABLE} p
+        LEFT JOIN (
+            SELECT 
+                s.{STOCK_PRODUCT_ID_COLUMN},
+                s.{STOCK_QUANTITY_COLUMN},
+                ROW_NUMBER() OVER (
+                    PARTITION BY s.{STOCK_PRODUCT_ID_COLUMN}
+                    ORDER BY s.{STOCK_ID_COLUMN} DESC
+                ) AS rn
+            FROM {STOCK_TABLE} s
         ) latest_stock ON p.{PRODUCT_ID_COLUMN} = latest_stock.{STOCK_PRODUCT_ID_COLUMN}
-        WHERE p.{BARCODE_COLUMN} = ?
+            AND latest_stock.rn = 1"""
+
+def _latest_stock_precomputed():
+    """Join a maintained one-row-per-product table (LATEST_STOCK_TABLE)"""
+    return f"""
+        FROM {PRODUCT_TABLE} p
+        LEFT JOIN {LATEST_STOCK_TABLE} latest_stock
+            ON p.{PRODUCT_ID_COLUMN} = latest_stock.{STOCK_PRODUCT_ID_COLUMN}"""
+
+STOCK_QUERY_STRATEGIES = {
+    "correlated_max": _latest_stock_correlated_max,
+    "outer_apply": _latest_stock_outer_apply,
+    "row_number": _latest_stock_row_number,
+    "precomputed": _latest_stock_precomputed,
+}
+
+if STOCK_QUERY_STRATEGY not in STOCK_QUERY_STRATEGIES:
+    log.warning("Unknown STOCK_QUERY_STRATEGY, using correlated_max", strategy=STOCK_QUERY_STRATEGY)
+    STOCK_QUERY_STRATEGY = "correlated_max"
+elif STOCK_QUERY_STRATEGY in _backend.unsupported_strategies:
+    log.warning("STOCK_QUERY_STRATEGY not supported by this backend, using correlated_max",
+                strategy=STOCK_QUERY_STRATEGY, backend=_backend.name)
+    STOCK_QUERY_STRATEGY = "correlated_max"
+
+@lru_cache(maxsize=None)
+def build_product_query(where, strategy=None):
+    """Product + latest stock SELECT for a WHERE clause, using the configured strategy"""
+    from_clause = STOCK_QUERY_STRATEGIES[strategy or STOCK_QUERY_STRATEGY]()
+    return f"""
+        SELECT 
+            p.{NAME_COLUMN} as product_name,
+            p.{PRICE_COLUMN} as price,
+            p.{BARCODE_COLUMN} as barcode,
+            p.{PRODUCT_ID_COLUMN} as product_id,
+            latest_stock.{STOCK_QUANTITY_COLUMN} as stock_qty{from_clause}
+        WHERE {where}
         """
-        
-        print(f"Executing query: {query}")  # Debug logging
-        cursor.execute(query, (barcode,))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+
+def invalidate_not_found(barcode=None):
+    """Forget cached "not found" results (all of them, or one barcode)"""
+    if barcode is None:
+        _not_found.clear()
+    else:
+        _not_found.invalidate(barcode)
+
+def get_not_found_stats():
+    """Hit/miss counters of the negative-result cache"""
+    return _not_found.stats()
+
+def set_catalog(catalog):
+    """Install (or remove with None) the in-memory catalog consulted before SQL"""
+    global _catalog
+    _catalog = catalog
+
+def _catalog_lookup(barcode):
+    """Catalog answer for a barcode; None (fall through to SQL) when it has none or fails"""
+    try:
+        return _catalog.get(barcode)
+    except Exception as e:
+        log.warning("Catalog lookup failed, using SQL", barcode=barcode, error=str(e))
+        return None
+
+def normalize_barcode(barcode):
+    """Barcode as lookups, caches and the catalog key it (surrounding spaces dropped)"""
+    return str(barcode).strip()
+
+def get_product_by_barcode(barcode: str):
+    """Get product by barcode with stock from separate table"""
+    barcode = normalize_barcode(barcode)
+    if _catalog is not None:
+        product = _catalog_lookup(barcode)
+        if product is not None:
+            return product
+    
+    if _not_found.get(barcode):
+        return None
+    
+    try:
+        query = build_product_query(f"p.{BARCODE_COLUMN} = ?")
+        log.sample("Product query", barcode=barcode, strategy=STOCK_QUERY_STRATEGY)
+        with db_connection() as conn:
+            with track_query("get_product_by_barcode"):
+                cursor = conn.cursor()
+                cursor.execute(query, (barcode,))
+                result = cursor.fetchone()
+                cursor.close()
         
         if result:
-            # Handle stock quantity - convert to appropriate format
-            raw_stock_qty = result[4]
-            
-            # If no stock record exists (None/NULL from LEFT JOIN), show N/A
-            if raw_stock_qty is None:
-                stock_qty = 'N/A'
-            else:
-                try:
-                    # Convert to float, then to int if it's a whole number
-                    stock_float = float(raw_stock_qty)
-                    if stock_float == int(stock_float):
-                        stock_qty = int(stock_float)
-                    else:
-                        stock_qty = round(stock_float, 3)  # Round to 3 decimal places
-                except (ValueError, TypeError):
-                    stock_qty = 'N/A'
-            
-            return {
-                "product_name": result[0] if result[0] else "Unknown Product",
-                "price": float(result[1]) if result[1] else 0.0,
-                "stock_qty": stock_qty,
-                "barcode": result[2] if result[2] else barcode,
-                "currency": "USD"
-            }
+            return format_product(result[0], result[1], result[2], result[4], barcode)
         else:
+            # Only a successful query that found nothing is cached, never a failure
+            _not_found.set(barcode, True)
             return None
             
     except Exception as e:
         # Log the error for debugging - NO MORE MOCK DATA
-        print(f"Database query failed: {str(e)}")
-        print(f"Failed to get product for barcode: {barcode}")
+        log.error("Product query failed", barcode=barcode, error=str(e))
         
         # Return None to indicate failure - no mock data
         return None
 
+def get_products_by_barcodes(barcodes):
+    """Look up many barcodes in one round trip; returns {normalized barcode: product or None}"""
+    results = {}
+    pending = []
+    for barcode in map(normalize_barcode, barcodes):
+        if barcode in results:
+            continue
+        product = _catalog_lookup(barcode) if _catalog is not None else None
+        results[barcode] = product
+        if product is None and not _not_found.get(barcode):
+            pending.append(barcode)
+    
+    if not pending:
+        return results
+    
+    try:
+        placeholders = ", ".join("?" for _ in pending)
+        query = build_product_query(f"p.{BARCODE_COLUMN} IN ({placeholders})")
+        
+        with db_connection() as conn:
+            with track_query("get_products_by_barcodes"):
+                cursor = conn.cursor()
+                cursor.execute(query, pending)
+                rows = cursor.fetchall()
+                cursor.close()
+        
+        # SQL Server's = ignores trailing spaces and, under the usual collation, case; match
+        # rows to barcodes the same way so each gets the row its single lookup would return
+        rows_by_barcode = {}
+        rows_by_folded = {}
+        for row in rows:
+            key = normalize_barcode(row[2])
+            rows_by_barcode.setdefault(key, row)
+            rows_by_folded.setdefault(key.casefold(), row)
+        
+        for barcode in pending:
+            row = rows_by_barcode.get(barcode) or rows_by_folded.get(barcode.casefold())
+            if row:
+                results[barcode] = format_product(row[0], row[1], row[2], row[4], barcode)
+            else:
+                _not_found.set(barcode, True)
+        
+    except Exception as e:
+        log.error("Batch product query failed", barcodes=len(pending), error=str(e))
+    
+    return results
+
 def test_stock_query():
     """Test function to verify stock query is working correctly"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Test query to see stock table structure
         test_query = f"""
         SELECT TOP 5
             p.{NAME_COLUMN} as product_name,
             p.{BARCODE_COLUMN} as barcode,
             s.{STOCK_QUANTITY_COLUMN} as stock_qty,
-            s.id as stock_id
+            s.{STOCK_ID_COLUMN} as stock_id
         FROM {PRODUCT_TABLE} p
         LEFT JOIN {STOCK_TABLE} s ON p.{PRODUCT_ID_COLUMN} = s.{STOCK_PRODUCT_ID_COLUMN}
         ORDER BY p.{PRODUCT_ID_COLUMN}
         """
         
-        cursor.execute(test_query)
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(test_query)
+            results = cursor.fetchall()
+            cursor.close()
         
         print("Stock query test results:")
         for row in results:
@@ -0,0 +1,268 @@
+"""
+Bounded thread pools for blocking work (database, disk)
+Keeps pyodbc and file copies off the asyncio event loop;
+CPU-bound invoice rendering gets its own process pool.
+"""
+import os
+import sys
+import time
+import types
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Executor sizing (workers run jobs, queue holds jobs waiting for a worker)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_MAX_SIZE", 10)))
+DB_EXECUTOR_QUEUE = int(os.getenv("DB_EXECUTOR_QUEUE", 100))
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", 4))
+IO_EXECUTOR_QUEUE = int(os.getenv("IO_EXECUTOR_QUEUE", 50))
+RENDER_EXECUTOR_WORKERS = int(os.getenv("RENDER_EXECUTOR_WORKERS", 2))  # Processes; 0 renders on the io threads
+RENDER_EXECUTOR_QUEUE = int(os.getenv("RENDER_EXECUTOR_QUEUE", 20))
+
+# Set by the profiler while a request is profiled; called in the worker thread around each job
+# that request submits, so the sampler knows which threads are working for it
+job_tracer = contextvars.ContextVar("job_tracer", default=None)
+
+class ExecutorBusy(Exception):
+    """Raised when an executor's queue is full"""
+
+class BoundedExecutor:
+    """Thread pool with a capped backlog and queue-depth / wait-time counters"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+
+        # Stats
+        self._pending = 0  # Submitted but not finished (queued + running)
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking callable in this pool and await its result"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusy(f"{self.name} executor is busy ({self._pending} jobs pending)")
+            self._pending += 1
+            self._submitted += 1
+
+        try:
+            future = self._pool.submit(self._execute, time.monotonic(), partial(fn, *args, **kwargs),
+                                       job_tracer.get())
+        except RuntimeError:
+            self._forget_cancelled(None)
+            raise
+        future.add_done_callback(self._forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _forget_cancelled(self, future):
+        # A job cancelled before a worker picked it up never reaches _execute's bookkeeping
+        if future is None or future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def _execute(self, queued_at, call, tracer=None):
+        started = time.monotonic()
+        waited = started - queued_at
+        with self._lock:
+            self._running += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        ok = False
+        try:
+            if tracer is None:
+                result = call()
+            else:
+                with tracer():
+                    result = call()
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._total_run += elapsed
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+    def stats(self):
+        """Snapshot of queue depth and timing counters"""
+        with self._lock:
+            started = self._completed + self._failed + self._running
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "total_wait_ms": round(self._total_wait * 1000, 1),
+                "avg_run_ms": round(self._total_run / (started - self._running) * 1000, 2)
+                if started - self._running else 0.0,
+            }
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+@contextmanager
+def _hidden_main_module():
+    """Start processes without the parent's __main__ script
+
+    Spawned workers (the default on Windows) re-run the parent's script, main.py or
+    launcher.py with all of its module-level startup, before unpickling their first job.
+    With a blank __main__ they only import the modules their jobs and initializer live in.
+    """
+    if multiprocessing.get_start_method() == "fork":
+        yield
+        return
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+class BoundedProcessExecutor:
+    """Process pool for CPU-bound jobs, with the same backlog cap and counters as BoundedExecutor"""
+
+    def __init__(self, name, max_workers, max_queue, initializer=None):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.initializer = initializer
+        self._pool = None  # Started lazily so importing this module never spawns processes
+        self._lock = threading.Lock()
+
+        # Stats (measured in this process, so run time includes pickling)
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_run = 0.0
+        self._max_run = 0.0
+
+    def start(self, initializer=None):
+        """Create the pool and warm every worker (idempotent)"""
+        with self._lock:
+            if self._pool is None:
+                if initializer is not None:
+                    self.initializer = initializer
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+                # Spawn all workers now so the first job doesn't pay for process start-up
+                with _hidden_main_module():
+                    for _ in range(self.max_workers):
+                        self._pool.submit(int)
+            return self._pool
+
+    def _submit(self, fn, *args):
+        pool = self.start()
+        # Workers are started inside submit(), so a job can still spawn one
+        with self._lock, _hidden_main_module():
+            return pool.submit(fn, *args)
+
+    async def run(self, fn, *args):
+        """Run a picklable module-level callable in a worker process and await its result"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusy(f"{self.name} executor is busy ({self._pending} jobs pending)")
+            self._pending += 1
+            self._submitted += 1
+
+        started = time.monotonic()
+        ok = False
+        try:
+            result = await asyncio.wrap_future(self._submit(fn, *args))
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._pending -= 1
+                self._total_run += elapsed
+                self._max_run = max(self._max_run, elapsed)
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+    def stats(self):
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "processes": self._pool is not None,
+                "pending": self._pending,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_run_ms": round(self._total_run / finished * 1000, 2) if finished else 0.0,
+                "max_run_ms": round(self._max_run * 1000, 2),
+            }
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
+
+db_executor = BoundedExecutor("db", DB_EXECUTOR_WORKERS, DB_EXECUTOR_QUEUE)
+io_executor = BoundedExecutor("io", IO_EXECUTOR_WORKERS, IO_EXECUTOR_QUEUE)
+render_executor = (BoundedProcessExecutor("render", RENDER_EXECUTOR_WORKERS, RENDER_EXECUTOR_QUEUE)
+                   if RENDER_EXECUTOR_WORKERS > 0 else None)
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking database call off the event loop"""
+    return await db_executor.run(fn, *args, **kwargs)
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking file I/O off the event loop"""
+    return await io_executor.run(fn, *args, **kwargs)
+
+async def run_render(fn, *args):
+    """Run CPU-bound rendering in the render process pool (or on the io threads when disabled)"""
+    if render_executor is None:
+        return await io_executor.run(fn, *args)
+    return await render_executor.run(fn, *args)
+
+def _all_executors():
+    executors = [db_executor, io_executor]
+    if render_executor is not None:
+        executors.append(render_executor)
+    return executors
+
+def get_executor_stats():
+    """Counters for every executor, keyed by name"""
+    return {ex.name: ex.stats() for ex in _all_executors()}
+
+def shutdown_executors():
+    for ex in _all_executors():
+        ex.shutdown()
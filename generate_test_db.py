@@ -0,0 +1,179 @@
+"""
+Generate a SQLite stand-in for the store database
+Creates the configured PRODUCT_TABLE / STOCK_TABLE / LATEST_STOCK_TABLE /
+USER_TABLE (same env column names as SQL Server) in SQLITE_DB_PATH and
+fills them with synthetic data for tests and load tests.
+
+Usage:
+    python generate_test_db.py                                # 500k items, 5M stock rows
+    python generate_test_db.py --items 20000 --stock-rows 200000
+    python generate_test_db.py --output data/bench.sqlite --seed 7
+
+Then run the server against it with DB_BACKEND=sqlite (and SQLITE_DB_PATH
+if --output was given). Login: loadtest / loadtest unless changed.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from database import (
+    SqliteBackend, hash_password,
+    PRODUCT_TABLE, BARCODE_COLUMN, NAME_COLUMN, PRICE_COLUMN, PRODUCT_ID_COLUMN,
+    STOCK_TABLE, STOCK_PRODUCT_ID_COLUMN, STOCK_QUANTITY_COLUMN, STOCK_ID_COLUMN,
+    LATEST_STOCK_TABLE, USER_TABLE, USER_USERNAME_COLUMN, USER_PASSWORD_COLUMN, USER_FULLNAME_COLUMN,
+    SQLITE_DB_PATH
+)
+from catalog import PRODUCT_ROWVERSION_COLUMN
+
+BATCH_SIZE = 100000
+BARCODE_BASE = 6290000000000  # 13-digit, GS1-prefix-looking barcodes
+
+PRODUCT_WORDS = ["أرز", "سكر", "زيت", "حليب", "شاي", "قهوة", "معكرونة", "عصير", "جبن", "خبز",
+                 "Rice", "Sugar", "Oil", "Milk", "Tea", "Coffee", "Pasta", "Juice", "Cheese", "Bread"]
+SIZES = ["250g", "500g", "1kg", "2kg", "1L", "1.5L", "x6", "x12"]
+
+def barcode_for(item_id):
+    return str(BARCODE_BASE + item_id)
+
+def split_name(table):
+    """("dbo", "items") from "dbo.items"; index names take the schema, ON clauses don't"""
+    schema, _, name = table.rpartition(".")
+    return (schema + ".") if schema else "", name
+
+def create_schema(conn):
+    product_schema, product_name = split_name(PRODUCT_TABLE)
+    stock_schema, stock_name = split_name(STOCK_TABLE)
+    latest_schema, _ = split_name(LATEST_STOCK_TABLE)
+
+    for table in (PRODUCT_TABLE, STOCK_TABLE, LATEST_STOCK_TABLE, USER_TABLE):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    for schema in {product_schema, stock_schema, latest_schema} | {split_name(USER_TABLE)[0]}:
+        # Bulk load: durability doesn't matter for a generated file
+        conn.execute(f"PRAGMA {schema}journal_mode = OFF")
+        conn.execute(f"PRAGMA {schema}synchronous = OFF")
+
+    rowversion = f", {PRODUCT_ROWVERSION_COLUMN} INTEGER NOT NULL DEFAULT 0" if PRODUCT_ROWVERSION_COLUMN else ""
+    conn.execute(f"""
+        CREATE TABLE {PRODUCT_TABLE} (
+            {PRODUCT_ID_COLUMN} INTEGER PRIMARY KEY,
+            {BARCODE_COLUMN} TEXT,
+            {NAME_COLUMN} TEXT,
+            {PRICE_COLUMN} REAL{rowversion}
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE {STOCK_TABLE} (
+            {STOCK_ID_COLUMN} INTEGER PRIMARY KEY,
+            {STOCK_PRODUCT_ID_COLUMN} INTEGER NOT NULL,
+            {STOCK_QUANTITY_COLUMN} REAL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE {LATEST_STOCK_TABLE} (
+            {STOCK_PRODUCT_ID_COLUMN} INTEGER PRIMARY KEY,
+            {STOCK_QUANTITY_COLUMN} REAL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE {USER_TABLE} (
+            {USER_USERNAME_COLUMN} TEXT PRIMARY KEY,
+            {USER_PASSWORD_COLUMN} TEXT,
+            {USER_FULLNAME_COLUMN} TEXT
+        )
+    """)
+    return product_schema, product_name, stock_schema, stock_name
+
+def create_indexes(conn, product_schema, product_name, stock_schema, stock_name):
+    conn.execute(f"CREATE INDEX {product_schema}ix_{product_name}_barcode ON {product_name} ({BARCODE_COLUMN})")
+    conn.execute(f"CREATE INDEX {stock_schema}ix_{stock_name}_product ON {stock_name} "
+                 f"({STOCK_PRODUCT_ID_COLUMN}, {STOCK_ID_COLUMN})")
+
+def insert_batches(conn, query, rows, label, total):
+    started = time.perf_counter()
+    batch = []
+    done = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(query, batch)
+            done += len(batch)
+            batch.clear()
+            print(f"\r  {label}: {done:,}/{total:,}", end="", flush=True)
+    if batch:
+        conn.executemany(query, batch)
+        done += len(batch)
+    print(f"\r  {label}: {done:,}/{total:,} in {time.perf_counter() - started:.1f}s")
+
+def product_rows(rng, items):
+    for item_id in range(1, items + 1):
+        name = f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_WORDS)} {rng.choice(SIZES)}"
+        yield item_id, barcode_for(item_id), name, round(rng.uniform(0.25, 250), 2)
+
+def stock_rows(rng, items, stock_rows_count, stocked_ratio):
+    """Stock movements spread over the stocked items; ids increase, so the last row per item is the latest"""
+    stocked = max(1, int(items * stocked_ratio))
+    for stock_id in range(1, stock_rows_count + 1):
+        yield stock_id, rng.randint(1, stocked), float(rng.randint(0, 500))
+
+def generate(path, items, stock_rows_count, users, password, stocked_ratio, seed):
+    rng = random.Random(seed)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = SqliteBackend(path).connect(create=True)
+
+    print(f"Generating {path}")
+    names = create_schema(conn)
+    conn.execute("BEGIN")
+    insert_batches(conn, f"INSERT INTO {PRODUCT_TABLE} ({PRODUCT_ID_COLUMN}, {BARCODE_COLUMN}, {NAME_COLUMN}, "
+                         f"{PRICE_COLUMN}) VALUES (?, ?, ?, ?)", product_rows(rng, items), "items", items)
+    insert_batches(conn, f"INSERT INTO {STOCK_TABLE} ({STOCK_ID_COLUMN}, {STOCK_PRODUCT_ID_COLUMN}, "
+                         f"{STOCK_QUANTITY_COLUMN}) VALUES (?, ?, ?)",
+                   stock_rows(rng, items, stock_rows_count, stocked_ratio), "stock rows", stock_rows_count)
+    conn.execute("COMMIT")
+
+    started = time.perf_counter()
+    create_indexes(conn, *names)
+    conn.execute(f"""
+        INSERT INTO {LATEST_STOCK_TABLE} ({STOCK_PRODUCT_ID_COLUMN}, {STOCK_QUANTITY_COLUMN})
+        SELECT s.{STOCK_PRODUCT_ID_COLUMN}, s.{STOCK_QUANTITY_COLUMN}
+        FROM {STOCK_TABLE} s
+        JOIN (
+            SELECT {STOCK_PRODUCT_ID_COLUMN} AS product_id, MAX({STOCK_ID_COLUMN}) AS max_id
+            FROM {STOCK_TABLE}
+            GROUP BY {STOCK_PRODUCT_ID_COLUMN}
+        ) latest ON s.{STOCK_ID_COLUMN} = latest.max_id
+    """)
+    print(f"  indexes and {LATEST_STOCK_TABLE}: {time.perf_counter() - started:.1f}s")
+
+    accounts = [("loadtest", hash_password(password), "Load Test")]
+    accounts += [(f"user{n}", hash_password(password), f"User {n}") for n in range(1, users + 1)]
+    conn.executemany(f"INSERT INTO {USER_TABLE} ({USER_USERNAME_COLUMN}, {USER_PASSWORD_COLUMN}, "
+                     f"{USER_FULLNAME_COLUMN}) VALUES (?, ?, ?)", accounts)
+    conn.execute("ANALYZE")
+    conn.close()
+
+    print(f"Done: {os.path.getsize(path) / 1024 / 1024:.1f} MB, {len(accounts)} users (password: {password})")
+    print(f"Run the server with DB_BACKEND=sqlite SQLITE_DB_PATH={path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a SQLite stand-in database")
+    parser.add_argument("--output", default=SQLITE_DB_PATH, help=f"SQLite file (default {SQLITE_DB_PATH})")
+    parser.add_argument("--items", type=int, default=500000)
+    parser.add_argument("--stock-rows", type=int, default=5000000)
+    parser.add_argument("--stocked-ratio", type=float, default=0.9, help="Share of items with any stock rows")
+    parser.add_argument("--users", type=int, default=20, help="Extra user1..N accounts besides loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    try:
+        generate(args.output, args.items, args.stock_rows, args.users, args.password, args.stocked_ratio, args.seed)
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
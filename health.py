@@ -0,0 +1,116 @@
+"""
+Background database-liveness prober shared by /api/health and the launcher
+One thread checks the database; everyone else reads the cached state.
+"""
+import os
+import time
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from database import test_connection, get_pool_stats
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("health")
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 15))  # Seconds between probes
+
+class HealthProber:
+    """Owns the database-liveness state; probes on a timer or on demand"""
+
+    def __init__(self, interval=HEALTH_PROBE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()  # One live check at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self._users = 0  # start() calls not yet matched by stop(); the server and the launcher share it
+
+        self.is_connected = False
+        self.message = "Not checked yet"
+        self.latency_ms = None
+        self.last_check = None
+        self.last_success = None
+        self.consecutive_failures = 0
+        self.probes = 0
+
+    def start(self):
+        """Start the probe thread, or join the users of the running one"""
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                self._stop = threading.Event()  # Fresh per thread, so a stopping one can't be revived
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name="health-prober",
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Release one start(); the thread stops when the last user releases it"""
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users:
+                return
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+        if thread:
+            thread.join(timeout=2)
+
+    def probe(self):
+        """Run a live check now, update the shared state and return it"""
+        with self._probe_lock:
+            started = time.perf_counter()
+            try:
+                is_connected, message = test_connection()
+            except Exception as e:
+                is_connected, message = False, str(e)
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+            with self._lock:
+                changed = is_connected != self.is_connected or self.last_check is None
+                self.is_connected = is_connected
+                self.message = message
+                self.latency_ms = latency_ms
+                self.last_check = datetime.now()
+                self.probes += 1
+                if is_connected:
+                    self.last_success = self.last_check
+                    self.consecutive_failures = 0
+                else:
+                    self.consecutive_failures += 1
+
+            # Connectivity flips reach the launcher's Activity Log through the log sink
+            if changed:
+                if is_connected:
+                    log.success("Database connection restored", latency_ms=latency_ms)
+                else:
+                    log.error("Database connection lost", error=message)
+        return self.snapshot()
+
+    def snapshot(self):
+        """Cached state; never touches the database"""
+        with self._lock:
+            age = (datetime.now() - self.last_check).total_seconds() if self.last_check else None
+            return {
+                "is_connected": self.is_connected,
+                "message": self.message,
+                "latency_ms": self.latency_ms,
+                "last_check": self.last_check.isoformat(timespec="seconds") if self.last_check else None,
+                "last_success": self.last_success.isoformat(timespec="seconds") if self.last_success else None,
+                "age_s": round(age, 1) if age is not None else None,
+                "consecutive_failures": self.consecutive_failures,
+                "probes": self.probes,
+                "interval_s": self.interval,
+                "pool": get_pool_stats(),
+            }
+
+    def _run(self, stop):
+        if self.last_check is None:
+            self.probe()
+        while not stop.wait(self.interval):
+            self.probe()
+
+# Shared instance for the server and the launcher
+prober = HealthProber()
@@ -0,0 +1,199 @@
+"""
+Server-side invoice PDF rendering (vector, Arabic, with Code 128 barcodes)
+Runs inside the render process pool: fonts, shaped labels and barcode widgets
+are built once per worker process and reused across jobs.
+"""
+import io
+import os
+from functools import lru_cache
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from reportlab.graphics.barcode.code128 import Code128
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+FONT_NAME = "Amiri"
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Amiri-Regular.ttf")
+
+# Page layout (A4 portrait, right-to-left table)
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 15 * mm
+RIGHT = PAGE_WIDTH - MARGIN
+LEFT = MARGIN
+BOTTOM = 20 * mm
+
+# Column right edges and widths, right to left: product, quantity, unit price, total
+COLUMNS = (
+    ("المنتج", 88 * mm),
+    ("الكمية", 20 * mm),
+    ("السعر الوحدة", 36 * mm),
+    ("الإجمالي", 36 * mm),
+)
+HEADER_ROW_HEIGHT = 9 * mm
+ROW_HEIGHT = 25 * mm
+BARCODE_HEIGHT = 10 * mm
+BARCODE_BAR_WIDTH = 0.9  # Points per module; shrunk for very long barcodes
+
+TITLE = "فاتورة أولية - Proforma Invoice"
+FOOTER_NOTE = "ملاحظة: هذه فاتورة أولية للاستخدام الداخلي فقط"
+FOOTER_SYSTEM = "تم إنشاؤها بواسطة نظام ماسح الأسعار v2.0"
+
+_reshaper = arabic_reshaper.ArabicReshaper()
+_font_ready = False
+
+def _ensure_font():
+    """Register the Arabic font once per process"""
+    global _font_ready
+    if not _font_ready:
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+        _font_ready = True
+
+@lru_cache(maxsize=4096)
+def _shape(text):
+    """Reshape and reorder Arabic text for left-to-right glyph drawing"""
+    return get_display(_reshaper.reshape(text))
+
+@lru_cache(maxsize=4096)
+def _fit(text, size, max_width):
+    """Shaped text, truncated with an ellipsis to fit max_width"""
+    shaped = _shape(text)
+    if pdfmetrics.stringWidth(shaped, FONT_NAME, size) <= max_width:
+        return shaped
+    for end in range(len(text) - 1, 0, -1):
+        shaped = _shape(text[:end].rstrip() + "…")
+        if pdfmetrics.stringWidth(shaped, FONT_NAME, size) <= max_width:
+            return shaped
+    return ""
+
+@lru_cache(maxsize=2048)
+def _barcode(value, max_width):
+    """Code 128 widget for value, narrowed if needed to fit max_width (None if unencodable)"""
+    try:
+        widget = Code128(value, barWidth=BARCODE_BAR_WIDTH, barHeight=BARCODE_HEIGHT,
+                         humanReadable=False, quiet=False)
+        if widget.width > max_width:
+            widget = Code128(value, barWidth=BARCODE_BAR_WIDTH * max_width / widget.width,
+                             barHeight=BARCODE_HEIGHT, humanReadable=False, quiet=False)
+        return widget
+    except Exception:
+        return None
+
+def _column_edges():
+    """(right_edge, width) per column"""
+    edges = []
+    right = RIGHT
+    for _, width in COLUMNS:
+        edges.append((right, width))
+        right -= width
+    return edges
+
+COLUMN_EDGES = _column_edges()
+
+def _text(c, text, x, y, size, align="right", max_width=None):
+    c.setFont(FONT_NAME, size)
+    shaped = _fit(text, size, max_width) if max_width else _shape(text)
+    if align == "right":
+        c.drawRightString(x, y, shaped)
+    elif align == "center":
+        c.drawCentredString(x, y, shaped)
+    else:
+        c.drawString(x, y, shaped)
+
+def _draw_table_header(c, y):
+    c.setFillGray(0.92)
+    c.rect(LEFT, y - HEADER_ROW_HEIGHT, RIGHT - LEFT, HEADER_ROW_HEIGHT, stroke=1, fill=1)
+    c.setFillGray(0)
+    for (label, _), (right, width) in zip(COLUMNS, COLUMN_EDGES):
+        _text(c, label, right - width / 2, y - HEADER_ROW_HEIGHT + 3 * mm, 11, align="center")
+    return y - HEADER_ROW_HEIGHT
+
+def _draw_page_start(c, page, username, printed_at):
+    """Title (and on the first page the date/user block); returns the y where rows start"""
+    y = PAGE_HEIGHT - MARGIN - 8 * mm
+    _text(c, TITLE, PAGE_WIDTH / 2, y, 18, align="center")
+    y -= 10 * mm
+    if page == 1:
+        date_str = f"{printed_at.year}/{printed_at.month}/{printed_at.day} م"
+        _text(c, f"التاريخ: {date_str}", RIGHT, y, 11)
+        y -= 6 * mm
+        _text(c, f"الوقت: {printed_at:%H:%M}", RIGHT, y, 11)
+        y -= 6 * mm
+        _text(c, f"المستخدم: {username}", RIGHT, y, 11, max_width=RIGHT - LEFT)
+        y -= 8 * mm
+    c.setLineWidth(0.5)
+    return _draw_table_header(c, y)
+
+def _draw_row(c, y, item, currency):
+    top = y
+    bottom = y - ROW_HEIGHT
+    c.rect(LEFT, bottom, RIGHT - LEFT, ROW_HEIGHT, stroke=1, fill=0)
+    for right, _ in COLUMN_EDGES[1:]:
+        c.line(right, bottom, right, top)
+
+    (name_right, name_width), (qty_right, qty_width), (unit_right, unit_width), (total_right, total_width) = COLUMN_EDGES
+    inner = name_width - 4 * mm
+    _text(c, item["product_name"], name_right - 2 * mm, top - 6 * mm, 11, max_width=inner)
+    widget = _barcode(item["barcode"], inner)
+    if widget is not None:
+        widget.drawOn(c, name_right - 2 * mm - widget.width, top - 8 * mm - BARCODE_HEIGHT)
+    c.setFont(FONT_NAME, 8)
+    c.drawRightString(name_right - 2 * mm, bottom + 2 * mm, item["barcode"])
+
+    middle = bottom + ROW_HEIGHT / 2 - 1.5 * mm
+    _text(c, str(item["quantity"]), qty_right - qty_width / 2, middle, 11, align="center")
+    _text(c, f"{item['price']:.2f} {currency}", unit_right - unit_width / 2, middle, 11, align="center")
+    _text(c, f"{item['price'] * item['quantity']:.2f} {currency}", total_right - total_width / 2, middle, 11,
+          align="center")
+    return bottom
+
+def _draw_totals(c, y, count, total, currency):
+    y -= 8 * mm
+    _text(c, f"إجمالي العناصر: {count}", RIGHT, y, 12)
+    y -= 7 * mm
+    _text(c, f"المجموع الكلي: {total:.2f} {currency}", RIGHT, y, 14)
+    y -= 12 * mm
+    _text(c, FOOTER_NOTE, PAGE_WIDTH / 2, y, 9, align="center")
+    _text(c, FOOTER_SYSTEM, PAGE_WIDTH / 2, y - 5 * mm, 9, align="center")
+
+def render_invoice(items, username, printed_at, currency):
+    """
+    Render a cart as a PDF and return its bytes
+    items: dicts with barcode, product_name, price, quantity (already validated)
+    currency: the server's currency, shown with every amount on the invoice
+    """
+    _ensure_font()
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    c.setTitle("Invoice")
+    c.setAuthor(username)
+
+    page = 1
+    y = _draw_page_start(c, page, username, printed_at)
+    for item in items:
+        if y - ROW_HEIGHT < BOTTOM:
+            c.showPage()
+            page += 1
+            y = _draw_page_start(c, page, username, printed_at)
+        y = _draw_row(c, y, item, currency)
+
+    # Totals and footer need about 40 mm
+    if y - 40 * mm < BOTTOM:
+        c.showPage()
+        page += 1
+        y = PAGE_HEIGHT - MARGIN
+    count = sum(item["quantity"] for item in items)
+    total = sum(item["price"] * item["quantity"] for item in items)
+    _draw_totals(c, y, count, total, currency)
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+def warm_up():
+    """Render-pool initializer: load the font and pre-shape fixed labels"""
+    _ensure_font()
+    for text in (TITLE, FOOTER_NOTE, FOOTER_SYSTEM, *(label for label, _ in COLUMNS)):
+        _shape(text)
@@ -9,10 +9,11 @@ import time
 import socket
 import webbrowser
 import argparse
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, simpledialog
 import winreg
 from PIL import Image, ImageDraw
 import pystray
@@ -45,6 +46,13 @@ else:
     print(f"Current directory: {os.getcwd()}")
     print(f"App directory: {app_dir}")
 
+# ==================== ACTIVITY LOG SETTINGS ====================
+
+ACTIVITY_FLUSH_MS = int(os.getenv("ACTIVITY_FLUSH_MS", 250))  # How often new lines are drawn into the log
+ACTIVITY_MAX_LINES = int(os.getenv("ACTIVITY_MAX_LINES", 500))  # Older lines are dropped from the widget
+ACTIVITY_LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 20, "WARNING": 30, "ERROR": 40}
+ACTIVITY_FILTERS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
 # ==================== IMPORT APPLICATION COMPONENTS ====================
 
 # Add current directory to Python path so we can import main
@@ -52,30 +60,33 @@ sys.path.insert(0, str(app_dir))
 
 try:
     # Import the FastAPI app from existing main.py
-    from main import app, get_local_ip, test_connection
+    from main import app, get_local_ip, revoke_user_access
+    from health import prober
     from database import get_db_connection
+    from app_logging import add_activity_sink
+    from profiler import profiler, PROFILE_ENABLED, PROFILE_WINDOW
 except ImportError as e:
     print(f"Error importing main components: {e}")
     print("Make sure main.py and database.py are in the same directory")
     sys.exit(1)
 
 class ActivityLogger:
-    """Captures and stores application activities"""
-    def __init__(self, max_entries=100):
-        self.activities = []
+    """Captures and stores application activities in a fixed-size ring buffer"""
+    def __init__(self, max_entries=1000):
+        self.activities = deque(maxlen=max_entries)  # (sequence number, level, line)
         self.max_entries = max_entries
         self.callbacks = []
+        self._seq = 0
+        self._lock = threading.Lock()
     
     def add_activity(self, message, level="INFO"):
         timestamp = datetime.now().strftime("%H:%M:%S")
         activity = f"[{timestamp}] {level}: {message}"
-        self.activities.append(activity)
-        
-        # Keep only last max_entries
-        if len(self.activities) > self.max_entries:
-            self.activities = self.activities[-self.max_entries:]
+        with self._lock:
+            self._seq += 1
+            self.activities.append((self._seq, level, activity))
         
-        # Notify callbacks
+        # Notify callbacks (the GUI polls get_since instead of registering one)
         for callback in self.callbacks:
             try:
                 callback(activity)
@@ -85,60 +96,54 @@ class ActivityLogger:
     def add_callback(self, callback):
         self.callbacks.append(callback)
     
+    def get_since(self, seq):
+        """Entries newer than sequence number seq, and the latest sequence number"""
+        with self._lock:
+            if not self.activities or self.activities[-1][0] <= seq:
+                return [], self._seq
+            entries = []
+            for entry in reversed(self.activities):
+                if entry[0] <= seq:
+                    break
+                entries.append(entry)
+            entries.reverse()
+            return entries, self._seq
+    
     def get_recent(self, count=20):
-        return self.activities[-count:] if self.activities else []
+        with self._lock:
+            return [line for _, _, line in list(self.activities)[-count:]]
 
 class DatabaseMonitor:
-    """Monitors database connection status"""
+    """Follows the database status owned by the shared health prober"""
     def __init__(self, activity_logger):
         self.logger = activity_logger
-        self.is_connected = False
-        self.last_check = None
         self.monitoring = False
-        self.monitor_thread = None
+    
+    @property
+    def is_connected(self):
+        return prober.is_connected
+    
+    @property
+    def last_check(self):
+        return prober.last_check
     
     def start_monitoring(self):
         if not self.monitoring:
             self.monitoring = True
-            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-            self.monitor_thread.start()
+            # The prober logs connectivity changes; the server holds its own start() on it
+            prober.start()
             self.logger.add_activity("Database monitoring started")
     
     def stop_monitoring(self):
-        self.monitoring = False
-        if self.monitor_thread:
-            self.monitor_thread.join(timeout=1)
-    
-    def _monitor_loop(self):
-        while self.monitoring:
-            try:
-                self.check_connection()
-                time.sleep(30)  # Check every 30 seconds
-            except Exception as e:
-                self.logger.add_activity(f"Database monitor error: {e}", "ERROR")
-                time.sleep(30)
+        # Only release our own start(); the server keeps probing for /api/health
+        if self.monitoring:
+            self.monitoring = False
+            prober.stop()
     
     def check_connection(self):
-        try:
-            is_connected, message = test_connection()
-            
-            if is_connected != self.is_connected:
-                # Status changed
-                if is_connected:
-                    self.logger.add_activity("Database connection restored", "SUCCESS")
-                else:
-                    self.logger.add_activity(f"Database connection lost: {message}", "ERROR")
-                
-                self.is_connected = is_connected
-            
-            self.last_check = datetime.now()
-            return is_connected, message
-            
-        except Exception as e:
-            if self.is_connected:
-                self.logger.add_activity(f"Database connection failed: {e}", "ERROR")
-                self.is_connected = False
-            return False, str(e)
+        """Force a live check (Retry button)"""
+        state = prober.probe()
+        return state["is_connected"], state["message"]
 
 class ServerManager:
     """Manages the FastAPI server"""
@@ -213,6 +218,7 @@ class PriceScannerGUI:
     def __init__(self, start_hidden=False):
         self.start_hidden = start_hidden
         self.activity_logger = ActivityLogger()
+        add_activity_sink(self.activity_logger)  # Server log records show up in the Activity Log
         self.db_monitor = DatabaseMonitor(self.activity_logger)
         self.server_manager = ServerManager(self.activity_logger)
         
@@ -293,6 +299,11 @@ class PriceScannerGUI:
         
         ttk.Button(buttons_frame, text="Open in Browser", command=self.open_browser).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(buttons_frame, text="Hide to Tray", command=self.hide_window).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(buttons_frame, text="Sign Out User", command=self.sign_out_user).pack(side=tk.LEFT, padx=(0, 10))
+        if PROFILE_ENABLED:
+            self.profile_btn = ttk.Button(buttons_frame, text=f"Profile {PROFILE_WINDOW:.0f}s",
+                                          command=self.toggle_profiling)
+            self.profile_btn.pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(buttons_frame, text="Exit Application", command=self.quit_application).pack(side=tk.LEFT)
         
         # Startup checkbox
@@ -310,22 +321,57 @@ class PriceScannerGUI:
         self.activity_text = scrolledtext.ScrolledText(log_frame, height=10, state=tk.DISABLED)
         self.activity_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # Level filter
+        filter_frame = ttk.Frame(log_frame)
+        filter_frame.grid(row=1, column=0, sticky=tk.E, pady=(5, 0))
+        ttk.Label(filter_frame, text="Show:").pack(side=tk.LEFT, padx=(0, 5))
+        self.activity_filter = tk.StringVar(value="INFO")
+        filter_box = ttk.Combobox(filter_frame, textvariable=self.activity_filter, values=ACTIVITY_FILTERS,
+                                  state="readonly", width=10)
+        filter_box.pack(side=tk.LEFT)
+        filter_box.bind("<<ComboboxSelected>>", lambda e: self.redraw_activity())
+        
         # Check startup status
         self.check_startup_status()
     
     def setup_activity_callback(self):
-        def on_activity(activity):
-            # Schedule GUI update in main thread
-            self.root.after(0, lambda: self.add_activity_to_gui(activity))
-        
-        self.activity_logger.add_callback(on_activity)
+        # Log lines are pulled in batches on a timer rather than pushed one Tk call per message
+        self.activity_seq = 0
+        self.root.after(ACTIVITY_FLUSH_MS, self.flush_activity)
     
-    def add_activity_to_gui(self, activity):
-        if self.activity_text:
-            self.activity_text.config(state=tk.NORMAL)
-            self.activity_text.insert(tk.END, activity + "\n")
-            self.activity_text.see(tk.END)
-            self.activity_text.config(state=tk.DISABLED)
+    def flush_activity(self):
+        try:
+            # Nothing is drawn while hidden in the tray; the backlog is drawn in one batch on show
+            if self.root.state() != "withdrawn":
+                entries, self.activity_seq = self.activity_logger.get_since(self.activity_seq)
+                self.add_activity_to_gui(entries)
+        finally:
+            self.root.after(ACTIVITY_FLUSH_MS, self.flush_activity)
+    
+    def redraw_activity(self):
+        """Rebuild the log from the ring buffer, e.g. after the level filter changed"""
+        self.activity_text.config(state=tk.NORMAL)
+        self.activity_text.delete("1.0", tk.END)
+        self.activity_text.config(state=tk.DISABLED)
+        entries, self.activity_seq = self.activity_logger.get_since(0)
+        self.add_activity_to_gui(entries)
+    
+    def add_activity_to_gui(self, entries):
+        minimum = ACTIVITY_LEVELS.get(self.activity_filter.get(), 0)
+        lines = [line for _, level, line in entries[-ACTIVITY_MAX_LINES:]
+                 if ACTIVITY_LEVELS.get(level, 20) >= minimum]
+        if not lines or not self.activity_text:
+            return
+        
+        self.activity_text.config(state=tk.NORMAL)
+        self.activity_text.insert(tk.END, "\n".join(lines) + "\n")
+        
+        # Keep the widget bounded; the text always ends with an empty line after the last newline
+        excess = int(self.activity_text.index("end-1c").split(".")[0]) - 1 - ACTIVITY_MAX_LINES
+        if excess > 0:
+            self.activity_text.delete("1.0", f"{excess + 1}.0")
+        self.activity_text.see(tk.END)
+        self.activity_text.config(state=tk.DISABLED)
     
     def start_services(self):
         # Start server
@@ -388,6 +434,34 @@ class PriceScannerGUI:
             webbrowser.open(local_url)
             self.activity_logger.add_activity("Opened application in browser")
     
+    def sign_out_user(self):
+        # Use after changing or removing a user in the database so the old password stops working at once
+        username = simpledialog.askstring("Sign Out User", "Username (leave empty for all users):", parent=self.root)
+        if username is None:
+            return
+        username = username.strip() or None
+        try:
+            revoke_user_access(username)
+            self.activity_logger.add_activity(f"Signed out {username or 'all users'}", "SUCCESS")
+        except Exception as e:
+            self.activity_logger.add_activity(f"Failed to sign out user: {e}", "ERROR")
+    
+    def toggle_profiling(self):
+        # The server runs in this process, so the window is opened directly on the shared profiler
+        if profiler.window_remaining():
+            profiler.disable_window()
+        else:
+            profiler.enable_window(PROFILE_WINDOW)
+        self.update_profile_button()
+    
+    def update_profile_button(self):
+        remaining = profiler.window_remaining()
+        if remaining:
+            self.profile_btn.config(text=f"Stop Profiling ({remaining:.0f}s)")
+            self.root.after(1000, self.update_profile_button)
+        else:
+            self.profile_btn.config(text=f"Profile {PROFILE_WINDOW:.0f}s")
+    
     def hide_window(self):
         self.root.withdraw()
         if not self.tray_icon:
@@ -531,4 +605,7 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # Invoice rendering runs in worker processes; required for the frozen build on Windows
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
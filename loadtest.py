@@ -0,0 +1,322 @@
+"""
+Load test a running Price Scanner server
+Drives /api/price, /api/login, /api/health and /api/upload-and-print at
+one or more concurrency levels and writes latency percentiles and
+throughput to a JSON file, so results can be compared between versions.
+
+Usage:
+    python loadtest.py                                        # All scenarios at concurrency 1, 8 and 32
+    python loadtest.py --url https://127.0.0.1:8000 --concurrency 16 --requests 5000
+    python loadtest.py --scenarios price health --duration 30
+    python loadtest.py --compare loadtest_results/20260101_120000.json
+
+Barcodes are sampled from the configured database (DB_BACKEND, e.g. a file
+made by generate_test_db.py). Uploads resend one invoice by default, which
+exercises de-duplication; --unique-uploads queues a real print per request,
+so pair it with PRINTER_BACKEND=file on the server.
+"""
+import os
+import sys
+import ssl
+import json
+import time
+import uuid
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlparse
+from database import get_db_connection, get_backend, sample_barcodes, STOCK_QUERY_STRATEGY
+
+SCENARIOS = ("price", "login", "health", "upload")
+RESULTS_DIR = "loadtest_results"
+MISS_PREFIX = "0000"  # Random barcodes with this prefix are expected to be unknown
+
+# ==================== HTTP CLIENT ====================
+
+class Client:
+    """One keep-alive connection plus the session cookie; used by a single thread"""
+
+    def __init__(self, url, timeout):
+        parsed = urlparse(url)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.https else 80)
+        self.timeout = timeout
+        self.cookie = None
+        self.conn = None
+
+    def _connect(self):
+        if self.https:
+            # The server uses a self-signed certificate
+            context = ssl._create_unverified_context()
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, body); reconnects once if the kept-alive connection was dropped"""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = self._connect()
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            value = cookie.split(";", 1)[0]
+            self.cookie = None if value.endswith("=null") else value
+        return response.status, data
+
+    def login(self, username, password):
+        status, data = self.request("POST", "/api/login", json.dumps({"username": username, "password": password}),
+                                    {"Content-Type": "application/json"})
+        if status != 200:
+            raise RuntimeError(f"Login failed ({status}): {data[:200]!r}")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# ==================== SCENARIOS ====================
+
+def minimal_pdf(marker=""):
+    """Small valid-looking PDF; marker makes the bytes (and so the upload digest) unique"""
+    return (b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+            b"2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n"
+            b"trailer << /Root 1 0 R >>\n%%EOF\n" + f"% {marker}\n".encode() + b" " * 2048)
+
+def multipart_body(pdf):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="Invoice_loadtest.pdf"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n").encode() + pdf + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+def make_scenario(name, args, barcodes):
+    """Function (client, rng) -> HTTP status for one request of the scenario"""
+    if name == "price":
+        def run(client, rng):
+            if rng.random() < args.miss_ratio or not barcodes:
+                barcode = MISS_PREFIX + str(rng.randrange(10 ** 9))
+            else:
+                barcode = rng.choice(barcodes)
+            return client.request("GET", f"/api/price/{barcode}")[0]
+    elif name == "login":
+        payload = json.dumps({"username": args.username, "password": args.password})
+        def run(client, rng):
+            return client.request("POST", "/api/login", payload, {"Content-Type": "application/json"})[0]
+    elif name == "health":
+        def run(client, rng):
+            return client.request("GET", "/api/health")[0]
+    elif name == "upload":
+        shared = multipart_body(minimal_pdf())
+        def run(client, rng):
+            body, headers = multipart_body(minimal_pdf(uuid.uuid4().hex)) if args.unique_uploads else shared
+            return client.request("POST", "/api/upload-and-print", body, headers)[0]
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+    return run
+
+def random_barcodes(count):
+    """Random existing barcodes from the configured database"""
+    conn = get_db_connection()
+    try:
+        return sample_barcodes(conn, count)
+    finally:
+        conn.close()
+
+# ==================== RUNNER ====================
+
+def percentile(ordered, pct):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_level(name, scenario, concurrency, args):
+    """Run one scenario at one concurrency; returns the result dict"""
+    clients = []
+    for _ in range(concurrency):
+        client = Client(args.url, args.timeout)
+        client.login(args.username, args.password)
+        clients.append(client)
+
+    remaining = [args.requests]
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [Counter() for _ in range(concurrency)]
+    deadline = [None]
+
+    def take():
+        if args.duration:
+            return time.perf_counter() < deadline[0]
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client, timings, counts = clients[index], latencies[index], statuses[index]
+        barrier.wait()
+        while take():
+            started = time.perf_counter()
+            try:
+                status = scenario(client, rng)
+            except Exception as e:
+                status = type(e).__name__
+            timings.append((time.perf_counter() - started) * 1000)
+            counts[status] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Warm-up (logins, first connections) is done; time only the measured requests
+    deadline[0] = time.perf_counter() + (args.duration or 0)
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.close()
+
+    ordered = sorted(t for timings in latencies for t in timings)
+    status_counts = Counter()
+    for counts in statuses:
+        status_counts.update(counts)
+    ok = sum(count for status, count in status_counts.items() if status in (200, 304))
+    # An unknown barcode answers 404 by design
+    if name == "price":
+        ok += status_counts.get(404, 0)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(ordered),
+        "errors": len(ordered) - ok,
+        "status_counts": {str(status): count for status, count in sorted(status_counts.items(), key=str)},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+            "p50": round(percentile(ordered, 50), 3),
+            "p95": round(percentile(ordered, 95), 3),
+            "p99": round(percentile(ordered, 99), 3),
+            "max": round(ordered[-1], 3) if ordered else 0.0,
+        },
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def print_result(result, baseline=None):
+    latency = result["latency_ms"]
+    line = (f"{result['scenario']:<8} c={result['concurrency']:<4} n={result['requests']:<7} "
+            f"err={result['errors']:<5} {result['throughput_rps']:>9.1f} req/s   "
+            f"p50={latency['p50']:>8.2f}  p95={latency['p95']:>8.2f}  p99={latency['p99']:>8.2f} ms")
+    if baseline:
+        def delta(new, old):
+            return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        line += (f"   vs baseline: rps {delta(result['throughput_rps'], baseline['throughput_rps'])}, "
+                 f"p95 {delta(latency['p95'], baseline['latency_ms']['p95'])}, "
+                 f"p99 {delta(latency['p99'], baseline['latency_ms']['p99'])}")
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running Price Scanner server")
+    parser.add_argument("--url", default=os.getenv("LOADTEST_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario and level")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds per scenario and level (overrides --requests)")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--sample", type=int, default=5000, help="Barcodes sampled from the database")
+    parser.add_argument("--miss-ratio", type=float, default=0.05, help="Share of price lookups for unknown barcodes")
+    parser.add_argument("--unique-uploads", action="store_true", help="Send a new PDF each time (prints every one)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help=f"Results file (default {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    barcodes = []
+    if "price" in args.scenarios:
+        try:
+            barcodes = random_barcodes(args.sample)
+        except Exception as e:
+            print(f"Could not sample barcodes ({e}); price lookups will all be misses")
+        print(f"Sampled {len(barcodes)} barcodes")
+
+    results = []
+    for name in args.scenarios:
+        scenario = make_scenario(name, args, barcodes)
+        for concurrency in levels:
+            try:
+                result = run_level(name, scenario, concurrency, args)
+            except Exception as e:
+                print(f"{name} c={concurrency}: failed to run ({e})")
+                continue
+            results.append(result)
+            print_result(result, baseline.get((name, concurrency)))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "url": args.url,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "db_backend": get_backend().name,
+            "stock_query_strategy": STOCK_QUERY_STRATEGY,
+            "client_env": {name: os.getenv(name) for name in (
+                "CATALOG_ENABLED", "SESSION_BACKEND", "DB_POOL_MAX_SIZE", "DB_EXECUTOR_WORKERS"
+            ) if os.getenv(name) is not None},
+            "requests": args.requests,
+            "duration_s": args.duration,
+            "miss_ratio": args.miss_ratio,
+            "sampled_barcodes": len(barcodes),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    if not results:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
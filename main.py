@@ -3,28 +3,68 @@ Price Scanner System - FastAPI Application with Multi-Page Support (Fixed)
 """
 import os
 import socket
-from fastapi import FastAPI, Request, HTTPException, Depends, status
+from fastapi import FastAPI, Request, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, Response, JSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette.middleware.sessions import SessionMiddleware
+from jinja2 import FileSystemBytecodeCache
 from dotenv import load_dotenv
-from database import get_product_by_barcode, test_connection, verify_user_credentials
+from database import (
+    get_product_by_barcode, get_products_by_barcodes, verify_user_credentials,
+    get_pool, close_pool, get_not_found_stats, get_user_cache_stats, invalidate_user, CURRENCY
+)
+from catalog import CATALOG_ENABLED, start_catalog, stop_catalog, get_catalog, get_catalog_stats
+from singleflight import SingleFlight
+from caches import TTLCache
+from app_logging import get_logger, get_logging_stats
+from health import prober
+from executors import (
+    run_db, run_io, run_render, render_executor, get_executor_stats, shutdown_executors, ExecutorBusy
+)
+from invoice_pdf import render_invoice, warm_up as warm_up_renderer
+from print_queue import print_queue
+from price_feed import price_feed
+from sessions import ServerSessionMiddleware, session_store
+from assets import AssetStaticFiles, asset, load_manifest, manifest_stamp
+import metrics
+from metrics import MetricsMiddleware, UPLOADS, UPLOAD_BYTES, UPLOAD_SIZE
+from profiler import PROFILE_ENABLED, ProfilerMiddleware, profiler
+from uploads import PdfUploadStore, UploadRejected, UploadTooLarge, MAX_UPLOAD_BYTES, UPLOAD_DEDUP_WINDOW
 import secrets
-# from printer_utils import print_invoice
-from fastapi import File, UploadFile
-import shutil
+import time
+import gzip
+import json
+import hashlib
+import asyncio
+from urllib.parse import urlparse
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
+log = get_logger("main")
+
 # Get configuration from environment
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8000))
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
 SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
+MAX_BATCH_BARCODES = int(os.getenv("MAX_BATCH_BARCODES", 100))
+MAX_INVOICE_ITEMS = int(os.getenv("MAX_INVOICE_ITEMS", 500))
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", 16))  # Concurrent lookups per scan socket
+MAX_FEED_BARCODES = int(os.getenv("MAX_FEED_BARCODES", 200))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Lets scrapers read /api/metrics with "Authorization: Bearer <token>"
+
+# Browser caching of /api/price: each field's freshness bounds the response's max-age
+PRICE_CACHE_MAX_AGE = int(os.getenv("PRICE_CACHE_MAX_AGE", 60))  # Seconds; 0 = always revalidate
+STOCK_CACHE_MAX_AGE = int(os.getenv("STOCK_CACHE_MAX_AGE", 5))
+PRODUCT_ETAG_TTL = float(os.getenv("PRODUCT_ETAG_TTL", 10))  # Seconds a known ETag answers 304 without a lookup
+PRODUCT_ETAG_CACHE_SIZE = int(os.getenv("PRODUCT_ETAG_CACHE_SIZE", 20000))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", 500))  # Rendered pages kept (one per page per user)
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", 3600))
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join("data", "jinja_cache"))  # Empty = no bytecode cache
+INVOICE_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'Price_Scanner_Invoices')
 
 # Initialize FastAPI
 app = FastAPI(
@@ -33,18 +73,45 @@ app = FastAPI(
     description="Multi-page barcode scanner for price checking with cart functionality"
 )
 
-# Add session middleware
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+# Add session middleware (SESSION_BACKEND=memory/sqlite keeps session data on the server)
+if session_store is not None:
+    app.add_middleware(ServerSessionMiddleware, store=session_store)
+else:
+    app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# On-demand sampling profiler (X-Profile header or a launcher window), only when PROFILE_ENABLED
+if PROFILE_ENABLED:
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
 
-# Initialize templates
-templates = Jinja2Templates(directory="templates")
+# Request metrics; added last so it is outermost and times the whole stack
+app.add_middleware(MetricsMiddleware)
+
+# Mount static files (hashed build output in static/dist is served precompressed and immutable)
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
+
+# Initialize templates (compiled bytecode is kept on disk so restarts skip recompiling)
+bytecode_cache = None
+if TEMPLATE_CACHE_DIR:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+templates = Jinja2Templates(directory="templates", bytecode_cache=bytecode_cache)
+templates.env.globals["asset"] = asset
 
 # Initialize HTTP Basic Auth
 security = HTTPBasic()
 
+# Concurrent scans of the same barcode share one database lookup
+price_lookups = SingleFlight("price")
+
+# barcode -> ETag of the product version last served
+product_etags = TTLCache(PRODUCT_ETAG_CACHE_SIZE, PRODUCT_ETAG_TTL)
+
+# Rendered pages keyed by template and the user fields they show
+page_cache = TTLCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+
+# Streamed, de-duplicated PDF uploads from phones
+upload_store = PdfUploadStore(INVOICE_DIR)
+
 def get_local_ip():
     """Get the local IP address of the machine"""
     try:
@@ -62,6 +129,19 @@ def verify_credentials(username: str, password: str) -> dict:
     """Verify username and password against database"""
     return verify_user_credentials(username, password)
 
+def revoke_user_access(username=None):
+    """Forget cached credentials for a user (or everyone) after their account changed in the database
+    
+    Until this runs, a changed password is only noticed when USER_CACHE_TTL expires, and the old
+    password keeps working for LOGIN_GRACE_WINDOW. Server-side sessions (SESSION_BACKEND=memory/sqlite)
+    of the user are revoked too; signed cookie sessions can't be. Called from the launcher's "Sign Out User".
+    """
+    invalidate_user(username)
+    sessions = None
+    if session_store is not None:
+        sessions = session_store.revoke_user(username) if username else session_store.revoke_all()
+    log.info("User access revoked", user=username or "*", sessions=sessions)
+
 def get_current_user(request: Request):
     """Check if user is authenticated via session"""
     if not request.session.get("authenticated"):
@@ -71,29 +151,99 @@ def get_current_user(request: Request):
         )
     return request.session.get("username")
 
+def require_metrics_access(request: Request):
+    """Logged-in users, or a scraper presenting METRICS_TOKEN as a bearer token"""
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return None
+    return get_current_user(request)
+
 def require_auth(request: Request):
     """Redirect to login if not authenticated"""
     if not request.session.get("authenticated"):
         return RedirectResponse(url="/login", status_code=302)
     return None
 
+def render_page(request: Request, name: str, **context):
+    """Render a page once per distinct context and answer repeat visits with 304"""
+    template = templates.get_template(name)
+    # Pages embed hashed asset URLs, so a rebuilt manifest must miss the cache
+    key = (name, manifest_stamp(), *sorted(context.items()))
+    entry = page_cache.get(key)
+    # A different template object means Jinja reloaded an edited file
+    if entry is None or entry[0] is not template:
+        body = template.render(**context).encode("utf-8")
+        entry = (template, body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+        page_cache.set(key, entry)
+    
+    _, body, etag = entry
+    # Always revalidate: the session decides whether the page may be shown at all
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body, headers=headers)
+
 @app.on_event("startup")
 async def startup_event():
     """Test database connection on startup"""
-    print("Starting Price Scanner System v2.0 with Multi-Page Support...")
-    is_connected, message = test_connection()
+    log.info("Starting Price Scanner System v2.0 with Multi-Page Support...")
+    state = await run_db(prober.probe)
+    is_connected, message = state["is_connected"], state["message"]
     if is_connected:
-        print("✅ Database connection successful")
-        print("🔐 Authentication: Database-based user management")
+        log.success("Database connection successful")
+        log.info("Authentication: Database-based user management")
+        try:
+            await run_db(get_pool().warm)
+        except Exception as e:
+            log.warning("Could not pre-open pooled connections", error=str(e))
+    else:
+        log.error("Database connection failed", error=message)
+    
+    # Keep the cached health state fresh for /api/health and the launcher
+    prober.start()
+    
+    if CATALOG_ENABLED:
+        start_catalog()
+        log.info("Catalog mode: loading products into memory in the background")
+    
+    print_queue.start()
+    
+    # Compile every template now (filling the bytecode cache) instead of on the first page view
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.get_template(name)
+    
+    manifest = load_manifest()
+    if manifest:
+        log.info("Serving built static assets", files=len(manifest))
     else:
-        print(f"❌ Database connection failed: {message}")
+        log.info("No static asset build found; serving source files (run build_assets.py)")
+    
+    # Spawn invoice render workers now so the first print doesn't wait for them
+    if render_executor is not None:
+        try:
+            render_executor.start(initializer=warm_up_renderer)
+        except Exception as e:
+            log.warning("Invoice render pool unavailable", error=str(e))
+    else:
+        warm_up_renderer()
     
     # Display access information
     local_ip = get_local_ip()
     protocol = "https" if (os.path.exists("cert.pem") and os.path.exists("key.pem")) else "http"
-    print(f"🌐 Server accessible at:")
-    print(f"   - Local: {protocol}://localhost:{PORT}")
-    print(f"   - Network: {protocol}://{local_ip}:{PORT}")
+    log.info("Server accessible", local=f"{protocol}://localhost:{PORT}", network=f"{protocol}://{local_ip}:{PORT}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled database connections and worker threads"""
+    prober.stop()
+    price_feed.stop()
+    print_queue.stop()
+    stop_catalog()
+    shutdown_executors()
+    close_pool()
+    if session_store is not None:
+        session_store.close()
 
 # ==================== PAGE ROUTES ====================
 
@@ -112,9 +262,7 @@ async def login_page(request: Request):
     if request.session.get("authenticated"):
         return RedirectResponse(url="/scanner", status_code=302)
     
-    return templates.TemplateResponse("login.html", {
-        "request": request
-    })
+    return render_page(request, "login.html")
 
 @app.get("/scanner", response_class=HTMLResponse)
 async def scanner_page(request: Request):
@@ -123,11 +271,11 @@ async def scanner_page(request: Request):
     if auth_redirect:
         return auth_redirect
     
-    return templates.TemplateResponse("scanner.html", {
-        "request": request,
-        "username": request.session.get("username"),
-        "full_name": request.session.get("full_name")
-    })
+    return render_page(
+        request, "scanner.html",
+        username=request.session.get("username"),
+        full_name=request.session.get("full_name")
+    )
 
 @app.get("/cart", response_class=HTMLResponse)
 async def cart_page(request: Request):
@@ -136,11 +284,11 @@ async def cart_page(request: Request):
     if auth_redirect:
         return auth_redirect
     
-    return templates.TemplateResponse("cart.html", {
-        "request": request,
-        "username": request.session.get("username"),
-        "full_name": request.session.get("full_name")
-    })
+    return render_page(
+        request, "cart.html",
+        username=request.session.get("username"),
+        full_name=request.session.get("full_name")
+    )
 
 @app.get("/info", response_class=HTMLResponse)
 async def info_page(request: Request):
@@ -149,11 +297,11 @@ async def info_page(request: Request):
     if auth_redirect:
         return auth_redirect
     
-    return templates.TemplateResponse("info.html", {
-        "request": request,
-        "username": request.session.get("username"),
-        "full_name": request.session.get("full_name")
-    })
+    return render_page(
+        request, "info.html",
+        username=request.session.get("username"),
+        full_name=request.session.get("full_name")
+    )
 
 # ==================== API ROUTES ====================
 
@@ -173,7 +321,7 @@ async def login(request: Request):
             )
         
         # Verify credentials against database
-        auth_result = verify_credentials(username, password)
+        auth_result = await run_db(verify_credentials, username, password)
         
         if auth_result["success"]:
             # Set session
@@ -195,6 +343,11 @@ async def login(request: Request):
             )
     except HTTPException:
         raise
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="الخادم مشغول، يرجى المحاولة مرة أخرى"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -202,18 +355,23 @@ async def login(request: Request):
         )
 
 @app.post("/api/logout")
-async def logout(request: Request):
-    """Handle logout - Enhanced version with better error handling"""
+async def logout(request: Request, everywhere: bool = False):
+    """Handle logout - Enhanced version with better error handling
+    
+    ?everywhere=1 also ends the user's sessions on other devices (server-side sessions only).
+    """
     try:
-        # Log the logout attempt
+        # Remember who is logging out
         username = request.session.get("username", "unknown")
-        print(f"Logout attempt for user: {username}")
         
         # Clear all session data
-        session_data = dict(request.session)
         request.session.clear()
         
-        print(f"Cleared session data: {session_data}")
+        # Forget the remembered login so the grace window can't sign this user back in with it
+        if username != "unknown":
+            invalidate_user(username)
+            if everywhere and session_store is not None:
+                await run_io(session_store.revoke_user, username)
         
         # Return success response
         response_data = {
@@ -222,11 +380,11 @@ async def logout(request: Request):
             "redirect_url": "/login"
         }
         
-        print(f"Logout successful for user: {username}")
+        log.info("Logout", user=username)
         return response_data
         
     except Exception as e:
-        print(f"Logout error: {str(e)}")
+        log.error("Logout error", error=str(e))
         # Even if there's an error, we should still try to clear the session
         try:
             request.session.clear()
@@ -251,17 +409,15 @@ async def auth_status(request: Request):
         username = request.session.get("username")
         full_name = request.session.get("full_name")
         
-        # Log the auth check for debugging
-        print(f"Auth status check - Authenticated: {is_authenticated}, User: {username}")
+        log.sample("Auth status check", authenticated=is_authenticated, user=username)
         
         return {
             "authenticated": is_authenticated,
             "username": username,
-            "full_name": full_name,
-            "session_id": request.session.get("session_id", "none")  # For debugging
+            "full_name": full_name
         }
     except Exception as e:
-        print(f"Auth status check error: {str(e)}")
+        log.error("Auth status check error", error=str(e))
         return {
             "authenticated": False,
             "username": None,
@@ -269,8 +425,31 @@ async def auth_status(request: Request):
             "error": str(e)
         }
 
+async def lookup_price(clean_barcode):
+    """Product dict or None; concurrent lookups of one barcode share a database call"""
+    return await price_lookups.do(
+        clean_barcode, lambda: run_db(get_product_by_barcode, clean_barcode)
+    )
+
+def product_etag(product):
+    """Stable ETag from the fields that change: price, stock and name"""
+    version = f"{product['barcode']}|{product['price']}|{product['stock_qty']}|{product['product_name']}"
+    return '"' + hashlib.sha1(version.encode("utf-8")).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    return "*" in tags or etag in tags
+
+def product_cache_headers(etag):
+    max_age = min(PRICE_CACHE_MAX_AGE, STOCK_CACHE_MAX_AGE)
+    cache_control = f"private, max-age={max_age}" if max_age > 0 else "private, no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
 @app.get("/api/price/{barcode}")
-async def get_price(barcode: str, current_user: str = Depends(get_current_user)):
+async def get_price(barcode: str, request: Request, current_user: str = Depends(get_current_user)):
     """Get product price by barcode - requires authentication"""
     try:
         # Validate barcode
@@ -280,19 +459,127 @@ async def get_price(barcode: str, current_user: str = Depends(get_current_user))
         # Clean barcode
         clean_barcode = barcode.strip()
         
+        # Client already holds the version we served recently: no lookup needed
+        if_none_match = request.headers.get("if-none-match")
+        known_etag = product_etags.get(clean_barcode) if if_none_match else None
+        if known_etag and etag_matches(if_none_match, known_etag):
+            return Response(status_code=304, headers=product_cache_headers(known_etag))
+        
         # Get product from database
-        product = get_product_by_barcode(clean_barcode)
+        product = await lookup_price(clean_barcode)
         
         if product is None:
+            product_etags.invalidate(clean_barcode)
             raise HTTPException(status_code=404, detail="Product not found")
         
-        return product
+        etag = product_etag(product)
+        product_etags.set(clean_barcode, etag)
+        headers = product_cache_headers(etag)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=product, headers=headers)
+        
+    except HTTPException:
+        raise
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.post("/api/prices")
+async def get_prices(request: Request, current_user: str = Depends(get_current_user)):
+    """Look up several barcodes in one request - requires authentication"""
+    try:
+        data = await request.json()
+        barcodes = data.get("barcodes") if isinstance(data, dict) else None
+        
+        if not isinstance(barcodes, list) or not barcodes:
+            raise HTTPException(status_code=400, detail="barcodes must be a non-empty list")
+        if len(barcodes) > MAX_BATCH_BARCODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many barcodes (max {MAX_BATCH_BARCODES})"
+            )
+        
+        clean_barcodes = [str(barcode).strip() if barcode is not None else "" for barcode in barcodes]
+        lookup = [barcode for barcode in clean_barcodes if barcode]
+        products = await run_db(get_products_by_barcodes, lookup) if lookup else {}
+        
+        # One entry per requested barcode, in request order, mirroring /api/price status codes
+        results = []
+        for barcode in clean_barcodes:
+            if not barcode:
+                results.append({"barcode": barcode, "status": 400, "detail": "Barcode cannot be empty"})
+            elif products.get(barcode) is None:
+                results.append({"barcode": barcode, "status": 404, "detail": "Product not found"})
+            else:
+                results.append({"barcode": barcode, "status": 200, "product": products[barcode]})
+        
+        return {"results": results}
         
     except HTTPException:
         raise
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@app.get("/api/price-feed")
+async def get_price_feed(request: Request, barcodes: str = "", current_user: str = Depends(get_current_user)):
+    """Server-Sent Events: price/stock changes for the comma-separated barcodes in a cart"""
+    watched = {barcode.strip() for barcode in barcodes.split(",") if barcode.strip()}
+    if not watched:
+        raise HTTPException(status_code=400, detail="barcodes must be a non-empty list")
+    if len(watched) > MAX_FEED_BARCODES:
+        raise HTTPException(status_code=400, detail=f"Too many barcodes (max {MAX_FEED_BARCODES})")
+    
+    return StreamingResponse(
+        price_feed.stream(watched, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Last full offline export: ((catalog epoch, version), gzip body)
+catalog_export_cache = {"key": None, "body": None}
+
+def build_catalog_export(catalog, since, epoch):
+    """(epoch, version, gzip-compressed JSON) of the offline catalog or its changes since a version"""
+    if since is None and catalog_export_cache["key"] == (catalog.epoch, catalog.version):
+        return catalog.epoch, catalog.version, catalog_export_cache["body"]
+    
+    data = catalog.export(since, epoch)
+    data["currency"] = CURRENCY
+    body = gzip.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+    if data["full"]:
+        catalog_export_cache["key"] = (data["epoch"], data["version"])
+        catalog_export_cache["body"] = body
+    return data["epoch"], data["version"], body
+
+@app.get("/api/catalog/export")
+async def export_catalog(request: Request, since: int = None, epoch: str = None,
+                         current_user: str = Depends(get_current_user)):
+    """Compressed catalog for offline scanning; with ?since=<version>&epoch=<epoch> only the changes after it
+    
+    A version is only meaningful within its epoch (one full load of the catalog, e.g. one server run);
+    a missing or different epoch always gets a full export.
+    """
+    catalog = get_catalog()
+    if catalog is None or not catalog.loaded:
+        raise HTTPException(status_code=503, detail="Offline catalog unavailable (catalog mode is off or still loading)")
+    
+    try:
+        epoch, version, body = await run_io(build_catalog_export, catalog, since, epoch)
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    
+    headers = {"Cache-Control": "no-cache", "X-Catalog-Version": str(version), "X-Catalog-Epoch": epoch,
+               "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = await run_io(gzip.decompress, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/app-url")
 async def get_app_url(current_user: str = Depends(get_current_user)):
     """Get the application access URL - requires authentication"""
@@ -319,44 +606,126 @@ async def get_app_url(current_user: str = Depends(get_current_user)):
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint - no authentication required"""
-    is_connected, message = test_connection()
+    """Health check endpoint - no authentication required
     
+    Only says whether the database is reachable; the internals are in /api/health/details.
+    """
+    is_connected = prober.snapshot()["is_connected"]
+    return {
+        "status": "healthy" if is_connected else "unhealthy",
+        "database": "connected" if is_connected else "disconnected"
+    }
+
+@app.get("/api/health/details")
+async def health_details(deep: bool = False, current_user: str = Depends(get_current_user)):
+    """Pool, executor, cache and queue stats for logged-in users
+    
+    Answers from the background prober's cached state; ?deep=1 forces a live check.
+    """
+    state = prober.snapshot()
+    if deep:
+        try:
+            state = await run_db(prober.probe)
+        except ExecutorBusy:
+            pass
+    
+    is_connected = state["is_connected"]
     return {
         "status": "healthy" if is_connected else "unhealthy",
         "database": "connected" if is_connected else "disconnected",
-        "message": message
+        "message": state["message"],
+        "latency_ms": state["latency_ms"],
+        "last_check": state["last_check"],
+        "last_success": state["last_success"],
+        "consecutive_failures": state["consecutive_failures"],
+        "pool": state["pool"],
+        "executors": get_executor_stats(),
+        "catalog": get_catalog_stats(),
+        "not_found_cache": get_not_found_stats(),
+        "user_cache": get_user_cache_stats(),
+        "print_queue": print_queue.stats(),
+        "uploads": upload_store.stats(),
+        "scan_channel": scan_channel_stats,
+        "price_feed": price_feed.stats(),
+        "coalesced_lookups": price_lookups.stats(),
+        "product_etags": product_etags.stats(),
+        "page_cache": page_cache.stats(),
+        "profiler": profiler.stats(),
+        "logging": get_logging_stats(),
+        "sessions": session_store.stats() if session_store is not None else {"backend": "cookie"}
     }
 
-# @app.post("/api/print-invoice")
-# async def print_invoice_on_host(request: Request, current_user: str = Depends(get_current_user)):
-    """Print invoice on host PC's default printer"""
+@app.get("/api/metrics")
+async def metrics_endpoint(format: str = "prometheus", current_user: str = Depends(require_metrics_access)):
+    """Prometheus metrics - requires login or the METRICS_TOKEN bearer token
+    
+    ?format=json returns the per-route/per-query summary shown on the info page.
+    """
+    if format == "json":
+        return metrics.summary()
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+def parse_invoice_items(cart_items):
+    """Validate cart JSON into the plain dicts invoice_pdf expects (amounts are all shown in CURRENCY)"""
+    if not isinstance(cart_items, list) or not cart_items:
+        raise HTTPException(status_code=400, detail="السلة فارغة")
+    if len(cart_items) > MAX_INVOICE_ITEMS:
+        raise HTTPException(status_code=400, detail=f"عدد العناصر يتجاوز الحد ({MAX_INVOICE_ITEMS})")
+    
+    items = []
+    for entry in cart_items:
+        try:
+            items.append({
+                "barcode": str(entry["barcode"]).strip(),
+                "product_name": str(entry.get("product_name") or entry["barcode"]),
+                "price": float(entry["price"]),
+                "quantity": int(entry["quantity"]),
+            })
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise HTTPException(status_code=400, detail="بيانات السلة غير صالحة")
+    return items
+
+def save_invoice(pdf_bytes, path):
+    """Write rendered PDF bytes to disk"""
+    with open(path, "wb") as f:
+        f.write(pdf_bytes)
+
+@app.post("/api/print-invoice")
+async def print_invoice_on_host(request: Request, current_user: str = Depends(get_current_user)):
+    """Render the cart as a PDF on the server and print it on the host PC's default printer"""
     try:
         # Get cart data from request
         data = await request.json()
-        cart_items = data.get('cart', [])
-        
-        if not cart_items:
-            raise HTTPException(status_code=400, detail="السلة فارغة")
+        items = parse_invoice_items(data.get('cart', []) if isinstance(data, dict) else None)
         
         # Get username for invoice
         username = current_user or "Unknown User"
         
-        # Print invoice
-        success, message, pdf_path = print_invoice(cart_items, username)
+        # Render in the process pool, then save and print on the thread pools
+        pdf_bytes = await run_render(render_invoice, items, username, datetime.now(), CURRENCY)
         
-        if success:
-            return {
-                "success": True,
-                "message": "تم إرسال الفاتورة للطباعة بنجاح",
-                "printer_message": message
-            }
-        else:
-            raise HTTPException(status_code=500, detail=message)
+        os.makedirs(INVOICE_DIR, exist_ok=True)
+        pdf_path = os.path.join(INVOICE_DIR, f"Invoice_{datetime.now():%Y%m%d_%H%M%S_%f}.pdf")
+        await run_io(save_invoice, pdf_bytes, pdf_path)
+        
+        log.info("Invoice rendered", path=pdf_path, items=len(items), bytes=len(pdf_bytes), user=current_user)
+        
+        # Printing happens on the print queue's worker; the client polls the job
+        job = await run_io(print_queue.submit, pdf_path, current_user)
+        return {
+            "success": True,
+            "message": "تمت إضافة الفاتورة إلى قائمة الطباعة",
+            "job_id": job["id"],
+            "status": job["status"],
+            "file_path": pdf_path
+        }
             
     except HTTPException:
         raise
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="الخادم مشغول، يرجى المحاولة مرة أخرى")
     except Exception as e:
+        log.error("Invoice print failed", user=current_user, error=str(e))
         raise HTTPException(
             status_code=500,
             detail=f"خطأ في الطباعة: {str(e)}"
@@ -364,51 +733,178 @@ async def health_check():
     
 @app.post("/api/upload-and-print")
 async def upload_and_print_pdf(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: str = Depends(get_current_user)
 ):
     """Receive PDF from phone and print it on host PC"""
     try:
-        # Validate file type
-        if not file.filename.endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-        
-        # Create directory for uploaded invoices
-        upload_dir = os.path.join(os.path.expanduser('~'), 'Documents', 'Price_Scanner_Invoices')
-        os.makedirs(upload_dir, exist_ok=True)
+        # Stream the PDF to disk (size-capped, hashed on the way in)
+        upload = await upload_store.receive(request)
+        UPLOADS.labels("true" if upload.duplicate else "false").inc()
+        UPLOAD_BYTES.inc(upload.size)
+        UPLOAD_SIZE.observe(upload.size)
         
-        # Save uploaded PDF
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        pdf_filename = f"Invoice_Uploaded_{timestamp}.pdf"
-        pdf_path = os.path.join(upload_dir, pdf_filename)
+        # Re-upload of a recently queued invoice: report the existing job instead of printing again
+        if upload.duplicate:
+            job = await run_io(print_queue.find_latest, upload.path)
+            if job and job["status"] != "failed" and time.time() - job["created_at"] < UPLOAD_DEDUP_WINDOW:
+                return {
+                    "success": True,
+                    "message": "تم استلام هذه الفاتورة مسبقاً",
+                    "job_id": job["id"],
+                    "status": job["status"],
+                    "duplicate": True,
+                    "file_path": upload.path
+                }
         
-        # Write file
-        with open(pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        log.info("PDF received and saved", path=upload.path, bytes=upload.size, duplicate=upload.duplicate,
+                 user=current_user)
         
-        print(f"PDF received and saved: {pdf_path}")
-        
-        # Print the PDF
-        from printer_utils import print_pdf_to_default_printer
-        success, action, message = print_pdf_to_default_printer(pdf_path)
-        
-        if success:
-            return {
-                "success": True,
-                "message": "تم استلام الفاتورة وإرسالها للطباعة",
-                "file_path": pdf_path
-            }
-        else:
-            raise HTTPException(status_code=500, detail=message)
+        # Queue the PDF for printing
+        job = await run_io(print_queue.submit, upload.path, current_user)
+        return {
+            "success": True,
+            "message": "تم استلام الفاتورة وإضافتها إلى قائمة الطباعة",
+            "job_id": job["id"],
+            "status": job["status"],
+            "duplicate": upload.duplicate,
+            "file_path": upload.path
+        }
             
     except HTTPException:
         raise
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"حجم الملف يتجاوز الحد المسموح ({MAX_UPLOAD_BYTES / (1024 * 1024):g} MB)")
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="الخادم مشغول، يرجى المحاولة مرة أخرى")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"خطأ في استقبال أو طباعة الملف: {str(e)}"
         )
 
+@app.get("/api/print-jobs/{job_id}")
+async def get_print_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """Status of a queued print job"""
+    job = await run_io(print_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="مهمة الطباعة غير موجودة")
+    return job
+
+# ==================== SCAN CHANNEL ====================
+
+scan_channel_stats = {"connections": 0, "active": 0, "lookups": 0, "rejected": 0}
+
+def same_origin(websocket: WebSocket):
+    """Browsers always send Origin on WebSockets; refuse pages from other sites using our cookie"""
+    origin = websocket.headers.get("origin")
+    if not origin:
+        return True
+    return urlparse(origin).netloc == websocket.headers.get("host")
+
+async def answer_scan(websocket: WebSocket, send_lock, request_id, barcode, in_flight):
+    """Look up one barcode and reply with the same shape as a /api/prices result"""
+    try:
+        clean_barcode = str(barcode).strip() if barcode is not None else ""
+        if not clean_barcode:
+            reply = {"id": request_id, "status": 400, "detail": "Barcode cannot be empty"}
+        else:
+            product = await lookup_price(clean_barcode)
+            if product is None:
+                reply = {"id": request_id, "status": 404, "detail": "Product not found"}
+            else:
+                reply = {"id": request_id, "status": 200, "product": product}
+    except ExecutorBusy:
+        reply = {"id": request_id, "status": 503, "detail": "Server busy, please retry"}
+    except Exception as e:
+        reply = {"id": request_id, "status": 500, "detail": f"Database error: {str(e)}"}
+    finally:
+        in_flight.discard(asyncio.current_task())
+    
+    try:
+        async with send_lock:
+            await websocket.send_json(reply)
+    except Exception:
+        pass  # Client went away; its pending lookups fall back to HTTP
+
+async def session_still_valid(websocket: WebSocket):
+    """Whether the session a socket was opened with hasn't been logged out or revoked since
+    
+    Signed cookie sessions (SESSION_BACKEND=cookie) can't be revoked, so they stay valid.
+    """
+    if session_store is None:
+        return True
+    session_id = websocket.scope.get("session_id")
+    if session_id is None:
+        return False
+    if session_store.is_cached(session_id):
+        data, _ = session_store.load(session_id)
+    else:
+        try:
+            data, _ = await run_io(session_store.load, session_id)
+        except ExecutorBusy:
+            data, _ = session_store.load(session_id)
+    return bool(data and data.get("authenticated")
+                and data.get("username") == websocket.session.get("username"))
+
+@app.websocket("/ws/scan")
+async def scan_channel(websocket: WebSocket):
+    """Persistent lookup channel: {"id", "barcode"} in, {"id", "status", "product"|"detail"} out"""
+    if not same_origin(websocket):
+        await websocket.close(code=4403)
+        return
+    if not websocket.session.get("authenticated"):
+        await websocket.close(code=4401)
+        return
+    
+    await websocket.accept()
+    scan_channel_stats["connections"] += 1
+    scan_channel_stats["active"] += 1
+    send_lock = asyncio.Lock()
+    in_flight = set()
+    
+    try:
+        while True:
+            text = await websocket.receive_text()
+            if not await session_still_valid(websocket):
+                await websocket.close(code=4401)
+                return
+            try:
+                message = json.loads(text)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                async with send_lock:
+                    await websocket.send_json({"id": None, "status": 400, "detail": "Invalid message"})
+                continue
+            if message.get("type") == "ping":
+                async with send_lock:
+                    await websocket.send_json({"type": "pong"})
+                continue
+            
+            request_id = message.get("id")
+            if len(in_flight) >= WS_MAX_IN_FLIGHT:
+                scan_channel_stats["rejected"] += 1
+                async with send_lock:
+                    await websocket.send_json({"id": request_id, "status": 429, "detail": "Too many lookups in flight"})
+                continue
+            
+            scan_channel_stats["lookups"] += 1
+            task = asyncio.create_task(
+                answer_scan(websocket, send_lock, request_id, message.get("barcode"), in_flight)
+            )
+            in_flight.add(task)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log.warning("Scan channel closed", user=websocket.session.get("username"), error=str(e))
+    finally:
+        scan_channel_stats["active"] -= 1
+        for task in list(in_flight):
+            task.cancel()
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,290 @@
+"""
+Prometheus-style metrics
+Counters and fixed-bucket histograms kept in process and rendered in the
+text exposition format by /api/metrics. Each labelled series has its own
+small lock, so threads only ever contend on the series they update.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+PREFIX = "price_scanner_"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2, 25 * 1024 ** 2)
+PRINT_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _CounterSeries:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Estimate like PromQL's histogram_quantile: linear within the bucket"""
+        counts, _, count = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index >= len(self.buckets):
+                    return self.buckets[-1]  # Above the top bucket: its bound is all we know
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+class _Family:
+    """A metric name with its labelled series"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._new_series()
+        return series
+
+    def series(self):
+        with self._lock:
+            return sorted(self._series.items())
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, series in self.series():
+            self._render_series(lines, values, series)
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_series(self, lines, values, series):
+        lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(series.value)}")
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_series(self, lines, values, series):
+        counts, total, count = series.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+
+REGISTRY = []
+
+# ==================== METRICS ====================
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("route", "method"))
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Database query time by query type", ("query",))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Failed database queries by query type", ("query",))
+DB_CONNECT_SECONDS = Histogram("db_connect_duration_seconds", "Time to open a new database connection")
+UPLOADS = Counter("uploads_total", "PDF uploads received", ("duplicate",))
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in PDF uploads")
+UPLOAD_SIZE = Histogram("upload_size_bytes", "Size of uploaded PDFs", buckets=SIZE_BUCKETS)
+PRINT_JOB_SECONDS = Histogram("print_job_duration_seconds", "Print job time including retries", ("status",),
+                              buckets=PRINT_BUCKETS)
+
+_started_at = time.time()
+
+@contextmanager
+def track_query(name):
+    """Time a database query under `name`, counting it as an error if it raises"""
+    series = DB_QUERY_SECONDS.labels(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(name).inc()
+        raise
+    finally:
+        series.observe(time.perf_counter() - started)
+
+def render():
+    """All metrics in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for family in REGISTRY:
+        family.render(lines)
+    lines.append(f"# HELP {PREFIX}process_start_time_seconds Start time of the server process")
+    lines.append(f"# TYPE {PREFIX}process_start_time_seconds gauge")
+    lines.append(f"{PREFIX}process_start_time_seconds {_format_value(_started_at)}")
+    return "\n".join(lines) + "\n"
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+def summary():
+    """Compact JSON view for the info page"""
+    statuses = {}
+    for (route, method, status), series in HTTP_REQUESTS.series():
+        entry = statuses.setdefault((route, method), {"errors": 0})
+        if status.startswith("5"):
+            entry["errors"] += series.value
+
+    routes = []
+    for (route, method), series in HTTP_REQUEST_SECONDS.series():
+        _, total, count = series.snapshot()
+        routes.append({
+            "route": route,
+            "method": method,
+            "count": count,
+            "errors": statuses.get((route, method), {}).get("errors", 0),
+            "avg_ms": _ms(total / count) if count else None,
+            "p50_ms": _ms(series.quantile(0.5)),
+            "p95_ms": _ms(series.quantile(0.95)),
+        })
+    routes.sort(key=lambda entry: entry["count"], reverse=True)
+
+    errors = {query: series.value for (query,), series in DB_QUERY_ERRORS.series()}
+    queries = []
+    for (query,), series in DB_QUERY_SECONDS.series():
+        _, total, count = series.snapshot()
+        queries.append({
+            "query": query,
+            "count": count,
+            "errors": errors.get(query, 0),
+            "avg_ms": _ms(total / count) if count else None,
+            "p95_ms": _ms(series.quantile(0.95)),
+        })
+
+    connect = DB_CONNECT_SECONDS.labels()
+    _, connect_total, connect_count = connect.snapshot()
+    prints = []
+    for (status,), series in PRINT_JOB_SECONDS.series():
+        _, total, count = series.snapshot()
+        prints.append({"status": status, "count": count, "avg_s": round(total / count, 2) if count else None})
+
+    return {
+        "uptime_s": round(time.time() - _started_at),
+        "routes": routes,
+        "queries": queries,
+        "db_connect": {"count": connect_count, "avg_ms": _ms(connect_total / connect_count) if connect_count else None},
+        "uploads": {"count": sum(series.value for _, series in UPLOADS.series()), "bytes": UPLOAD_BYTES.labels().value},
+        "prints": prints,
+    }
+
+class MetricsMiddleware:
+    """Records latency and status per route template (not per raw path, to bound cardinality)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_names = None
+
+    def _route_name(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_names is None or endpoint not in self._route_names:
+            # Routes are fixed after startup; map each endpoint (or mounted app) to its path template
+            self._route_names = {
+                getattr(route, "endpoint", None) or getattr(route, "app", None): route.path
+                for route in scope["app"].routes
+            }
+        return self._route_names.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = self._route_name(scope)
+            HTTP_REQUEST_SECONDS.labels(route, scope["method"]).observe(elapsed)
+            HTTP_REQUESTS.labels(route, scope["method"], str(status[0])).inc()
@@ -0,0 +1,175 @@
+"""
+Price/stock change feed for open carts (Server-Sent Events)
+Clients subscribe to the barcodes in their cart. One poller re-checks the
+union of all subscribed barcodes on a timer and fans each change out to
+the subscribers watching that barcode, so overlapping carts share lookups.
+"""
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+from database import get_products_by_barcodes
+from executors import run_db, ExecutorBusy
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("price_feed")
+
+PRICE_FEED_INTERVAL = float(os.getenv("PRICE_FEED_INTERVAL", 10))  # Seconds between checks
+PRICE_FEED_BATCH = int(os.getenv("PRICE_FEED_BATCH", 500))  # Barcodes per database round trip
+PRICE_FEED_QUEUE = int(os.getenv("PRICE_FEED_QUEUE", 50))  # Pending events per subscriber
+PRICE_FEED_HEARTBEAT = float(os.getenv("PRICE_FEED_HEARTBEAT", 20))  # Seconds between keep-alive comments
+
+def _snapshot(product):
+    return (product["price"], product["stock_qty"], product["product_name"])
+
+def _change(barcode, product):
+    return {
+        "barcode": barcode,
+        "price": product["price"],
+        "stock_qty": product["stock_qty"],
+        "product_name": product["product_name"],
+    }
+
+class Subscriber:
+    """One open feed: the barcodes it watches and its outgoing event queue"""
+
+    def __init__(self, barcodes):
+        self.barcodes = frozenset(barcodes)
+        self.queue = asyncio.Queue(PRICE_FEED_QUEUE)
+        self.dropped = 0
+
+    def push(self, changes):
+        try:
+            self.queue.put_nowait(changes)
+        except asyncio.QueueFull:
+            # A stuck client loses events rather than growing memory; it resyncs on reconnect
+            self.dropped += 1
+
+class PriceFeed:
+    """Shared poller plus fan-out to per-client queues"""
+
+    def __init__(self, interval=PRICE_FEED_INTERVAL):
+        self.interval = interval
+        self._subscribers = set()
+        self._watchers = {}  # barcode -> number of subscribers watching it
+        self._known = {}     # barcode -> (price, stock_qty, product_name) last seen
+        self._task = None
+
+        # Stats
+        self.checks = 0
+        self.barcodes_checked = 0
+        self.changes = 0
+        self.events_sent = 0
+        self.errors = 0
+
+    def subscribe(self, barcodes):
+        """Register a subscriber; it only gets changes (the page loads current values via /api/prices)"""
+        subscriber = Subscriber(barcodes)
+        self._subscribers.add(subscriber)
+        for barcode in subscriber.barcodes:
+            self._watchers[barcode] = self._watchers.get(barcode, 0) + 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber not in self._subscribers:
+            return
+        self._subscribers.discard(subscriber)
+        for barcode in subscriber.barcodes:
+            remaining = self._watchers.get(barcode, 0) - 1
+            if remaining > 0:
+                self._watchers[barcode] = remaining
+            else:
+                self._watchers.pop(barcode, None)
+                self._known.pop(barcode, None)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def check(self):
+        """Look up every watched barcode once and push what changed"""
+        watched = list(self._watchers)
+        if not watched:
+            return
+        self.checks += 1
+        self.barcodes_checked += len(watched)
+
+        changed = {}
+        for start in range(0, len(watched), PRICE_FEED_BATCH):
+            batch = watched[start:start + PRICE_FEED_BATCH]
+            products = await run_db(get_products_by_barcodes, batch)
+            for barcode in batch:
+                product = products.get(barcode)
+                # None is "not found" or a failed query; neither is worth pushing to a cart
+                if product is None or barcode not in self._watchers:
+                    continue
+                value = _snapshot(product)
+                known = self._known.get(barcode)
+                self._known[barcode] = value
+                # The first value seen is only the baseline for later changes
+                if known is not None and known != value:
+                    changed[barcode] = _change(barcode, product)
+
+        if not changed:
+            return
+        self.changes += len(changed)
+        for subscriber in list(self._subscribers):
+            events = [change for barcode, change in changed.items() if barcode in subscriber.barcodes]
+            if events:
+                subscriber.push(events)
+                self.events_sent += 1
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                await self.check()
+            except ExecutorBusy:
+                self.errors += 1
+            except Exception as e:
+                self.errors += 1
+                log.warning("Price feed check failed", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    async def stream(self, barcodes, is_disconnected):
+        """SSE body for one subscriber: change events plus keep-alive comments
+        
+        Subscribes when the body starts streaming rather than when the response is built,
+        so a response that is never streamed (client gone first) never leaves a subscriber
+        behind; from then on the finally block unsubscribes it however the stream ends.
+        """
+        subscriber = self.subscribe(barcodes)
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            while True:
+                try:
+                    events = await asyncio.wait_for(subscriber.queue.get(), PRICE_FEED_HEARTBEAT)
+                    yield f"event: prices\ndata: {json.dumps({'changes': events}, ensure_ascii=False)}\n\n"
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "watched_barcodes": len(self._watchers),
+            "interval_s": self.interval,
+            "checks": self.checks,
+            "barcodes_checked": self.barcodes_checked,
+            "changes": self.changes,
+            "events_sent": self.events_sent,
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers),
+            "errors": self.errors,
+        }
+
+# Shared feed for the server
+price_feed = PriceFeed()
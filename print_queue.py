@@ -0,0 +1,290 @@
+"""
+Persistent print queue
+Requests enqueue a job and return its id at once; one worker thread prints
+jobs in submission order, retrying failures with exponential backoff. Jobs
+live in a small SQLite file so queued work survives a restart.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from printer_utils import get_printer_backend, PrinterNotConfigured
+from app_logging import get_logger
+from metrics import PRINT_JOB_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("print_queue")
+
+PRINT_QUEUE_DB = os.getenv("PRINT_QUEUE_DB", os.path.join("data", "print_jobs.db"))
+PRINT_MAX_ATTEMPTS = int(os.getenv("PRINT_MAX_ATTEMPTS", 4))
+PRINT_RETRY_BASE = float(os.getenv("PRINT_RETRY_BASE", 2))      # Seconds before the first retry
+PRINT_RETRY_MAX = float(os.getenv("PRINT_RETRY_MAX", 60))       # Cap on the backoff delay
+PRINTER_CHECK_INTERVAL = float(os.getenv("PRINTER_CHECK_INTERVAL", 60))  # Seconds between availability checks
+PRINT_JOB_RETENTION = float(os.getenv("PRINT_JOB_RETENTION", 7 * 24 * 3600))  # Finished jobs kept this long
+
+PENDING_STATES = ("queued", "printing", "retrying")
+
+class PrintQueue:
+    """FIFO of print jobs backed by SQLite, drained by a single worker thread"""
+
+    def __init__(self, db_path=PRINT_QUEUE_DB, backend=None):
+        self.db_path = db_path
+        self.backend = backend or get_printer_backend()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = deque()  # Job ids in submission order
+        self._stop = threading.Event()
+        self._worker = None
+        self._checker = None
+        self._db = None
+
+        # Cached printer availability, refreshed in the background
+        self.printer_available = None
+        self.printer_checked_at = None
+
+        # Stats
+        self.printed = 0
+        self.failed = 0
+        self.retries = 0
+        self.total_print_s = 0.0
+
+    # ---- storage ----
+
+    def _connect(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS print_jobs (
+                id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                username TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                action TEXT,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                duration_ms REAL
+            )
+        """)
+        return db
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE print_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    # ---- lifecycle ----
+
+    def start(self):
+        """Open the job store, re-queue unfinished jobs and start the threads (idempotent)"""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._db = self._connect()
+            self._db.execute("DELETE FROM print_jobs WHERE status NOT IN (?, ?, ?) AND updated_at < ?",
+                             (*PENDING_STATES, time.time() - PRINT_JOB_RETENTION))
+            rows = self._db.execute(
+                "SELECT id FROM print_jobs WHERE status IN (?, ?, ?) ORDER BY created_at",
+                PENDING_STATES
+            ).fetchall()
+            self._pending.extend(row[0] for row in rows)
+            self._stop.clear()
+            self._checker = threading.Thread(target=self._check_loop, name="printer-check", daemon=True)
+            self._worker = threading.Thread(target=self._work_loop, name="print-worker", daemon=True)
+        if self.backend.name == "none":
+            log.warning("No printer configured, print jobs will fail; set PRINTER_BACKEND")
+        elif self.backend.name == "file":
+            log.warning("Print jobs are copied to a folder, not printed", dir=self.backend.directory)
+        if rows:
+            log.info("Resuming unfinished print jobs", count=len(rows))
+        self._checker.start()
+        self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in (self._worker, self._checker):
+            if thread:
+                thread.join(timeout=2)
+        with self._lock:
+            self._worker = self._checker = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ---- API ----
+
+    def submit(self, path, username=None):
+        """Queue a PDF for printing; returns the new job's status dict"""
+        if self._db is None:
+            self.start()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._wakeup:
+            self._db.execute(
+                "INSERT INTO print_jobs (id, path, username, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, path, username, "queued", now, now)
+            )
+            self._pending.append(job_id)
+            position = len(self._pending)
+            self._wakeup.notify()
+        log.info("Print job queued", job=job_id, path=path, position=position)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Status dict for a job, or None if unknown"""
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT id, path, username, status, attempts, action, message, created_at, updated_at, duration_ms "
+                "FROM print_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            position = (list(self._pending).index(job_id) + 1) if job_id in self._pending else None
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "file_name": os.path.basename(row[1]),
+            "username": row[2],
+            "status": row[3],
+            "attempts": row[4],
+            "action": row[5],
+            "message": row[6],
+            "created_at": row[7],
+            "updated_at": row[8],
+            "duration_ms": row[9],
+            "position": position,
+        }
+
+    def find_latest(self, path):
+        """Status dict of the newest job for path, or None"""
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT id FROM print_jobs WHERE path = ? ORDER BY created_at DESC LIMIT 1", (path,)
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._pending)
+        done = self.printed + self.failed
+        return {
+            "backend": self.backend.name,
+            "printer_available": self.printer_available,
+            "printer_checked_age_s": round(time.time() - self.printer_checked_at, 1) if self.printer_checked_at else None,
+            "queued": queued,
+            "printed": self.printed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "avg_print_ms": round(self.total_print_s / done * 1000, 1) if done else 0.0,
+        }
+
+    # ---- threads ----
+
+    def refresh_printer(self):
+        """Re-check printer availability and cache the result"""
+        try:
+            available = bool(self.backend.is_available())
+        except Exception as e:
+            log.warning("Printer check failed", error=str(e))
+            available = False
+        if available != self.printer_available:
+            log.info("Printer availability changed", available=available, backend=self.backend.name)
+        self.printer_available = available
+        self.printer_checked_at = time.time()
+        return available
+
+    def _check_loop(self):
+        self.refresh_printer()
+        while not self._stop.wait(PRINTER_CHECK_INTERVAL):
+            self.refresh_printer()
+
+    def _next_job(self):
+        with self._wakeup:
+            while not self._pending and not self._stop.is_set():
+                self._wakeup.wait()
+            return self._pending[0] if self._pending else None
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            job_id = self._next_job()
+            if job_id is None:
+                continue
+            self._run_job(job_id)
+            with self._lock:
+                if self._pending and self._pending[0] == job_id:
+                    self._pending.popleft()
+
+    def _run_job(self, job_id):
+        """Print one job, retrying with backoff; jobs behind it wait so order is kept"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        with self._lock:
+            row = self._db.execute("SELECT path FROM print_jobs WHERE id = ?", (job_id,)).fetchone()
+        path = row[0]
+        attempts = job["attempts"]
+        started = time.monotonic()
+
+        while not self._stop.is_set():
+            attempts += 1
+            self._update(job_id, status="printing", attempts=attempts)
+            if self.printer_available is None:
+                self.refresh_printer()
+            try:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(path)
+                action, message = self.backend.print_file(path, self.printer_available)
+            except Exception as e:
+                error = str(e)
+                if attempts >= PRINT_MAX_ATTEMPTS or isinstance(e, (FileNotFoundError, PrinterNotConfigured)):
+                    self._finish_failed(job_id, path, attempts, error, started)
+                    return
+                delay = min(PRINT_RETRY_MAX, PRINT_RETRY_BASE * 2 ** (attempts - 1))
+                self.retries += 1
+                log.warning("Print failed, retrying", job=job_id, attempt=attempts, delay_s=delay, error=error)
+                self._update(job_id, status="retrying", message=error)
+                if self._stop.wait(delay):
+                    # Shutting down; stays "retrying" and resumes on the next start
+                    return
+                self.refresh_printer()
+                continue
+
+            duration = time.monotonic() - started
+            self.printed += 1
+            self.total_print_s += duration
+            PRINT_JOB_SECONDS.labels("done").observe(duration)
+            self._update(job_id, status="done", action=action, message=message,
+                         duration_ms=round(duration * 1000, 1))
+            return
+
+    def _finish_failed(self, job_id, path, attempts, error, started):
+        action = "error"
+        try:
+            self.backend.open_file(path)
+            action = "opened"
+        except Exception:
+            pass
+        duration = time.monotonic() - started
+        self.failed += 1
+        self.total_print_s += duration
+        PRINT_JOB_SECONDS.labels("failed").observe(duration)
+        log.error("Print job failed", job=job_id, attempts=attempts, error=error)
+        self._update(job_id, status="failed", action=action, message=f"فشل: {error}",
+                     duration_ms=round(duration * 1000, 1))
+
+# Shared queue for the server
+print_queue = PrintQueue()
@@ -1,8 +1,26 @@
 """
 Printer Utilities - Simple Print Function
+Printing goes through a backend so the print queue can run without Windows.
 """
 import os
+import shutil
 import subprocess
+from datetime import datetime
+from dotenv import load_dotenv
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("printer")
+
+# "windows" prints with the default printer; "file" copies PDFs into PRINT_DROP_DIR;
+# "none" fails every job (the default off Windows, where there is no default printer to use)
+PRINTER_BACKEND = os.getenv("PRINTER_BACKEND", "windows" if os.name == "nt" else "none").lower()
+PRINT_DROP_DIR = os.getenv("PRINT_DROP_DIR", "print_drop")
+
+class PrinterNotConfigured(Exception):
+    """No printer backend can print on this machine; retrying won't help"""
 
 def check_printer_available():
     """Check if any printer is available"""
@@ -14,22 +32,77 @@ def check_printer_available():
     except Exception:
         return False
 
-def print_pdf_to_default_printer(pdf_path):
-    """Print PDF file to Windows default printer"""
-    try:
-        if not check_printer_available():
+class WindowsPrinterBackend:
+    """Default Windows printer via os.startfile"""
+
+    name = "windows"
+
+    def is_available(self):
+        return check_printer_available()
+
+    def print_file(self, pdf_path, printer_available):
+        """Print (or open when there is no printer); raises on failure"""
+        if not printer_available:
             os.startfile(pdf_path)
-            return True, "no_printer", "لا توجد طابعة. تم فتح الفاتورة."
-        
-        # Print the PDF
+            return "no_printer", "لا توجد طابعة. تم فتح الفاتورة."
         os.startfile(pdf_path, "print")
-        print(f"✅ Sent to printer: {pdf_path}")
-        return True, "printed", "تم إرسال الفاتورة للطباعة بنجاح"
-        
-    except Exception as e:
-        print(f"❌ Print error: {str(e)}")
+        log.success("Sent to printer", path=pdf_path)
+        return "printed", "تم إرسال الفاتورة للطباعة بنجاح"
+
+    def open_file(self, pdf_path):
+        """Last resort after the retries run out"""
+        os.startfile(pdf_path)
+
+class FileDropPrinterBackend:
+    """Copies PDFs into a folder; for testing or a watched-folder print server"""
+
+    name = "file"
+
+    def __init__(self, directory=PRINT_DROP_DIR):
+        self.directory = directory
+
+    def is_available(self):
         try:
-            os.startfile(pdf_path)
-            return True, "opened", f"تعذرت الطباعة. تم فتح الملف."
-        except Exception as e2:
-            return False, "error", f"فشل: {str(e2)}"
\ No newline at end of file
+            os.makedirs(self.directory, exist_ok=True)
+            return os.access(self.directory, os.W_OK)
+        except OSError:
+            return False
+
+    def print_file(self, pdf_path, printer_available):
+        if not printer_available:
+            raise OSError(f"Drop folder not writable: {self.directory}")
+        target = os.path.join(self.directory, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{os.path.basename(pdf_path)}")
+        shutil.copyfile(pdf_path, target)
+        log.success("Dropped for printing", path=target)
+        return "printed", "تم إرسال الفاتورة للطباعة بنجاح"
+
+    def open_file(self, pdf_path):
+        pass
+
+class NoPrinterBackend:
+    """Fails every job so nothing is reported as printed when no printer is set up"""
+
+    name = "none"
+
+    def is_available(self):
+        return False
+
+    def print_file(self, pdf_path, printer_available):
+        raise PrinterNotConfigured("No printer configured (set PRINTER_BACKEND)")
+
+    def open_file(self, pdf_path):
+        raise PrinterNotConfigured("No printer configured")
+
+PRINTER_BACKENDS = {
+    "windows": WindowsPrinterBackend,
+    "file": FileDropPrinterBackend,
+    "none": NoPrinterBackend,
+}
+
+def get_printer_backend(name=PRINTER_BACKEND):
+    """Backend instance for name (PRINTER_BACKEND by default)"""
+    backend = PRINTER_BACKENDS.get(name)
+    if backend is None:
+        log.warning("Unknown printer backend, print jobs will fail", backend=name)
+        backend = NoPrinterBackend
+    return backend()
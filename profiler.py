@@ -0,0 +1,258 @@
+"""
+On-demand sampling profiler for live requests
+Installed only when PROFILE_ENABLED is set, then armed either per request
+(X-Profile header carrying PROFILE_TOKEN) or for a time-boxed window opened
+from the launcher. While a profiled request runs, a background thread samples
+the Python stacks of the threads serving it (the event loop plus any db/io
+executor worker running a job the request submitted) at PROFILE_INTERVAL_MS,
+and writes them as collapsed stacks ("a;b;c count"), the input format of
+flamegraph.pl, speedscope and inferno. The event loop is shared, so its
+samples can include other requests running at the same time. Invoice
+rendering in the process pool runs in other processes and isn't sampled.
+"""
+import os
+import re
+import sys
+import hmac
+import time
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime
+from functools import partial
+from dotenv import load_dotenv
+from executors import run_io, ExecutorBusy, job_tracer
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("profiler")
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"  # Installs the middleware
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # Secret for the X-Profile header; empty = header disabled
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))  # Sampling period
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))  # Oldest profiles are deleted beyond this
+PROFILE_WINDOW = float(os.getenv("PROFILE_WINDOW", 60))  # Default launcher window, seconds
+PROFILE_WINDOW_MAX = float(os.getenv("PROFILE_WINDOW_MAX", 600))
+PROFILE_PATHS = tuple(p for p in os.getenv("PROFILE_PATHS", "/api/").split(",") if p)  # Window mode only
+PROFILE_HEADER = b"x-profile"
+MAX_STACK_DEPTH = 128
+
+# Leaf frames of a thread that is parked, not working
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # Pool worker blocked on its work queue
+}
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(thread_name, frame):
+    """'thread;outer;...;leaf' for a frame, or None when the thread is idle"""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+class _Capture:
+    __slots__ = ("samples", "started", "threads")
+
+    def __init__(self, thread):
+        self.samples = Counter()
+        self.started = time.perf_counter()
+        self.threads = Counter({thread: 1})  # Idents of the threads serving the request, with job counts
+
+class SamplingProfiler:
+    """Shared sampler thread feeding every in-flight profiled request"""
+
+    def __init__(self, directory=PROFILE_DIR, interval_ms=PROFILE_INTERVAL_MS, max_files=PROFILE_MAX_FILES,
+                 token=PROFILE_TOKEN, paths=PROFILE_PATHS):
+        self.directory = directory
+        self.interval = max(0.001, interval_ms / 1000)
+        self.max_files = max(1, max_files)
+        self.token = token.encode("utf-8")
+        self.paths = paths
+        self.armed = bool(token)  # Fast-path flag checked on every request
+        self._window_until = 0.0
+        self._captures = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.profiles_written = 0
+        self.samples_taken = 0
+
+    # ==== ARMING ====
+
+    def enable_window(self, seconds=PROFILE_WINDOW):
+        """Profile every request matching PROFILE_PATHS for the next `seconds`"""
+        seconds = max(1.0, min(seconds, PROFILE_WINDOW_MAX))
+        self._window_until = time.monotonic() + seconds
+        self.armed = True
+        log.info("Profiling window opened", seconds=seconds, paths=",".join(self.paths), dir=self.directory)
+        return seconds
+
+    def disable_window(self):
+        self._window_until = 0.0
+        self.armed = bool(self.token)
+        log.info("Profiling window closed")
+
+    def window_remaining(self):
+        return max(0.0, self._window_until - time.monotonic())
+
+    def wants(self, scope):
+        """Whether this request should be profiled"""
+        if self._window_until:
+            if time.monotonic() < self._window_until:
+                if scope["path"].startswith(self.paths):
+                    return True
+            else:
+                self.disable_window()
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return False
+
+    # ==== SAMPLING ====
+
+    def begin(self):
+        """Start capturing the calling thread (the event loop) and the executor jobs it submits"""
+        capture = _Capture(threading.get_ident())
+        with self._lock:
+            self._captures.add(capture)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        return capture
+
+    def end(self, capture):
+        with self._lock:
+            self._captures.discard(capture)
+        return time.perf_counter() - capture.started
+
+    @contextmanager
+    def track_job(self, capture):
+        """Sample the current executor worker for `capture` while it runs one job"""
+        ident = threading.get_ident()
+        with self._lock:
+            capture.threads[ident] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                capture.threads[ident] -= 1
+                if not capture.threads[ident]:
+                    del capture.threads[ident]
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._captures:
+                    self._thread = None
+                    return
+                captures = [(capture, set(capture.threads)) for capture in self._captures]
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            stacks = {}
+            for capture, threads in captures:
+                for ident in threads:
+                    if ident == me or ident not in frames:
+                        continue
+                    if ident not in stacks:
+                        stacks[ident] = _collapse(names.get(ident, f"thread-{ident}"), frames[ident])
+                    if stacks[ident]:
+                        capture.samples[stacks[ident]] += 1
+            del frames  # Don't keep other threads' frames alive while sleeping
+            self.samples_taken += 1
+            time.sleep(self.interval)
+
+    # ==== OUTPUT ====
+
+    def write(self, capture, method, path, status, elapsed):
+        """Write the capture as a .folded file and prune old ones; returns the file name"""
+        if not capture.samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+        name = (f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{method}_{slug}_{status}_"
+                f"{round(elapsed * 1000)}ms.folded")
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            for stack, count in capture.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.profiles_written += 1
+        self._prune()
+        return name
+
+    def _prune(self):
+        try:
+            files = sorted(entry for entry in os.listdir(self.directory) if entry.endswith(".folded"))
+        except OSError:
+            return
+        # Names start with a timestamp, so sorted order is oldest first
+        for entry in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "enabled": PROFILE_ENABLED,
+            "armed": self.armed,
+            "header_enabled": bool(self.token),
+            "window_remaining_s": round(self.window_remaining(), 1),
+            "in_flight": len(self._captures),
+            "profiles_written": self.profiles_written,
+            "samples_taken": self.samples_taken,
+            "interval_ms": self.interval * 1000,
+            "dir": self.directory,
+        }
+
+class ProfilerMiddleware:
+    """Wraps requests the profiler wants; a single attribute check otherwise (added only if PROFILE_ENABLED)"""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.armed or scope["type"] != "http" or not self.profiler.wants(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        capture = self.profiler.begin()
+        token = job_tracer.set(partial(self.profiler.track_job, capture))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            job_tracer.reset(token)
+            elapsed = self.profiler.end(capture)
+            try:
+                name = await run_io(self.profiler.write, capture, scope["method"], scope["path"], status[0], elapsed)
+                if name:
+                    log.info("Request profiled", path=scope["path"], ms=round(elapsed * 1000, 1), file=name,
+                             samples=sum(capture.samples.values()))
+            except (ExecutorBusy, OSError) as e:
+                log.warning("Could not write profile", path=scope["path"], error=str(e))
+
+# Shared profiler for the server and the launcher
+profiler = SamplingProfiler()
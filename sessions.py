@@ -0,0 +1,359 @@
+"""
+Server-side sessions
+The session cookie carries only an opaque random id. The data lives in an
+in-memory LRU, optionally written through to SQLite so logins survive a
+restart, so requests skip the cookie signature check and sessions can be
+revoked on the server.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from dotenv import load_dotenv
+from executors import run_io, ExecutorBusy
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("sessions")
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()  # cookie (signed cookie), memory or sqlite
+SESSION_DB = os.getenv("SESSION_DB", os.path.join("data", "sessions.db"))  # Used by the sqlite backend
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 5000))  # Sessions kept in memory
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", 14 * 24 * 3600))  # Idle seconds before a session expires
+
+class SessionStore:
+    """
+    LRU of session id -> data with idle expiry; write-through to SQLite when db_path is set
+    Memory operations are immediate. SQLite writes are queued to one writer thread (kept in
+    order, batched per transaction) and reads on a memory miss happen in load(), which the
+    middleware runs on the io executor, so the event loop never waits on the disk.
+    """
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE, max_age=SESSION_MAX_AGE, db_path=None):
+        self.max_entries = max(1, max_entries)
+        self.max_age = max_age
+        self.db_path = db_path
+        self._entries = OrderedDict()  # id -> [data, expires_at, refreshed_at], least recent first
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()  # Serialises use of the SQLite connection
+        self._writes = queue.Queue()
+        self._writer = None
+        self._deleting = set()  # Ids whose DELETE is still queued; never restored from disk
+        self._purges = 0  # Queued revoke_all() deletes; nothing is restored from disk meanwhile
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.restored = 0
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+        self.revoked = 0
+        self.write_errors = 0
+
+    # ---- storage ----
+
+    def _database(self):
+        """SQLite connection (opened on first use), or None for a memory-only store; call with _db_lock held"""
+        if self.db_path and self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            purged = self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+            if purged:
+                log.info("Purged expired sessions", count=purged)
+        return self._db
+
+    def _remember(self, session_id, data, now):
+        self._entries[session_id] = [data, now + self.max_age, now]
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            # Only the memory copy goes; a persisted session reloads on its next request
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _queue_write(self, statement, params):
+        """Persist in the background; no-op for a memory-only store"""
+        if not self.db_path:
+            return
+        if self._writer is None:
+            with self._db_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+                    self._writer.start()
+        self._writes.put((statement, params))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                try:
+                    with self._db_lock:
+                        db = self._database()
+                        db.execute("BEGIN")
+                        for statement, params in batch:
+                            db.execute(statement, params)
+                        db.execute("COMMIT")
+                    with self._lock:
+                        for statement, params in batch:
+                            if statement.startswith("DELETE") and params:
+                                self._deleting.discard(params[0])
+                            elif statement.startswith("DELETE"):
+                                self._purges -= 1
+                except Exception as e:
+                    # Any failure (SQLite, a full or missing disk) drops this batch but never the writer
+                    self.write_errors += 1
+                    log.error("Session write failed", count=len(batch), error=str(e))
+                    try:
+                        with self._db_lock:
+                            if self._db is not None and self._db.in_transaction:
+                                self._db.execute("ROLLBACK")
+                    except Exception:
+                        pass
+            if stop:
+                return
+
+    def _write(self, session_id, data, expires_at):
+        self._queue_write("INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                          (session_id, json.dumps(data, ensure_ascii=False), expires_at))
+
+    # ---- API ----
+
+    def new_id(self):
+        return secrets.token_urlsafe(32)
+
+    def is_cached(self, session_id):
+        """True when load() can answer from memory (no disk read)"""
+        return not self.db_path or session_id in self._entries
+
+    def load(self, session_id):
+        """(copy of the session data, cookie needs refreshing) or (None, False) when unknown or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[1] < now:
+                del self._entries[session_id]
+                self.expired += 1
+                return self._miss()
+
+        if entry is None and self.db_path:
+            # Read outside the memory lock; a write still queued for this id is also still in memory
+            with self._db_lock:
+                row = self._database().execute("SELECT data, expires_at FROM sessions WHERE id = ?",
+                                               (session_id,)).fetchone()
+            with self._lock:
+                entry = self._entries.get(session_id)
+                if (entry is None and row is not None and row[1] >= now
+                        and session_id not in self._deleting and not self._purges):
+                    self._remember(session_id, json.loads(row[0]), now)
+                    entry = self._entries[session_id]
+                    # Persisted expiry is only refreshed on write; treat the restored entry as due
+                    entry[2] = row[1] - self.max_age
+                    self.restored += 1
+
+        with self._lock:
+            if entry is None or session_id not in self._entries:
+                return self._miss()
+            self._entries.move_to_end(session_id)
+            entry[1] = now + self.max_age
+            self.hits += 1
+            # Re-issue the cookie (and persisted expiry) once half its lifetime has passed
+            return dict(entry[0]), now - entry[2] > self.max_age / 2
+
+    def _miss(self):
+        self.misses += 1
+        return None, False
+
+    def save(self, session_id, data):
+        now = time.time()
+        data = dict(data)
+        with self._lock:
+            if session_id not in self._entries:
+                self.created += 1
+            self._remember(session_id, data, now)
+        self._write(session_id, data, now + self.max_age)
+
+    def touch(self, session_id):
+        """Extend a session's persisted lifetime after its cookie has been re-issued"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            entry[2] = now
+            data = entry[0]
+        self._write(session_id, data, now + self.max_age)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+            if self.db_path:
+                self._deleting.add(session_id)
+        self._queue_write("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def revoke_user(self, username):
+        """Log a user out everywhere; returns the number of sessions removed (reads SQLite: call off the event loop)"""
+        with self._lock:
+            ids = {sid for sid, entry in self._entries.items() if entry[0].get("username") == username}
+            for sid in ids:
+                del self._entries[sid]
+        if self.db_path:
+            with self._db_lock:
+                rows = self._database().execute("SELECT id, data FROM sessions").fetchall()
+            ids.update(sid for sid, data in rows if json.loads(data).get("username") == username)
+        with self._lock:
+            # A persisted session read back in while the table was scanned goes too
+            for sid in ids:
+                self._entries.pop(sid, None)
+            if self.db_path:
+                self._deleting.update(ids)
+            self.revoked += len(ids)
+        for sid in ids:
+            self._queue_write("DELETE FROM sessions WHERE id = ?", (sid,))
+        if ids:
+            log.info("Sessions revoked", user=username, count=len(ids))
+        return len(ids)
+
+    def revoke_all(self):
+        """Log everyone out; returns the number of sessions dropped from memory"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            if self.db_path:
+                self._purges += 1
+            self.revoked += count
+        self._queue_write("DELETE FROM sessions", ())
+        log.info("All sessions revoked", in_memory=count)
+        return count
+
+    def close(self):
+        """Flush queued writes and close the database"""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join(timeout=5)
+            self._writer = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite" if self.db_path else "memory",
+                "in_memory": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "restored": self.restored,
+                "created": self.created,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "revoked": self.revoked,
+                "pending_writes": self._writes.qsize(),
+                "write_errors": self.write_errors,
+            }
+
+class ServerSessionMiddleware:
+    """Drop-in replacement for Starlette's SessionMiddleware backed by a SessionStore"""
+
+    def __init__(self, app, store, session_cookie="session", path="/", same_site="lax", https_only=False):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _cookie(self, session_id):
+        if session_id is None:
+            return f"{self.session_cookie}=null; path={self.path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}"
+        return f"{self.session_cookie}={session_id}; path={self.path}; Max-Age={self.store.max_age}; {self.security_flags}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(self.session_cookie)
+        if not session_id:
+            data, refresh = None, False
+        elif self.store.is_cached(session_id):
+            data, refresh = self.store.load(session_id)
+        else:
+            # Not in memory: the SQLite read runs on the io executor, not the event loop
+            try:
+                data, refresh = await run_io(self.store.load, session_id)
+            except ExecutorBusy:
+                data, refresh = self.store.load(session_id)
+        # A cookie for an unknown session (expired, revoked, or an old signed cookie) gets cleared
+        stale = session_id is not None and data is None
+        if data is None:
+            session_id, data = None, {}
+        initial = dict(data)
+        scope["session"] = data
+        scope["session_id"] = session_id  # Lets long-lived connections re-check that it wasn't revoked
+
+        async def send_wrapper(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                cookie = False
+                if session != initial:
+                    if session:
+                        if session_id is not None and session.get("username") != initial.get("username"):
+                            # New login on an existing session: issue a fresh id (no session fixation)
+                            self.store.delete(session_id)
+                            session_id = None
+                        if session_id is None:
+                            session_id = self.store.new_id()
+                        self.store.save(session_id, session)
+                        cookie = True
+                    elif session_id is not None:
+                        self.store.delete(session_id)
+                        session_id, cookie = None, True
+                elif refresh:
+                    self.store.touch(session_id)
+                    cookie = True
+                elif stale and not session:
+                    cookie = True
+                if cookie:
+                    MutableHeaders(scope=message).append("Set-Cookie", self._cookie(session_id))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+# Shared store for the server (None when sessions stay in the signed cookie)
+if SESSION_BACKEND in ("memory", "sqlite"):
+    session_store = SessionStore(db_path=SESSION_DB if SESSION_BACKEND == "sqlite" else None)
+else:
+    if SESSION_BACKEND != "cookie":
+        log.warning("Unknown SESSION_BACKEND, using signed cookies", backend=SESSION_BACKEND)
+    session_store = None
@@ -0,0 +1,36 @@
+"""
+Single-flight coalescing of concurrent identical async calls
+"""
+import asyncio
+
+class SingleFlight:
+    """Concurrent callers with the same key share one in-flight call and its outcome"""
+
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}  # key -> asyncio.Future of the running call
+
+        # Stats
+        self.calls = 0     # Calls actually executed
+        self.shared = 0    # Callers that joined an existing call (DB calls saved)
+
+    async def do(self, key, fn):
+        """Await fn() unless a call for key is already running, then await that one instead"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            # Run as its own task so one caller disconnecting doesn't cancel it for the others
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Results and exceptions both propagate to every waiter
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._inflight),
+        }
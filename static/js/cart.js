@@ -7,9 +7,20 @@ class CartPage {
         this.initializeElements();
         this.setupEventListeners();
         this.loadCartData();
+        this.refreshPrices();
+        window.cartManager?.watchPrices((changed) => {
+            window.sharedUtils?.showSuccess(`تم تحديث أسعار ${changed} منتج`);
+        });
         console.log('CartPage initialized');
     }
 
+    async refreshPrices() {
+        const changed = await window.cartManager?.refreshPrices();
+        if (changed > 0) {
+            window.sharedUtils?.showSuccess(`تم تحديث أسعار ${changed} منتج`);
+        }
+    }
+
     initializeElements() {
         // Cart display elements
         this.emptyCart = document.getElementById('empty-cart');
@@ -91,7 +102,7 @@ class CartPage {
         }
         
         if (this.totalPrice) {
-            this.totalPrice.textContent = `${total.toFixed(2)} USD`;
+            this.totalPrice.textContent = `${total.toFixed(2)} ${this.cartCurrency()}`;
         }
     }
 
@@ -313,7 +324,7 @@ class CartPage {
         }
         
         if (this.printTotalPrice) {
-            this.printTotalPrice.textContent = `${totalPrice.toFixed(2)} USD`;
+            this.printTotalPrice.textContent = `${totalPrice.toFixed(2)} ${this.cartCurrency()}`;
         }
     }
 
@@ -349,6 +360,11 @@ class CartPage {
         }
     }
 
+    cartCurrency() {
+        // Prices come from the server with its configured currency
+        return window.cartManager?.getCart()[0]?.currency || 'USD';
+    }
+
     escapeHtml(text) {
         if (!text) return '';
         const div = document.createElement('div');
@@ -356,54 +372,6 @@ class CartPage {
         return div.innerHTML;
     }
 
-    // async printOnHost() {
-    //     const cart = window.cartManager?.getCart() || [];
-        
-    //     if (cart.length === 0) {
-    //         window.sharedUtils?.showError('السلة فارغة - لا يمكن طباعة فاتورة');
-    //         return;
-    //     }
-        
-    //     try {
-    //         // Show loading
-    //         if (this.printOnHostBtn) {
-    //             this.printOnHostBtn.disabled = true;
-    //             this.printOnHostBtn.innerHTML = '<span class="btn-icon">⏳</span>جاري الطباعة...';
-    //         }
-            
-    //         // Send print request to server
-    //         const response = await window.sharedUtils?.apiCall('/api/print-invoice', {
-    //             method: 'POST',
-    //             headers: {
-    //                 'Content-Type': 'application/json',
-    //             },
-    //             body: JSON.stringify({ cart: cart })
-    //         });
-            
-    //         if (!response) return;
-            
-    //         if (!response.ok) {
-    //             const errorData = await response.json();
-    //             throw new Error(errorData.detail || 'فشل في الطباعة');
-    //         }
-            
-    //         const result = await response.json();
-    //         window.sharedUtils?.showSuccess(result.message || 'تم إرسال الفاتورة للطباعة');
-            
-    //     } catch (error) {
-    //         console.error('Print on host error:', error);
-    //         window.sharedUtils?.showError('خطأ في الطباعة: ' + error.message);
-    //     } finally {
-    //         // Reset button
-    //         if (this.printOnHostBtn) {
-    //             this.printOnHostBtn.disabled = false;
-    //             this.printOnHostBtn.innerHTML = '<span class="btn-icon"><i class="fas fa-print"></i></span>طباعة على الجهاز المضيف';
-    //         }
-    //     }
-    // }
-
-    // Add this new method to the CartPage class
-
     async printOnHost() {
         const cart = window.cartManager?.getCart() || [];
         
@@ -416,33 +384,43 @@ class CartPage {
             // Show loading
             if (this.printOnHostBtn) {
                 this.printOnHostBtn.disabled = true;
-                this.printOnHostBtn.innerHTML = '<span class="btn-icon">⏳</span>جاري التحضير...';
+                this.printOnHostBtn.innerHTML = '<span class="btn-icon">⏳</span>جاري الطباعة...';
             }
             
-            window.sharedUtils?.showSuccess('جاري إنشاء الفاتورة...');
-            
-            // Step 1: Prepare print data (generates barcodes)
-            this.preparePrintData(cart);
+            // The server renders the PDF; send only what the invoice needs
+            const items = cart.map(item => ({
+                barcode: item.barcode,
+                product_name: item.product_name,
+                price: item.price,
+                quantity: item.quantity,
+                currency: item.currency
+            }));
             
-            // Wait for barcodes to render
-            await new Promise(resolve => setTimeout(resolve, 500));
+            const response = await window.sharedUtils?.apiCall('/api/print-invoice', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ cart: items })
+            });
             
-            // Step 2: Generate PDF from print template
-            const pdfBlob = await this.generatePDFFromTemplate();
+            if (!response) return;
             
-            if (!pdfBlob) {
-                throw new Error('فشل في إنشاء ملف PDF');
+            if (!response.ok) {
+                const errorData = await response.json().catch(() => ({}));
+                throw new Error(errorData.detail || `خطأ في الخادم: ${response.status}`);
             }
             
-            // Step 3: Upload PDF to server
-            window.sharedUtils?.showSuccess('جاري إرسال الفاتورة للطباعة...');
-            await this.uploadPDFBlob(pdfBlob);
+            const result = await response.json();
+            window.sharedUtils?.showSuccess(result.message || 'تم إرسال الفاتورة للطباعة');
             
-            window.sharedUtils?.showSuccess('تم إرسال الفاتورة للطباعة بنجاح!');
+            if (result.job_id) {
+                this.waitForPrintJob(result.job_id);
+            }
             
         } catch (error) {
             console.error('Print on host error:', error);
-            window.sharedUtils?.showError('خطأ: ' + error.message);
+            window.sharedUtils?.showError('خطأ في الطباعة: ' + error.message);
         } finally {
             // Reset button
             if (this.printOnHostBtn) {
@@ -452,158 +430,30 @@ class CartPage {
         }
     }
 
-    async generatePDFFromTemplate() {
-        return new Promise((resolve, reject) => {
+    async waitForPrintJob(jobId, timeoutMs = 60000) {
+        // Poll the print queue until the job finishes, then report the outcome
+        const deadline = Date.now() + timeoutMs;
+        
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            
             try {
-                const printTemplate = document.getElementById('print-template');
+                const response = await window.sharedUtils?.apiCall(`/api/print-jobs/${encodeURIComponent(jobId)}`);
+                if (!response || !response.ok) return;
                 
-                if (!printTemplate) {
-                    reject(new Error('Print template not found'));
+                const job = await response.json();
+                if (job.status === 'done') {
+                    window.sharedUtils?.showSuccess(job.message || 'تمت الطباعة بنجاح');
                     return;
                 }
-                
-                // CRITICAL: Convert all canvas barcodes to images first
-                const canvases = printTemplate.querySelectorAll('.print-barcode');
-                console.log('Found barcodes to convert:', canvases.length);
-                
-                canvases.forEach(canvas => {
-                    if (canvas.tagName === 'CANVAS') {
-                        try {
-                            // Convert canvas to image
-                            const img = document.createElement('img');
-                            img.src = canvas.toDataURL('image/png');
-                            img.style.width = canvas.style.width || canvas.width + 'px';
-                            img.style.height = canvas.style.height || canvas.height + 'px';
-                            img.className = canvas.className;
-                            
-                            // Replace canvas with image
-                            canvas.parentNode.replaceChild(img, canvas);
-                            console.log('Converted canvas to image');
-                        } catch (e) {
-                            console.error('Failed to convert canvas:', e);
-                        }
-                    }
-                });
-                
-                // Create print window
-                const printWindow = window.open('', '_blank', 'width=800,height=1000');
-                
-                if (!printWindow) {
-                    reject(new Error('Failed to open print window'));
+                if (job.status === 'failed') {
+                    window.sharedUtils?.showError(job.message || 'فشلت الطباعة');
                     return;
                 }
-                
-                // Get styles
-                const styles = Array.from(document.styleSheets)
-                    .map(sheet => {
-                        try {
-                            return Array.from(sheet.cssRules)
-                                .map(rule => rule.cssText)
-                                .join('\n');
-                        } catch (e) {
-                            return '';
-                        }
-                    })
-                    .join('\n');
-                
-                // Build HTML
-                printWindow.document.write(`
-                    <!DOCTYPE html>
-                    <html dir="rtl" lang="ar">
-                    <head>
-                        <meta charset="UTF-8">
-                        <title>Invoice</title>
-                        <style>
-                            ${styles}
-                            body { margin: 0; padding: 20px; background: white; }
-                            .print-template { display: block !important; }
-                            .print-barcode { display: block !important; max-width: 100%; }
-                        </style>
-                    </head>
-                    <body>
-                        ${printTemplate.innerHTML}
-                    </body>
-                    </html>
-                `);
-                
-                printWindow.document.close();
-                
-                // Wait for images to load
-                setTimeout(async () => {
-                    try {
-                        const element = printWindow.document.body;
-                        
-                        const opt = {
-                            margin: 10,
-                            filename: `Invoice_${Date.now()}.pdf`,
-                            image: { type: 'jpeg', quality: 0.95 },
-                            html2canvas: { 
-                                scale: 2,
-                                useCORS: true,
-                                allowTaint: true,
-                                backgroundColor: '#ffffff',
-                                logging: true
-                            },
-                            jsPDF: { 
-                                unit: 'mm', 
-                                format: 'a4', 
-                                orientation: 'portrait' 
-                            }
-                        };
-                        
-                        const pdfBlob = await html2pdf()
-                            .set(opt)
-                            .from(element)
-                            .toPdf()
-                            .output('blob');
-                        
-                        printWindow.close();
-                        
-                        console.log('PDF generated with barcodes:', pdfBlob.size, 'bytes');
-                        resolve(pdfBlob);
-                        
-                    } catch (error) {
-                        printWindow.close();
-                        reject(error);
-                    }
-                }, 2000); // Increased wait time for barcode images
-                
             } catch (error) {
-                reject(error);
-            }
-        });
-    }
-
-    async uploadPDFBlob(pdfBlob) {
-        try {
-            // Create form data with the PDF blob
-            const formData = new FormData();
-            const timestamp = new Date().getTime();
-            formData.append('file', pdfBlob, `Invoice_${timestamp}.pdf`);
-            
-            // Upload to server
-            const response = await window.sharedUtils?.apiCall('/api/upload-and-print', {
-                method: 'POST',
-                body: formData
-            });
-            
-            if (!response) {
-                throw new Error('لم يتم الحصول على استجابة من الخادم');
-            }
-            
-            if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.detail || `خطأ في الخادم: ${response.status}`);
+                console.error('Print job status error:', error);
+                return;
             }
-            
-            const result = await response.json();
-            console.log('Upload successful:', result);
-            
-            return result;
-            
-        } catch (error) {
-            console.error('Upload error:', error);
-            throw new Error('فشل في رفع الملف: ' + error.message);
         }
     }
 
@@ -655,6 +505,10 @@ class CartPage {
             const result = await response.json();
             window.sharedUtils?.showSuccess(result.message || 'تم رفع الفاتورة وإرسالها للطباعة');
             
+            if (result.job_id) {
+                this.waitForPrintJob(result.job_id);
+            }
+            
         } catch (error) {
             console.error('Upload and print error:', error);
             window.sharedUtils?.showError('خطأ في رفع الملف: ' + error.message);
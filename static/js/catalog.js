@@ -0,0 +1,138 @@
+/**
+ * Offline Catalog - IndexedDB copy of the product catalog
+ * Syncs a full export once, then only deltas (?since=<version>&epoch=<epoch>),
+ * so scans can be answered on the handheld when the Wi-Fi drops. The epoch
+ * changes whenever the server reloads its catalog (e.g. after a restart), and
+ * a stale epoch gets a full export instead of a delta.
+ */
+
+class OfflineCatalog {
+    constructor() {
+        this.dbName = 'priceScanner_catalog';
+        this.db = null;
+        this.version = null;
+        this.epoch = null;
+        this.currency = 'USD';
+        this.syncInterval = 60000;
+        this.syncTimer = null;
+        this.syncing = false;
+        this.available = typeof indexedDB !== 'undefined';
+    }
+
+    async start() {
+        if (!this.available) return;
+
+        try {
+            this.db = await this.openDatabase();
+            const meta = await this.request(this.db.transaction('meta').objectStore('meta').get('sync'));
+            if (meta) {
+                this.version = meta.version;
+                this.epoch = meta.epoch || null;
+                this.currency = meta.currency || 'USD';
+            }
+        } catch (error) {
+            console.warn('Offline catalog unavailable:', error);
+            this.available = false;
+            return;
+        }
+
+        this.sync();
+        this.syncTimer = setInterval(() => this.sync(), this.syncInterval);
+        window.addEventListener('online', () => this.sync());
+    }
+
+    isReady() {
+        return this.available && this.db !== null && this.version !== null;
+    }
+
+    openDatabase() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(this.dbName, 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('products', { keyPath: 'barcode' });
+                db.createObjectStore('meta');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    request(idbRequest) {
+        return new Promise((resolve, reject) => {
+            idbRequest.onsuccess = () => resolve(idbRequest.result);
+            idbRequest.onerror = () => reject(idbRequest.error);
+        });
+    }
+
+    async sync() {
+        if (!this.db || this.syncing || !navigator.onLine) return;
+        this.syncing = true;
+
+        try {
+            const url = this.version === null
+                ? '/api/catalog/export'
+                : `/api/catalog/export?since=${this.version}&epoch=${encodeURIComponent(this.epoch || '')}`;
+            const response = await fetch(url, { credentials: 'same-origin' });
+            if (!response.ok) {
+                // 503: catalog mode off or still loading on the server; 401: logged out
+                return;
+            }
+
+            const data = await response.json();
+            if (!data.full && data.version === this.version && data.products.length === 0 && data.removed.length === 0) {
+                return;
+            }
+            await this.apply(data);
+            console.log(`Offline catalog ${data.full ? 'loaded' : 'updated'}: v${data.version}, ${data.products.length} products`);
+        } catch (error) {
+            console.warn('Offline catalog sync failed:', error);
+        } finally {
+            this.syncing = false;
+        }
+    }
+
+    apply(data) {
+        return new Promise((resolve, reject) => {
+            const tx = this.db.transaction(['products', 'meta'], 'readwrite');
+            const products = tx.objectStore('products');
+
+            if (data.full) {
+                products.clear();
+            }
+            data.products.forEach(([barcode, name, price, stockQty]) => {
+                products.put({ barcode, product_name: name, price, stock_qty: stockQty });
+            });
+            (data.removed || []).forEach(barcode => products.delete(barcode));
+            tx.objectStore('meta').put({ version: data.version, epoch: data.epoch, currency: data.currency }, 'sync');
+
+            tx.oncomplete = () => {
+                this.version = data.version;
+                this.epoch = data.epoch;
+                this.currency = data.currency || 'USD';
+                resolve();
+            };
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    async lookup(barcode) {
+        // Product payload shaped like /api/price, or null when not in the local copy
+        if (!this.isReady()) return null;
+
+        try {
+            const row = await this.request(this.db.transaction('products').objectStore('products').get(barcode));
+            if (!row) return null;
+            return {
+                product_name: row.product_name,
+                price: row.price,
+                stock_qty: row.stock_qty,
+                barcode: row.barcode,
+                currency: this.currency
+            };
+        } catch (error) {
+            console.warn('Offline catalog lookup failed:', error);
+            return null;
+        }
+    }
+}
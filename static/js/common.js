@@ -118,6 +118,9 @@ class CartManager {
     constructor() {
         this.storageKey = 'priceScanner_cart';
         this.cart = this.loadCart();
+        this.priceFeed = null; // EventSource while watching prices
+        this.priceFeedKey = '';
+        this.watchingPrices = false;
         this.setupStorageListener();
         console.log('CartManager initialized with', this.cart.length, 'items');
     }
@@ -241,6 +244,99 @@ class CartManager {
         }
     }
 
+    // Re-check price/stock of every cart item with one batch request per 100 items
+    async refreshPrices() {
+        const barcodes = this.cart.map(item => item.barcode);
+        if (barcodes.length === 0) return 0;
+
+        let changed = 0;
+        try {
+            for (let i = 0; i < barcodes.length; i += 100) {
+                const response = await fetch('/api/prices', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    credentials: 'same-origin',
+                    body: JSON.stringify({ barcodes: barcodes.slice(i, i + 100) })
+                });
+                if (!response.ok) {
+                    console.warn('Batch price check failed:', response.status);
+                    return changed;
+                }
+
+                const data = await response.json();
+                changed += this.applyPriceChanges(
+                    data.results
+                        .filter(result => result.status === 200)
+                        .map(result => ({ ...result.product, barcode: result.barcode }))
+                );
+            }
+        } catch (error) {
+            console.error('Error refreshing cart prices:', error);
+        }
+
+        if (changed > 0) {
+            console.log(`Refreshed ${changed} cart items from server`);
+            this.saveCart();
+        }
+        return changed;
+    }
+
+    applyPriceChanges(changes) {
+        // Apply {barcode, price, stock_qty, product_name} updates; returns how many items changed
+        let changed = 0;
+        changes.forEach(product => {
+            const item = this.cart.find(entry => entry.barcode === product.barcode);
+            if (item && (item.price !== product.price || item.stock_qty !== (product.stock_qty || 0))) {
+                item.price = product.price || 0;
+                item.stock_qty = product.stock_qty || 0;
+                item.product_name = product.product_name || item.product_name;
+                changed++;
+            }
+        });
+        return changed;
+    }
+
+    watchPrices(onChange) {
+        // Subscribe to server-pushed price/stock changes for the barcodes in the cart
+        if (typeof EventSource === 'undefined') return;
+        this.watchingPrices = true;
+        this.onPriceChange = onChange;
+        this.syncPriceFeed();
+    }
+
+    syncPriceFeed() {
+        if (!this.watchingPrices) return;
+        
+        const barcodes = [...new Set(this.cart.map(item => item.barcode))].sort();
+        const key = barcodes.join(',');
+        if (key === this.priceFeedKey && this.priceFeed && this.priceFeed.readyState !== EventSource.CLOSED) {
+            return;
+        }
+        
+        if (this.priceFeed) {
+            this.priceFeed.close();
+            this.priceFeed = null;
+        }
+        this.priceFeedKey = key;
+        if (barcodes.length === 0) return;
+        
+        const params = new URLSearchParams({ barcodes: key });
+        this.priceFeed = new EventSource(`/api/price-feed?${params.toString()}`);
+        this.priceFeed.addEventListener('prices', (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                const changed = this.applyPriceChanges(data.changes || []);
+                if (changed > 0) {
+                    console.log(`Price feed updated ${changed} cart items`);
+                    this.saveCart();
+                    this.onPriceChange?.(changed);
+                }
+            } catch (error) {
+                console.error('Error applying price feed update:', error);
+            }
+        });
+    }
+
     clearCart() {
         try {
             this.cart = [];
@@ -289,6 +385,9 @@ class CartManager {
                 window.navigation.updateCartBadge(count);
             }
 
+            // Follow the cart's barcodes if prices are being watched
+            this.syncPriceFeed();
+
             // Dispatch custom event for other components
             const event = new CustomEvent('cartUpdated', {
                 detail: { count, total, cart: this.getCart() }
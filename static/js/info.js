@@ -8,6 +8,7 @@ class InfoPage {
         this.initializeElements();
         this.setupEventListeners();
         this.checkSystemStatus();
+        this.loadMetrics();
         this.updateCartCount();
     }
 
@@ -22,6 +23,13 @@ class InfoPage {
         this.dbStatus = document.getElementById('db-status');
         this.cartItemsCount = document.getElementById('cart-items-count');
         
+        // Server performance elements
+        this.metricsUptime = document.getElementById('metrics-uptime');
+        this.metricsDbConnect = document.getElementById('metrics-db-connect');
+        this.metricsUploads = document.getElementById('metrics-uploads');
+        this.metricsRoutes = document.getElementById('metrics-routes');
+        this.metricsQueries = document.getElementById('metrics-queries');
+        
         // QR modal elements
         this.qrModal = document.getElementById('qr-modal');
         this.closeQrModalBtn = document.getElementById('close-qr-modal');
@@ -92,6 +100,50 @@ class InfoPage {
         }
     }
 
+    async loadMetrics() {
+        if (!this.metricsRoutes) return;
+        
+        try {
+            const response = await fetch('/api/metrics?format=json');
+            const data = await response.json();
+            
+            const ms = (value) => value === null ? '-' : `${value} ms`;
+            const hours = Math.floor(data.uptime_s / 3600);
+            const minutes = Math.floor((data.uptime_s % 3600) / 60);
+            this.metricsUptime.textContent = `${hours} س ${minutes} د`;
+            this.metricsDbConnect.textContent = ms(data.db_connect.avg_ms);
+            this.metricsUploads.textContent =
+                `${data.uploads.count} (${(data.uploads.bytes / 1024 / 1024).toFixed(1)} MB)`;
+            
+            this.metricsRoutes.innerHTML = '';
+            data.routes.slice(0, 10).forEach(route => {
+                this.appendMetricsRow(this.metricsRoutes, [
+                    `${route.method} ${route.route}`, route.count, ms(route.p50_ms), ms(route.p95_ms), route.errors
+                ]);
+            });
+            
+            this.metricsQueries.innerHTML = '';
+            data.queries.forEach(query => {
+                this.appendMetricsRow(this.metricsQueries, [
+                    query.query, query.count, ms(query.avg_ms), ms(query.p95_ms), query.errors
+                ]);
+            });
+            
+        } catch (error) {
+            console.error('Metrics load failed:', error);
+        }
+    }
+
+    appendMetricsRow(tbody, cells) {
+        const row = document.createElement('tr');
+        cells.forEach(value => {
+            const cell = document.createElement('td');
+            cell.textContent = value;
+            row.appendChild(cell);
+        });
+        tbody.appendChild(row);
+    }
+
     updateCartCount(count = null) {
         if (count === null) {
             count = window.cartManager?.getCartCount() || 0;
@@ -218,6 +270,7 @@ class InfoPage {
     // Utility method to refresh system info
     async refreshSystemInfo() {
         this.checkSystemStatus();
+        this.loadMetrics();
         this.updateCartCount();
         window.sharedUtils.showSuccess('تم تحديث معلومات النظام');
     }
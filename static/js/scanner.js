@@ -3,6 +3,141 @@
  * Fix: Reuse Html5Qrcode instance and properly manage camera permissions
  */
 
+/**
+ * Persistent WebSocket lookup channel with HTTP fallback
+ * Each lookup carries a request id so several can be in flight at once.
+ */
+class ScanChannel {
+    constructor() {
+        this.socket = null;
+        this.nextId = 1;
+        this.pending = new Map(); // id -> { resolve, timer, barcode }
+        this.reconnectDelay = 1000;
+        this.maxReconnectDelay = 30000;
+        this.lookupTimeout = 3000;
+        this.reconnectTimer = null;
+        this.disabled = !('WebSocket' in window);
+        
+        this.connect();
+        
+        document.addEventListener('visibilitychange', () => {
+            if (!document.hidden) this.connect();
+        });
+        window.addEventListener('online', () => this.connect());
+    }
+
+    isOpen() {
+        return this.socket && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    connect() {
+        if (this.disabled || this.isOpen() || (this.socket && this.socket.readyState === WebSocket.CONNECTING)) {
+            return;
+        }
+        clearTimeout(this.reconnectTimer);
+        
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        try {
+            this.socket = new WebSocket(`${protocol}//${window.location.host}/ws/scan`);
+        } catch (error) {
+            console.warn('Scan channel unavailable, using HTTP:', error);
+            this.scheduleReconnect();
+            return;
+        }
+        
+        this.socket.addEventListener('open', () => {
+            console.log('Scan channel connected');
+            this.reconnectDelay = 1000;
+        });
+        
+        this.socket.addEventListener('message', (event) => this.handleMessage(event));
+        
+        this.socket.addEventListener('close', (event) => {
+            this.socket = null;
+            this.failPending();
+            
+            // 4401/4403: not allowed - stay on HTTP, which handles the login redirect
+            if (event.code === 4401 || event.code === 4403) {
+                this.disabled = true;
+                return;
+            }
+            this.scheduleReconnect();
+        });
+    }
+
+    scheduleReconnect() {
+        clearTimeout(this.reconnectTimer);
+        if (document.hidden) return; // Reconnect when the page becomes visible again
+        this.reconnectTimer = setTimeout(() => this.connect(), this.reconnectDelay);
+        this.reconnectDelay = Math.min(this.reconnectDelay * 2, this.maxReconnectDelay);
+    }
+
+    handleMessage(event) {
+        let message;
+        try {
+            message = JSON.parse(event.data);
+        } catch (error) {
+            return;
+        }
+        
+        const entry = this.pending.get(message.id);
+        if (!entry) return;
+        
+        this.pending.delete(message.id);
+        clearTimeout(entry.timer);
+        // Channel saturated: this one goes over HTTP instead
+        entry.resolve(message.status === 429 ? this.lookupHttp(entry.barcode) : message);
+    }
+
+    failPending() {
+        // Lookups lost with the socket are retried over HTTP
+        for (const [id, entry] of this.pending) {
+            clearTimeout(entry.timer);
+            entry.resolve(this.lookupHttp(entry.barcode));
+        }
+        this.pending.clear();
+    }
+
+    async lookup(barcode) {
+        // Resolves to { status, product | detail }
+        if (!this.isOpen()) {
+            this.connect();
+            return this.lookupHttp(barcode);
+        }
+        
+        const id = this.nextId++;
+        return new Promise(resolve => {
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                resolve(this.lookupHttp(barcode));
+            }, this.lookupTimeout);
+            
+            this.pending.set(id, { resolve, timer, barcode });
+            
+            try {
+                this.socket.send(JSON.stringify({ id, barcode }));
+            } catch (error) {
+                this.pending.delete(id);
+                clearTimeout(timer);
+                resolve(this.lookupHttp(barcode));
+            }
+        });
+    }
+
+    async lookupHttp(barcode) {
+        const response = await window.sharedUtils?.apiCall(`/api/price/${encodeURIComponent(barcode)}`);
+        
+        if (!response) return null;
+        
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            return { status: response.status, detail: errorData.detail };
+        }
+        
+        return { status: 200, product: await response.json() };
+    }
+}
+
 class ScannerPage {
     constructor() {
         this.html5QrCode = null; // Will be initialized once and reused
@@ -14,6 +149,9 @@ class ScannerPage {
         this.currentCameraIndex = 0;
         this.permissionGranted = false; // Track permission state
         this.currentStream = null; // Track active stream
+        this.scanChannel = new ScanChannel();
+        this.offlineCatalog = typeof OfflineCatalog !== 'undefined' ? new OfflineCatalog() : null;
+        this.offlineCatalog?.start();
         
         this.initializeElements();
         this.setupEventListeners();
@@ -409,20 +547,35 @@ class ScannerPage {
             window.sharedUtils?.hideError();
             this.hideProductResult();
 
-            const response = await window.sharedUtils?.apiCall(`/api/price/${encodeURIComponent(barcode)}`);
+            // Answer from the handheld's copy of the catalog when we have it
+            const localProduct = await this.offlineCatalog?.lookup(barcode);
+            if (localProduct) {
+                this.displayProduct(localProduct);
+                return;
+            }
+
+            let result;
+            try {
+                result = await this.scanChannel.lookup(barcode);
+            } catch (error) {
+                // Network down and not in the offline copy
+                if (this.offlineCatalog?.isReady()) {
+                    throw new Error('المنتج غير موجود في النسخة المحفوظة ولا يوجد اتصال بالخادم');
+                }
+                throw error;
+            }
             
-            if (!response) return;
+            if (!result) return;
             
-            if (!response.ok) {
-                if (response.status === 404) {
+            if (result.status !== 200) {
+                if (result.status === 404) {
                     throw new Error('المنتج غير موجود');
                 } else {
-                    throw new Error(`خطأ في الخادم: ${response.status}`);
+                    throw new Error(`خطأ في الخادم: ${result.status}`);
                 }
             }
 
-            const product = await response.json();
-            this.displayProduct(product);
+            this.displayProduct(result.product);
 
         } catch (error) {
             console.error('Search error:', error);
@@ -0,0 +1,98 @@
+"""
+Offline catalog export across a server restart
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog as catalog_module
+from catalog import ProductCatalog
+from catalog_snapshot import CatalogSnapshot, write_snapshot
+from database import STOCK_TABLE, STOCK_ID_COLUMN, STOCK_PRODUCT_ID_COLUMN, STOCK_QUANTITY_COLUMN
+
+ROWS = [
+    ("1001", 1, "Rice 1kg", 2.5, "1001", 10),
+    ("1002", 2, "Sugar 1kg", 1.25, "1002", 4),
+    ("1003", 3, "Tea 250g", 3.0, "1003", 0),
+]
+
+@pytest.fixture
+def stock_db(monkeypatch):
+    """An empty stock table the catalog refreshes from"""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    schema, _, table = STOCK_TABLE.rpartition(".")
+    if schema:
+        conn.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+    conn.execute(f"CREATE TABLE {STOCK_TABLE} ({STOCK_ID_COLUMN} INTEGER PRIMARY KEY, "
+                 f"{STOCK_PRODUCT_ID_COLUMN} INTEGER, {STOCK_QUANTITY_COLUMN} REAL)")
+
+    @contextmanager
+    def db_connection():
+        yield conn
+
+    monkeypatch.setattr(catalog_module, "db_connection", db_connection)
+    yield conn
+    conn.close()
+
+def change_stock(catalog, conn, product_id, qty):
+    """Append a stock row and let the catalog pick it up, as the refresher would"""
+    conn.execute(f"INSERT INTO {STOCK_TABLE} ({STOCK_PRODUCT_ID_COLUMN}, {STOCK_QUANTITY_COLUMN}) VALUES (?, ?)",
+                 (product_id, qty))
+    catalog.refresh_stock()
+
+def start_process(path):
+    """A catalog as a freshly started server builds it: restored from the snapshot file"""
+    catalog = ProductCatalog()
+    catalog.attach_snapshot(CatalogSnapshot(path))
+    catalog.load_snapshot()
+    return catalog
+
+def test_delta_within_same_epoch(tmp_path, stock_db):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, ROWS, 0, None)
+    catalog = start_process(path)
+
+    first = catalog.export()
+    change_stock(catalog, stock_db, 2, 5)
+    delta = catalog.export(first["version"], first["epoch"])
+
+    assert first["full"]
+    assert not delta["full"]
+    assert [row[0] for row in delta["products"]] == ["1002"]
+
+def test_restart_forces_full_export(tmp_path, stock_db):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, ROWS, 0, None)
+
+    # Old process: the client syncs at version 3
+    old = start_process(path)
+    change_stock(old, stock_db, 1, 9)
+    change_stock(old, stock_db, 3, 2)
+    client = old.export()
+    assert client["version"] == 3
+
+    # New process: version numbering restarts, and the price changed while the server was down
+    rows = [("1001", 1, "Rice 1kg", 2.75, "1001", 9), ROWS[1], ("1003", 3, "Tea 250g", 3.0, "1003", 2)]
+    write_snapshot(path, rows, old.stock_watermark, None)
+    new = start_process(path)
+    change_stock(new, stock_db, 2, 5)
+    change_stock(new, stock_db, 3, 1)
+    assert new.base_version <= client["version"] <= new.version  # A bare version would look like a valid delta
+
+    export = new.export(client["version"], client["epoch"])
+    assert export["full"]
+    assert export["epoch"] != client["epoch"]
+    assert ["1001", "Rice 1kg", 2.75, 9] in [row[:4] for row in export["products"]]
+
+def test_missing_epoch_gets_full_export(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, ROWS, 0, None)
+    catalog = start_process(path)
+
+    assert catalog.export(catalog.version).get("full")
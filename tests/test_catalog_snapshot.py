@@ -0,0 +1,90 @@
+"""
+Catalog snapshot: corruption and schema checks, exact price round-trip
+Run with: python -m pytest tests
+"""
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_snapshot
+from catalog_snapshot import CatalogSnapshot, SnapshotError, open_snapshot, write_snapshot
+
+ROWS = [
+    ("6281000001", 1, "Milk", Decimal("12.50"), "6281000001", Decimal("3.000")),
+    ("6281000002", 2, "Bread", 4.25, "6281000002", 7),
+    ("6281000003", 3, "Water", 2, "6281000003", None),
+    ("6281000004", 4, "Gift card", None, "6281000004", 1.5),
+]
+
+def write(tmp_path, rows=ROWS):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, rows, stock_watermark=b"\x00\x00\x00\x01", product_watermark=42)
+    return path
+
+def test_rows_round_trip_with_their_types(tmp_path):
+    snapshot = CatalogSnapshot(write(tmp_path))
+    try:
+        rows = sorted(snapshot.rows())
+        assert rows == ROWS
+        assert [tuple(type(value) for value in row) for row in rows] == \
+            [tuple(type(value) for value in row) for row in ROWS]
+        assert snapshot.count == len(ROWS)
+        assert snapshot.stock_watermark == b"\x00\x00\x00\x01"
+        assert snapshot.product_watermark == 42
+    finally:
+        snapshot.close()
+
+def test_get_finds_products_by_barcode(tmp_path):
+    snapshot = CatalogSnapshot(write(tmp_path))
+    try:
+        assert snapshot.get("6281000001") is not None
+        assert snapshot.get("0000000000") is None
+    finally:
+        snapshot.close()
+
+def test_flipped_byte_fails_the_checksum(tmp_path):
+    path = write(tmp_path)
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    with pytest.raises(SnapshotError, match="checksum"):
+        CatalogSnapshot(path)
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = write(tmp_path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    with pytest.raises(SnapshotError):
+        CatalogSnapshot(path)
+
+def test_other_schema_is_rejected(tmp_path, monkeypatch):
+    path = write(tmp_path)
+    monkeypatch.setattr(catalog_snapshot, "schema_fingerprint", lambda: "0" * 16)
+
+    with pytest.raises(SnapshotError, match="schema"):
+        CatalogSnapshot(path)
+
+def test_old_snapshot_is_rejected(tmp_path):
+    path = write(tmp_path)
+    with pytest.raises(SnapshotError, match="older"):
+        CatalogSnapshot(path, max_age=1e-9)
+
+@pytest.mark.parametrize("content", [b"", b"PSCATSNP", b"not a snapshot at all, just text"])
+def test_open_snapshot_ignores_and_removes_bad_files(tmp_path, content):
+    path = str(tmp_path / "catalog.snapshot")
+    with open(path, "wb") as f:
+        f.write(content)
+
+    assert open_snapshot(path) is None
+    assert not os.path.exists(path)
+
+def test_open_snapshot_without_a_file(tmp_path):
+    assert open_snapshot(str(tmp_path / "missing.snapshot")) is None
@@ -0,0 +1,108 @@
+"""
+Connection pool: exhaustion, pre-ping and max-age recycling
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool, PoolTimeout
+
+def make_pool(**options):
+    opened = []
+
+    def connect():
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        opened.append(conn)
+        return conn
+
+    options.setdefault("min_size", 0)
+    options.setdefault("max_size", 2)
+    options.setdefault("timeout", 0.1)
+    options.setdefault("max_age", 0)
+    options.setdefault("pre_ping", False)
+    return ConnectionPool(connect=connect, **options), opened
+
+def test_exhausted_pool_times_out():
+    pool, opened = make_pool()
+    first = pool.acquire()
+    second = pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    stats = pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["timeouts"] == 1
+    assert len(opened) == 2
+    pool.release(first)
+    pool.release(second)
+
+def test_waiter_gets_released_connection():
+    pool, opened = make_pool(max_size=1, timeout=5)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(held)
+    waiter.join(timeout=5)
+
+    assert got and got[0].conn is held.conn
+    assert len(opened) == 1
+    assert pool.stats()["waits"] == 1
+
+def test_idle_connection_is_reused():
+    pool, opened = make_pool()
+    with pool.connection() as conn:
+        first = conn
+    with pool.connection() as conn:
+        assert conn is first
+    assert pool.stats()["created"] == 1
+
+def test_pre_ping_replaces_dead_connection():
+    pool, opened = make_pool(pre_ping=True, ping_after=0)
+    entry = pool.acquire()
+    pool.release(entry)
+    entry.conn.close()  # Dies while idle, e.g. the server dropped it
+
+    with pool.connection() as conn:
+        assert conn is not opened[0]
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+    stats = pool.stats()
+    assert stats["ping_failures"] == 1
+    assert stats["recycled"] == 1
+    assert stats["size"] == 1
+
+def test_max_age_recycles_old_connections():
+    pool, opened = make_pool(max_age=0.05)
+    with pool.connection():
+        pass
+    time.sleep(0.1)
+
+    with pool.connection() as conn:
+        assert conn is opened[1]
+    assert pool.stats()["recycled"] >= 1
+
+def test_expired_connection_is_closed_on_release():
+    pool, opened = make_pool(max_age=0.05)
+    entry = pool.acquire()
+    time.sleep(0.1)
+    pool.release(entry)
+
+    assert pool.stats()["size"] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+
+def test_closed_pool_refuses_borrows():
+    pool, _ = make_pool()
+    pool.close()
+    with pytest.raises(Exception):
+        pool.acquire()
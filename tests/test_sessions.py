@@ -0,0 +1,119 @@
+"""
+Server-side sessions: persistence, revocation and cookie rotation
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from sessions import SessionStore, ServerSessionMiddleware
+
+def restart(store):
+    """Flush the store and open its database again, as a restarted server would"""
+    store.close()
+    return SessionStore(db_path=store.db_path)
+
+def test_session_survives_restart(tmp_path):
+    store = SessionStore(db_path=str(tmp_path / "sessions.db"))
+    store.save("abc", {"authenticated": True, "username": "ali"})
+
+    store = restart(store)
+    data, _ = store.load("abc")
+    assert data == {"authenticated": True, "username": "ali"}
+    assert store.stats()["restored"] == 1
+    store.close()
+
+def test_revoke_user_ends_memory_and_persisted_sessions(tmp_path):
+    store = SessionStore(db_path=str(tmp_path / "sessions.db"))
+    store.save("phone", {"username": "ali"})
+    store.save("desk", {"username": "ali"})
+    store.save("other", {"username": "sara"})
+
+    store = restart(store)  # Ali's sessions are now only on disk
+    store.save("tablet", {"username": "ali"})
+    assert store.revoke_user("ali") == 3
+
+    assert store.load("phone") == (None, False)
+    assert store.load("tablet") == (None, False)
+    store = restart(store)
+    assert store.load("desk") == (None, False)
+    assert store.load("other")[0] == {"username": "sara"}
+    store.close()
+
+def test_revoke_all(tmp_path):
+    store = SessionStore(db_path=str(tmp_path / "sessions.db"))
+    store.save("a", {"username": "ali"})
+    store.save("b", {"username": "sara"})
+    store.revoke_all()
+
+    assert store.load("a") == (None, False)
+    store = restart(store)
+    assert store.load("b") == (None, False)
+    store.close()
+
+def test_idle_session_expires():
+    store = SessionStore(max_age=0.05)
+    store.save("abc", {"username": "ali"})
+    time.sleep(0.1)
+    assert store.load("abc") == (None, False)
+    assert store.stats()["expired"] == 1
+
+def make_client(store):
+    async def login(request):
+        request.session.update({"authenticated": True, "username": request.query_params["user"]})
+        return JSONResponse({})
+
+    async def logout(request):
+        request.session.clear()
+        return JSONResponse({})
+
+    async def whoami(request):
+        return JSONResponse({"username": request.session.get("username")})
+
+    app = Starlette(routes=[
+        Route("/login", login, methods=["POST"]),
+        Route("/logout", logout, methods=["POST"]),
+        Route("/whoami", whoami),
+    ])
+    app.add_middleware(ServerSessionMiddleware, store=store)
+    return TestClient(app)
+
+def test_login_as_another_user_rotates_the_session_id():
+    store = SessionStore()
+    client = make_client(store)
+
+    client.post("/login?user=ali")
+    first = client.cookies.get("session")
+    client.post("/login?user=sara")
+    second = client.cookies.get("session")
+
+    assert first and second and first != second
+    assert store.load(first) == (None, False)  # The old id can't be replayed
+    assert client.get("/whoami").json() == {"username": "sara"}
+
+def test_logout_clears_cookie_and_session():
+    store = SessionStore()
+    client = make_client(store)
+    client.post("/login?user=ali")
+    session_id = client.cookies.get("session")
+
+    response = client.post("/logout")
+    assert "expires=Thu, 01 Jan 1970" in response.headers["set-cookie"]
+    assert store.load(session_id) == (None, False)
+
+def test_revoked_session_is_signed_out():
+    store = SessionStore()
+    client = make_client(store)
+    client.post("/login?user=ali")
+
+    store.revoke_user("ali")
+    response = client.get("/whoami")
+    assert response.json() == {"username": None}
+    assert "expires=Thu, 01 Jan 1970" in response.headers["set-cookie"]
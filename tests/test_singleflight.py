@@ -0,0 +1,100 @@
+"""
+Single-flight coalescing: shared calls, shared errors, cancellation
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight
+
+class Lookup:
+    """Counts calls and blocks until released, so callers overlap"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight("test")
+        lookup = Lookup(result={"price": 2.5})
+        waiters = [asyncio.ensure_future(flight.do("6281000001", lookup)) for _ in range(5)]
+        await asyncio.sleep(0)
+        lookup.release.set()
+        results = await asyncio.gather(*waiters)
+        return flight, lookup, results
+
+    flight, lookup, results = asyncio.run(scenario())
+    assert lookup.calls == 1
+    assert results == [{"price": 2.5}] * 5
+    assert flight.stats() == {"calls": 1, "shared": 4, "in_flight": 0}
+
+def test_error_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight("test")
+        lookup = Lookup(error=ConnectionError("database down"))
+        waiters = [asyncio.ensure_future(flight.do("6281000001", lookup)) for _ in range(3)]
+        await asyncio.sleep(0)
+        lookup.release.set()
+        return lookup, await asyncio.gather(*waiters, return_exceptions=True)
+
+    lookup, outcomes = asyncio.run(scenario())
+    assert lookup.calls == 1
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+
+def test_failed_call_is_not_cached():
+    async def scenario():
+        flight = SingleFlight("test")
+        failing = Lookup(error=ConnectionError("database down"))
+        failing.release.set()
+        with pytest.raises(ConnectionError):
+            await flight.do("6281000001", failing)
+        working = Lookup(result="ok")
+        working.release.set()
+        return await flight.do("6281000001", working)
+
+    assert asyncio.run(scenario()) == "ok"
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight("test")
+        first, second = Lookup(result=1), Lookup(result=2)
+        waiters = [asyncio.ensure_future(flight.do("a", first)), asyncio.ensure_future(flight.do("b", second))]
+        await asyncio.sleep(0)
+        first.release.set()
+        second.release.set()
+        return await asyncio.gather(*waiters), first.calls + second.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [1, 2]
+    assert calls == 2
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        lookup = Lookup(result="ok")
+        leaving = asyncio.ensure_future(flight.do("6281000001", lookup))
+        staying = asyncio.ensure_future(flight.do("6281000001", lookup))
+        await asyncio.sleep(0)
+        leaving.cancel()  # e.g. the scanning client disconnected
+        await asyncio.sleep(0)
+        lookup.release.set()
+        return leaving, await staying
+
+    leaving, result = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert result == "ok"
@@ -0,0 +1,232 @@
+"""
+Streaming PDF upload receiver
+Parses multipart bodies as they arrive, writes the file part to disk in
+chunks off the event loop, enforces a size cap and hashes while streaming
+so identical re-uploads reuse the file already on disk.
+"""
+import os
+import re
+import uuid
+import hashlib
+from datetime import datetime
+from dotenv import load_dotenv
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
+from executors import run_io, ExecutorBusy
+from caches import TTLCache
+from app_logging import get_logger
+
+# Load environment variables
+load_dotenv()
+
+log = get_logger("uploads")
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+UPLOAD_DEDUP_WINDOW = float(os.getenv("UPLOAD_DEDUP_WINDOW", 600))  # Seconds a re-upload is treated as a retry
+UPLOAD_DIGEST_CACHE_SIZE = int(os.getenv("UPLOAD_DIGEST_CACHE_SIZE", 1000))  # Newest stored uploads checked for duplicates
+UPLOAD_FIELD = "file"
+MULTIPART_OVERHEAD = 16 * 1024  # Allowance for boundaries and part headers in Content-Length
+STORED_NAME = re.compile(r"Invoice_Uploaded_\d{8}_\d{6}_([0-9a-f]{64})\.pdf")
+
+class UploadRejected(Exception):
+    """The request isn't a usable PDF upload"""
+
+class UploadTooLarge(UploadRejected):
+    """The upload exceeds MAX_UPLOAD_BYTES"""
+
+class StoredUpload:
+    """Where an upload ended up and whether it was already on disk"""
+
+    def __init__(self, path, digest, size, duplicate):
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.duplicate = duplicate
+
+class _FilePartReader:
+    """MultipartParser callbacks that pick out the PDF part and hash it"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.filename = None
+        self.found = False
+        self.pending = []  # File bytes parsed but not yet written
+
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._in_file = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._in_file = False
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != UPLOAD_FIELD.encode() or b"filename" not in options or self.found:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        if not filename.lower().endswith(".pdf"):
+            raise UploadRejected("Only PDF files are allowed")
+        self.filename = filename
+        self.found = True
+        self._in_file = True
+
+    def on_part_data(self, data, start, end):
+        if not self._in_file:
+            return
+        chunk = data[start:end]
+        if self.size == 0 and chunk and not chunk.startswith(b"%PDF-"[:len(chunk)]):
+            raise UploadRejected("Only PDF files are allowed")
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds {self.max_bytes} bytes")
+        self.hasher.update(chunk)
+        self.pending.append(chunk)
+
+    def on_part_end(self):
+        self._in_file = False
+
+def _write_chunks(handle, chunks):
+    handle.write(b"".join(chunks))
+
+def _close_and_remove(handle, path):
+    handle.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+async def _discard(handle, path):
+    """Close and delete a partial upload, on this thread if the io executor is full"""
+    try:
+        await run_io(_close_and_remove, handle, path)
+    except ExecutorBusy:
+        _close_and_remove(handle, path)
+
+class PdfUploadStore:
+    """Receives PDF uploads into a directory, de-duplicating by SHA-256"""
+
+    def __init__(self, directory, max_bytes=MAX_UPLOAD_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # digest -> path of the newest stored uploads; filled from one directory listing on first use
+        self._by_digest = TTLCache(UPLOAD_DIGEST_CACHE_SIZE, float("inf"))
+        self._seeded = False
+
+        # Stats
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.bytes_written = 0
+
+    def _seed(self):
+        """Remember the newest uploads already on disk (names sort by their timestamp)"""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if STORED_NAME.fullmatch(name))
+        except OSError:
+            names = []
+        for name in names[-UPLOAD_DIGEST_CACHE_SIZE:]:
+            self._by_digest.set(STORED_NAME.fullmatch(name).group(1), os.path.join(self.directory, name))
+        self._seeded = True
+
+    def _find_existing(self, digest):
+        """Path of a stored upload with this digest, if it is still on disk"""
+        if not self._seeded:
+            self._seed()
+        path = self._by_digest.get(digest)
+        if path and os.path.exists(path):
+            return path
+        return None
+
+    async def receive(self, request):
+        """Stream the request's PDF part to disk and return a StoredUpload"""
+        try:
+            return await self._receive(request)
+        except UploadRejected:
+            self.rejected += 1
+            raise
+
+    async def _receive(self, request):
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadRejected("Expected multipart/form-data")
+
+        # Reject oversized bodies before reading any of them
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes + MULTIPART_OVERHEAD:
+            raise UploadTooLarge(f"File exceeds {self.max_bytes} bytes")
+
+        await run_io(os.makedirs, self.directory, exist_ok=True)
+        temp_path = os.path.join(self.directory, f".upload_{uuid.uuid4().hex}.part")
+        reader = _FilePartReader(self.max_bytes)
+        parser = MultipartParser(options[b"boundary"], reader.callbacks())
+        handle = await run_io(open, temp_path, "wb")
+        try:
+            try:
+                async for chunk in request.stream():
+                    parser.write(chunk)
+                    if reader.pending:
+                        await run_io(_write_chunks, handle, reader.pending)
+                        reader.pending = []
+                parser.finalize()
+            except MultipartParseError as e:
+                raise UploadRejected(f"Malformed upload: {e}")
+            finally:
+                await run_io(handle.close)
+
+            if not reader.found or reader.size == 0:
+                raise UploadRejected("No PDF file in upload")
+
+            digest = reader.hasher.hexdigest()
+            existing = await run_io(self._find_existing, digest)
+            self.received += 1
+            if existing:
+                self.duplicates += 1
+                await _discard(handle, temp_path)
+                log.info("Duplicate upload, reusing stored file", path=existing, bytes=reader.size)
+                return StoredUpload(existing, digest, reader.size, duplicate=True)
+
+            path = os.path.join(self.directory, f"Invoice_Uploaded_{datetime.now():%Y%m%d_%H%M%S}_{digest}.pdf")
+            await run_io(os.replace, temp_path, path)
+            self._by_digest.set(digest, path)
+            self.bytes_written += reader.size
+            return StoredUpload(path, digest, reader.size, duplicate=False)
+        except BaseException:
+            # Size cap, non-PDF content, malformed body, client disconnect
+            await _discard(handle, temp_path)
+            raise
+
+    def stats(self):
+        return {
+            "max_bytes": self.max_bytes,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "bytes_written": self.bytes_written,
+            "digests": self._by_digest.stats(),
+        }